@@ -1,17 +1,79 @@
-from fastapi import Request, HTTPException, status
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import HTTPException, status
 from jose import jwt, JWTError
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+
 from config import SECRET_KEY, ALGORITHM
+from database import SessionLocal
+from models.user import User
+from services.cache import principal_cache
+
+
+@dataclass(frozen=True)
+class Principal:
+    # The authenticated user as handlers need it; detached from any session so it can be cached
+    id: uuid.UUID
+    email: str
+
+
+def _not_authenticated() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+
+def _load_principal(payload: dict) -> Principal | None:
+    # Tokens issued before the uid claim existed still resolve, by email
+    with SessionLocal() as db:
+        query = db.query(User.id, User.email)
+        uid = payload.get("uid")
+        row = query.filter(User.id == uuid.UUID(uid)).first() if uid else query.filter(User.email == payload.get("sub")).first()
+    return Principal(id=row.id, email=row.email) if row else None
+
 
-async def get_current_user(request: Request) -> str:
+async def get_current_principal(request: HTTPConnection) -> Principal:
+    # HTTPConnection rather than Request so the chat WebSocket authenticates the same way
     token = request.cookies.get("access_token")
     if not token:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    
+        raise _not_authenticated()
+
+    cached = principal_cache.get(token)
+    if cached is not None:
+        principal, expires_at = cached
+        if expires_at > time.time():
+            return principal
+        principal_cache.invalidate(token)
+        raise _not_authenticated()
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-        if not user_email:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-        return user_email
     except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        raise _not_authenticated()
+    if not payload.get("sub"):
+        raise _not_authenticated()
+
+    # One lookup per token per cache TTL confirms the user still exists and picks up email changes
+    try:
+        principal = await run_in_threadpool(_load_principal, payload)
+    except ValueError:
+        raise _not_authenticated()  # malformed uid claim
+    if principal is None:
+        raise _not_authenticated()
+
+    principal_cache.set(token, (principal, payload.get("exp", float("inf"))))
+    return principal
+
+
+def invalidate_principal(user_id: uuid.UUID) -> None:
+    principal_cache.invalidate_where(lambda _, value: value[0].id == user_id)
+
+
+# Drop cached principals whenever a user row changes through the ORM in this worker;
+# other workers catch up within PRINCIPAL_CACHE_TTL_SECONDS
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target) -> None:
+    invalidate_principal(target.id)
@@ -0,0 +1,41 @@
+import uuid
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from auth.auth import Principal, get_current_principal
+from database import get_db
+from models.project import Project
+from models.prompt import Prompt
+
+# Access checks resolve in one query and hand back the loaded rows. FastAPI caches dependencies per
+# request, so the handler gets the same Session: its identity map already holds these objects and
+# db.get() on them never goes back to the database.
+
+
+def load_owned_project(db: Session, project_id: uuid.UUID, user: Principal) -> Project:
+    # Someone else's project is reported as missing, so ids reveal nothing about other users
+    project = db.query(Project).filter(Project.id == project_id, Project.owner_id == user.id).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    return project
+
+
+def load_owned_prompt(db: Session, prompt_id: uuid.UUID, user: Principal) -> tuple[Prompt, Project]:
+    row = (
+        db.query(Prompt, Project)
+        .join(Project, Prompt.project_id == Project.id)
+        .filter(Prompt.id == prompt_id, Project.owner_id == user.id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
+    return row[0], row[1]
+
+
+def owned_project(project_id: uuid.UUID, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)) -> Project:
+    return load_owned_project(db, project_id, user)
+
+
+def owned_prompt(prompt_id: uuid.UUID, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)) -> tuple[Prompt, Project]:
+    return load_owned_prompt(db, prompt_id, user)
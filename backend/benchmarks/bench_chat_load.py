@@ -0,0 +1,104 @@
+"""Whole-backend chat load against the built-in fake provider: no network, no bill.
+
+Starts the API under uvicorn with LLM_PROVIDER=fake, signs up one user per
+simulated client and has every client send chat turns over SSE at the same
+time, each in its own project. Reports turns/s, time to first delta and
+full-turn latency: the capacity of the backend itself (auth, context
+assembly, DB writes, streaming) with the provider's timing held fixed.
+Rate limits are off unless set in the environment. Needs a Postgres URL;
+the schema is migrated on startup.
+
+Sign-up (bcrypt, slow on purpose) is done before the clock starts. The
+clients run on the same host as the server and take a good share of its
+CPU; on a host with few cores the figures are a floor, and --workers
+should match the cores.
+
+    cd backend && python -m benchmarks.bench_chat_load --url postgresql://... --clients 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+PORT = 8765
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)]
+
+
+async def sign_up(client: httpx.AsyncClient, index: int) -> str:
+    email, password = f"load-{uuid.uuid4().hex[:12]}@example.com", "load-test"
+    await client.post("/api/users/", json={"email": email, "password": password})
+    login = await client.post("/api/login/", json={"email": email, "password": password})
+    # The cookie is Secure, so httpx would not send it back over plain http
+    client.cookies.set("access_token", login.cookies["access_token"])
+    project = await client.post("/api/projects/", json={"name": f"load {index} {uuid.uuid4().hex[:8]}"})  # names are unique
+    return project.json()["id"]
+
+
+async def chat(client: httpx.AsyncClient, project_id: str, index: int, turns: int, results: list, errors: list) -> None:
+    for turn in range(turns):
+        # Distinct content per turn, so neither the response cache nor coalescing kicks in
+        start = time.perf_counter()
+        ttft = None
+        async with client.stream("GET", f"/api/projects/{project_id}/messages/stream", params={"content": f"client {index} turn {turn}"}) as response:
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("data:"):
+                    ttft = time.perf_counter() - start
+        results.append((ttft if ttft is not None else float("nan"), time.perf_counter() - start))
+
+
+async def run(base: str, clients: int, turns: int) -> None:
+    results, errors = [], []
+    sessions = [httpx.AsyncClient(base_url=base, timeout=120) for _ in range(clients)]
+    try:
+        # Untimed: 50 bcrypt sign-ups would otherwise dominate the wall clock
+        projects = await asyncio.gather(*(sign_up(client, i) for i, client in enumerate(sessions)))
+        start = time.perf_counter()
+        await asyncio.gather(*(chat(client, project_id, i, turns, results, errors) for i, (client, project_id) in enumerate(zip(sessions, projects))))
+        wall = time.perf_counter() - start
+    finally:
+        for client in sessions:
+            await client.aclose()
+
+    ttfts = [t for t, _ in results if t == t]
+    totals = [d for _, d in results]
+    print(f"clients {clients}  turns {len(results)}  errors {len(errors)}  wall {wall:.1f}s  {len(results) / wall:.1f} turns/s")
+    if results:
+        print(f"ttft   p50 {statistics.median(ttfts) * 1000:8.0f} ms  p95 {percentile(ttfts, 0.95) * 1000:8.0f} ms")
+        print(f"turn   p50 {statistics.median(totals) * 1000:8.0f} ms  p95 {percentile(totals, 0.95) * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    if not args.url:
+        sys.exit("pass --url or set DATABASE_URL")
+
+    env = dict(os.environ, DATABASE_URL=args.url, LLM_PROVIDER="fake")
+    for limit in ("LLM_GLOBAL_RPM", "LLM_GLOBAL_TPM", "LLM_USER_RPM", "LLM_USER_TPM"):
+        env.setdefault(limit, "0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        time.sleep(3)
+        asyncio.run(run(f"http://127.0.0.1:{PORT}", args.clients, args.turns))
+    finally:
+        server.terminate()
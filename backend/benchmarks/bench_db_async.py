@@ -0,0 +1,124 @@
+"""Read throughput of the sync (threadpool) vs async SQLAlchemy paths.
+
+Runs the same read queries the API serves (ownership check + latest message page)
+from C concurrent tasks, once through sync sessions in the threadpool and once
+through AsyncSession. SQLite is the default stand-in; pass --url to point at a
+local Postgres.
+
+    cd backend && python -m benchmarks.bench_db_async --concurrency 200
+    python -m benchmarks.bench_db_async --url postgresql://... --delay-ms 10
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/bench_db_async.db")
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+import anyio.to_thread  # noqa: E402
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, MESSAGES_PAGE_DEFAULT  # noqa: E402
+from database import Base, async_database_url  # noqa: E402
+from models.user import User  # noqa: E402
+from models.project import Project  # noqa: E402
+from models.prompt import Prompt, PromptRun  # noqa: E402
+from services import queries  # noqa: E402
+from services.messages import message_page_query  # noqa: E402
+
+EMAIL = "bench@example.com"
+
+
+def seed(url: str, runs: int) -> uuid.UUID:
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        user = User(email=EMAIL, hashed_password="x")
+        db.add(user)
+        db.flush()
+        project = Project(name="bench", owner_id=user.id)
+        db.add(project)
+        db.flush()
+        prompt = Prompt(id=uuid.uuid4(), project_id=project.id, name="bench", content="hi")
+        db.add(prompt)
+        db.add_all(
+            PromptRun(prompt_id=prompt.id, project_id=project.id, user_id=user.id, input_data=f"q{i}", output_data=f"a{i}", status="completed")
+            for i in range(runs)
+        )
+        db.commit()
+        project_id = project.id
+    engine.dispose()
+    return project_id
+
+
+# Postgres only: SELECT pg_sleep per request to stand in for the network round-trips of a hosted database
+DELAY_SECONDS = 0.0
+
+
+def sync_request(engine, project_id):
+    # Mirrors the sync GET /projects/{id}/messages handler: one threadpool hop per request
+    with Session(engine) as db:
+        if DELAY_SECONDS:
+            db.execute(text("SELECT pg_sleep(:s)"), {"s": DELAY_SECONDS})
+        project = db.query(Project).filter(Project.id == project_id).first()
+        assert project is not None
+        db.execute(message_page_query(project_id, MESSAGES_PAGE_DEFAULT)).all()
+
+
+async def async_request(engine, project_id):
+    # Mirrors routes/async_reads.get_project_messages
+    async with AsyncSession(engine) as db:
+        if DELAY_SECONDS:
+            await db.execute(text("SELECT pg_sleep(:s)"), {"s": DELAY_SECONDS})
+        project = await queries.get_project(db, project_id)
+        assert project is not None
+        (await db.execute(message_page_query(project_id, MESSAGES_PAGE_DEFAULT))).all()
+
+
+async def run(handle, concurrency: int, requests: int) -> float:
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await handle()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def main(url: str, concurrency: int, requests: int, runs: int) -> None:
+    project_id = seed(url, runs)
+    # Same pool limits as the app, so both paths compete for the same number of connections
+    pool = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    sync_engine = create_engine(url, **pool)
+    async_engine = create_async_engine(async_database_url(url), **pool)
+
+    sync_rps = await run(lambda: anyio.to_thread.run_sync(sync_request, sync_engine, project_id), concurrency, requests)
+    async_rps = await run(lambda: async_request(async_engine, project_id), concurrency, requests)
+
+    print(f"url={url} concurrency={concurrency} requests={requests} runs/project={runs} delay={DELAY_SECONDS * 1000:.0f}ms")
+    threads = anyio.to_thread.current_default_thread_limiter().total_tokens
+    print(f"sync  (threadpool, {threads:.0f} threads): {sync_rps:8.1f} req/s")
+    print(f"async (AsyncSession):         {async_rps:8.1f} req/s")
+    await async_engine.dispose()
+    sync_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.environ["DATABASE_URL"])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="simulated DB round-trip per request (Postgres only)")
+    args = parser.parse_args()
+    DELAY_SECONDS = args.delay_ms / 1000
+    asyncio.run(main(args.url, args.concurrency, args.requests, args.runs))
@@ -0,0 +1,113 @@
+"""Provider brownout: outcomes and latency with deadlines, retries and the circuit breaker.
+
+Starts the local fake provider with injected errors and stalls, then sends
+requests through llm_client the way the API does: blocking completions from a
+thread pool and streams from one event loop.
+
+    cd backend && python -m benchmarks.bench_resilience --error-rate 0.3 --stall-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+PORT = 8999
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["LLM_PROVIDER"] = "openai"  # the real client, pointed at the fake server
+# Measure the resilience layer, not the rate limiter
+for limit in ("LLM_GLOBAL_RPM", "LLM_GLOBAL_TPM"):
+    os.environ.setdefault(limit, "0")
+os.environ.setdefault("LLM_TIMEOUT_SECONDS", "10")
+os.environ.setdefault("LLM_STREAM_TTFT_SECONDS", "2")
+os.environ.setdefault("CIRCUIT_COOLDOWN_SECONDS", "2")  # short, so one run shows open, probe and recovery
+
+from llm_client import chat_completion, stream_chat_completion  # noqa: E402
+from services.resilience import ProviderUnavailable, provider_breaker  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "benchmark"}]
+
+
+def outcome(e: Exception | None) -> str:
+    if e is None:
+        return "ok"
+    if isinstance(e, ProviderUnavailable):
+        return "fast-fail"
+    return type(e).__name__
+
+
+def timed_completion(start_at: float) -> tuple[str, float]:
+    time.sleep(max(0.0, start_at - time.perf_counter()))
+    start = time.perf_counter()
+    try:
+        chat_completion(MESSAGES)
+        error = None
+    except Exception as e:
+        error = e
+    return outcome(error), time.perf_counter() - start
+
+
+async def timed_stream(start_at: float) -> tuple[str, float]:
+    await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+    start = time.perf_counter()
+    try:
+        async for _ in stream_chat_completion(MESSAGES):
+            pass
+        error = None
+    except Exception as e:
+        error = e
+    return outcome(error), time.perf_counter() - start
+
+
+def report(mode: str, results: list[tuple[str, float]]) -> None:
+    by_outcome = defaultdict(list)
+    for name, seconds in results:
+        by_outcome[name].append(seconds)
+    for name, times in sorted(by_outcome.items()):
+        times.sort()
+        p95 = times[max(0, int(len(times) * 0.95) - 1)]
+        print(f"{mode:<7} {name:<22} {len(times):>6} {statistics.median(times) * 1000:>10.1f} {p95 * 1000:>10.1f}")
+
+
+def arrivals(n: int, rate: float) -> list[float]:
+    # Requests arrive at a steady rate, so a run spans the breaker opening, probing and closing
+    start = time.perf_counter()
+    return [start + i / rate for i in range(n)]
+
+
+async def run_streams(n: int, rate: float) -> list[tuple[str, float]]:
+    return await asyncio.gather(*(timed_stream(at) for at in arrivals(n, rate)))
+
+
+def main(requests: int, rate: float) -> None:
+    print(f"{'mode':<7} {'outcome':<22} {'count':>6} {'p50 ms':>10} {'p95 ms':>10}")
+    with ThreadPoolExecutor(200) as pool:
+        report("blocking", list(pool.map(timed_completion, arrivals(requests, rate))))
+    print("breaker", provider_breaker.stats())
+    report("stream", asyncio.run(run_streams(requests, rate)))
+    print("breaker", provider_breaker.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="requests started per second")
+    parser.add_argument("--error-rate", default="0.3")
+    parser.add_argument("--stall-rate", default="0.05")
+    parser.add_argument("--jitter-ms", default="100")
+    args = parser.parse_args()
+
+    env = dict(os.environ, FAKE_ERROR_RATE=args.error_rate, FAKE_STALL_RATE=args.stall_rate, FAKE_JITTER_MS=args.jitter_ms,
+               FAKE_TTFT_MS="50", FAKE_COMPLETION_TOKENS="20", FAKE_TOKENS_PER_SEC="500")
+    # Separate process so the fake provider does not share the GIL with the client under test
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(PORT)], env=env)
+    try:
+        time.sleep(2)
+        main(args.requests, args.rate)
+    finally:
+        server.terminate()
@@ -0,0 +1,96 @@
+"""SSE framing cost per stream: one frame per token vs coalesced frames.
+
+Streams N concurrent replies from the local fake provider through the SSE
+framing and counts what would be written to the socket: frames, frames/s,
+bytes on the wire (with HTTP chunked-encoding overhead) and process CPU
+per stream. "legacy" is the old generator (json.dumps of a dict per token),
+"per-token" the pre-encoded frames without coalescing, "coalesced" the
+configured SSE_COALESCE_* defaults.
+
+    cd backend && python -m benchmarks.bench_sse_frames
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+PORT = 8999
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["LLM_PROVIDER"] = "openai"  # the real client, pointed at the fake server
+# Measure the framing, not the rate limiter
+for limit in ("LLM_GLOBAL_RPM", "LLM_GLOBAL_TPM"):
+    os.environ.setdefault(limit, "0")
+
+from llm_client import stream_chat_completion  # noqa: E402
+from services.sse import delta_frames  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "benchmark"}]
+
+
+async def legacy_frames(run_id, deltas):
+    async for content_piece in deltas:
+        payload = {"role": "assistant", "delta": content_piece}
+        yield f"data: {json.dumps(payload)}\n\n"
+
+
+def wire_bytes(frame) -> int:
+    # Starlette encodes str frames; each write is one HTTP/1.1 chunk: "<hex len>\r\n<data>\r\n"
+    size = len(frame.encode() if isinstance(frame, str) else frame)
+    return size + len(f"{size:x}") + 4
+
+
+async def one_stream(frames_fn) -> tuple[int, int]:
+    frames = size = 0
+    async for frame in frames_fn(uuid.uuid4(), stream_chat_completion(MESSAGES)):
+        frames += 1
+        size += wire_bytes(frame)
+    return frames, size
+
+
+async def run_mode(mode: str, frames_fn, concurrency: int) -> None:
+    cpu, wall = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(one_stream(frames_fn) for _ in range(concurrency)))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    frames = sum(f for f, _ in results)
+    size = sum(b for _, b in results)
+    print(
+        f"{mode:<10} {concurrency:>7} {frames / concurrency:>12.1f} {frames / wall:>10.0f} "
+        f"{size / concurrency:>12.0f} {cpu * 1000 / concurrency:>10.2f}"
+    )
+
+
+async def main(levels: list[int], delay_ms: float) -> None:
+    modes = [
+        ("legacy", legacy_frames),
+        ("per-token", lambda run_id, deltas: delta_frames(run_id, deltas, max_bytes=1, max_delay=0)),
+        ("coalesced", lambda run_id, deltas: delta_frames(run_id, deltas, max_delay=delay_ms / 1000)),
+    ]
+    await one_stream(legacy_frames)  # warm up the client and tokenizer outside the measurements
+    print(f"{'mode':<10} {'streams':>7} {'frames/strm':>12} {'frames/s':>10} {'bytes/strm':>12} {'cpu ms/strm':>10}")
+    for n in levels:
+        for mode, frames_fn in modes:
+            await run_mode(mode, frames_fn, n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="1,50,200")
+    parser.add_argument("--delay-ms", type=float, default=30)
+    parser.add_argument("--tokens-per-sec", default="100")
+    parser.add_argument("--tokens", default="300")
+    args = parser.parse_args()
+
+    # Separate process so the fake provider does not share the GIL with the client under test
+    env = dict(os.environ, FAKE_TOKENS_PER_SEC=args.tokens_per_sec, FAKE_COMPLETION_TOKENS=args.tokens)
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(PORT)], env=env)
+    try:
+        time.sleep(2)
+        asyncio.run(main([int(n) for n in args.levels.split(",")], args.delay_ms))
+    finally:
+        server.terminate()
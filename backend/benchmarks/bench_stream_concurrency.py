@@ -0,0 +1,83 @@
+"""Time-to-first-token under concurrent streams, sync vs async LLM client.
+
+Starts the local fake provider and opens N concurrent streams from a single
+event loop, the way one uvicorn worker serves N SSE clients.
+
+    cd backend && python -m benchmarks.bench_stream_concurrency
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PORT = 8999
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ["LLM_PROVIDER"] = "openai"  # the real client, pointed at the fake server
+# Measure the client, not the rate limiter
+for limit in ("LLM_GLOBAL_RPM", "LLM_GLOBAL_TPM"):
+    os.environ.setdefault(limit, "0")
+
+from config import LLM_MODEL  # noqa: E402
+from llm_client import stream_chat_completion  # noqa: E402
+from services.providers import extract_delta, llm_provider  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "benchmark"}]
+
+
+async def async_stream(start: float) -> float:
+    ttft = None
+    async for _ in stream_chat_completion(MESSAGES):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+async def sync_stream(start: float) -> float:
+    # The old pattern: a blocking iterator consumed inside a coroutine
+    ttft = None
+    for chunk in llm_provider.client.chat.completions.create(model=LLM_MODEL, messages=MESSAGES, stream=True):
+        if extract_delta(chunk) and ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+async def run_level(fn, concurrency: int) -> list[float]:
+    # All streams share one start time, as if the requests arrived together
+    start = time.perf_counter()
+    return await asyncio.gather(*(fn(start) for _ in range(concurrency)))
+
+
+def report(mode: str, concurrency: int, ttfts: list[float]) -> None:
+    ttfts = sorted(ttfts)
+    p95 = ttfts[max(0, int(len(ttfts) * 0.95) - 1)]
+    print(f"{mode:<6} {concurrency:>6} {statistics.median(ttfts) * 1000:>10.1f} {p95 * 1000:>10.1f} {ttfts[-1] * 1000:>10.1f}")
+
+
+async def main(levels: list[int], sync_levels: list[int]) -> None:
+    print(f"{'mode':<6} {'streams':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for n in sync_levels:
+        report("sync", n, await run_level(sync_stream, n))
+    for n in levels:
+        report("async", n, await run_level(async_stream, n))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="1,10,50,100,250,500")
+    parser.add_argument("--sync-levels", default="1,5,10")
+    args = parser.parse_args()
+
+    # Separate process so the fake provider does not share the GIL with the client under test
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(PORT)])
+    try:
+        time.sleep(2)
+        asyncio.run(main(
+            [int(n) for n in args.levels.split(",")],
+            [int(n) for n in args.sync_levels.split(",") if n],
+        ))
+    finally:
+        server.terminate()
@@ -0,0 +1,105 @@
+"""Minimal OpenAI-compatible chat completions server for local benchmarks.
+
+Streams synthetic tokens with a configurable time-to-first-token and token rate
+so the backend can be exercised without calling (or paying) the real provider.
+For resilience testing it can also misbehave like a provider in a brownout:
+add latency jitter, fail a fraction of requests, or stall before the first token.
+
+    FAKE_ERROR_RATE=0.3 FAKE_STALL_RATE=0.1 python -m benchmarks.fake_openai_server --port 8999
+    export OPENAI_BASE_URL=http://127.0.0.1:8999/v1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+TTFT_MS = float(os.getenv("FAKE_TTFT_MS", "200"))
+TOKENS_PER_SEC = float(os.getenv("FAKE_TOKENS_PER_SEC", "50"))
+COMPLETION_TOKENS = int(os.getenv("FAKE_COMPLETION_TOKENS", "100"))
+JITTER_MS = float(os.getenv("FAKE_JITTER_MS", "0"))  # extra uniform 0..N ms before the first byte
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))  # fraction of requests answered with ERROR_STATUS
+ERROR_STATUS = int(os.getenv("FAKE_ERROR_STATUS", "500"))
+STALL_RATE = float(os.getenv("FAKE_STALL_RATE", "0"))  # fraction of requests that hang for STALL_MS first
+STALL_MS = float(os.getenv("FAKE_STALL_MS", "60000"))
+
+
+async def _misbehave() -> JSONResponse | None:
+    # Applied before any response bytes, like a provider that is slow or failing upstream
+    await asyncio.sleep(random.uniform(0, JITTER_MS) / 1000)
+    if random.random() < STALL_RATE:
+        await asyncio.sleep(STALL_MS / 1000)
+    if random.random() < ERROR_RATE:
+        return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=ERROR_STATUS)
+    return None
+
+
+def _chunk(model: str, content: str | None, finish_reason: str | None = None) -> str:
+    payload = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content} if content else {}, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    max_tokens = body.get("max_tokens") or COMPLETION_TOKENS
+    n_tokens = min(COMPLETION_TOKENS, max_tokens)
+
+    failure = await _misbehave()
+    if failure is not None:
+        return failure
+
+    if not body.get("stream"):
+        await asyncio.sleep(TTFT_MS / 1000 + n_tokens / TOKENS_PER_SEC)
+        return JSONResponse({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " tok" * n_tokens}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": n_tokens, "total_tokens": 10 + n_tokens},
+        })
+
+    async def events():
+        await asyncio.sleep(TTFT_MS / 1000)
+        for i in range(n_tokens):
+            if i:
+                await asyncio.sleep(1 / TOKENS_PER_SEC)
+            yield _chunk(model, f" tok{random.randint(0, 9)}")
+        yield _chunk(model, None, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def file_content(request: Request):
+    failure = await _misbehave()
+    if failure is not None:
+        return failure
+    return PlainTextResponse(f"fake contents of {request.path_params['file_id']}")
+
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/v1/files/{file_id}/content", file_content, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8999)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -1,17 +1,144 @@
 from dotenv import load_dotenv
 import os
 
-from openai import OpenAI
-
 load_dotenv()
  
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Connection pool; set DB_USE_NULLPOOL=true behind an external pooler such as PgBouncer
+DB_USE_NULLPOOL = os.getenv("DB_USE_NULLPOOL", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; below typical server/proxy idle cutoffs
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_SSLMODE = os.getenv("DB_SSLMODE", "prefer")
+# Serve read endpoints from an async engine (psycopg 3 / aiosqlite) instead of the threadpool
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")  # derived from DATABASE_URL when unset
+# Upgrade the schema (backend/migrations) when the app starts; turn off to run `alembic upgrade head` as a release step
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"
 SENTRY_DSN = os.getenv("SENTRY_DSN")
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
+
+# Browser origins allowed by CORS; the chat WebSocket checks Origin against the same list
+ALLOWED_ORIGINS = [
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+    "https://yellow-chatbot.vercel.app"
+]
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 MAX_BCRYPT_LEN = 72
+# Verified tokens -> principals; bounds how long another worker may trust a user that changed
+PRINCIPAL_CACHE_MAX_BYTES = int(os.getenv("PRINCIPAL_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
+# In-process cache of project file text, bounded by total bytes per worker
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+FILE_CACHE_TTL_SECONDS = int(os.getenv("FILE_CACHE_TTL_SECONDS", "900"))
+
+# Opt-in exact-match cache of LLM replies for stored-prompt runs (off unless enabled)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+# Concurrent identical LLM requests share one upstream call (streams fan out to every subscriber)
+LLM_SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# SSE framing: deltas within the delay window share a frame (0 sends one frame per delta);
+# heartbeat comments keep idle connections open through proxies (0 disables them)
+SSE_COALESCE_MAX_DELAY_MS = float(os.getenv("SSE_COALESCE_MAX_DELAY_MS", "30"))
+SSE_COALESCE_MAX_BYTES = int(os.getenv("SSE_COALESCE_MAX_BYTES", "4096"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Resumable SSE: deltas of each streamed run stay replayable for a grace period after it ends.
+# "redis" shares them across workers (REDIS_URL); "memory" only serves reconnects to the same worker.
+STREAM_RESUME_BACKEND = os.getenv("STREAM_RESUME_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STREAM_RESUME_GRACE_SECONDS = int(os.getenv("STREAM_RESUME_GRACE_SECONDS", "120"))
+STREAM_RESUME_MAX_RUNS = int(os.getenv("STREAM_RESUME_MAX_RUNS", "10000"))
+STREAM_BUFFER_MAX_DELTAS = int(os.getenv("STREAM_BUFFER_MAX_DELTAS", "16384"))  # per run, well above max output
+# Generation stops once no client has been attached for this long (negative: always run to the end)
+STREAM_CANCEL_GRACE_SECONDS = float(os.getenv("STREAM_CANCEL_GRACE_SECONDS", "5"))
+
+# Chat WebSocket: generations one connection may run at once, and frames queued for a slow client
+# before its streams wait for it
+WS_MAX_STREAMS_PER_CONNECTION = int(os.getenv("WS_MAX_STREAMS_PER_CONNECTION", "8"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+# Stored-prompt runs are queued in prompt_runs and executed by a worker pool. RUN_WORKERS=0 starts no
+# workers in the API process (run `python -m services.jobs` separately)
+RUN_WORKERS = int(os.getenv("RUN_WORKERS", "4"))
+RUN_QUEUE_POLL_SECONDS = float(os.getenv("RUN_QUEUE_POLL_SECONDS", "1"))
+RUN_LEASE_SECONDS = int(os.getenv("RUN_LEASE_SECONDS", "600"))  # a running job older than this is requeued
+RUN_WAIT_MAX_SECONDS = int(os.getenv("RUN_WAIT_MAX_SECONDS", "30"))
+
+# Batch runs: items per request and how many of them call the model at once
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_DEFAULT_PARALLELISM = int(os.getenv("BATCH_DEFAULT_PARALLELISM", "4"))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "16"))
+
+# Retrieval over project files: small projects send full text, larger ones only the top-k chunks
+RETRIEVAL_INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", "data/retrieval")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "200"))
+RETRIEVAL_FULL_TEXT_MAX_BYTES = int(os.getenv("RETRIEVAL_FULL_TEXT_MAX_BYTES", str(16 * 1024)))
+
+# Model and per-model context windows (tokens); prompts are capped well below the window to bound cost
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4-turbo")
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4096"))
+CONTEXT_MAX_PROMPT_TOKENS = int(os.getenv("CONTEXT_MAX_PROMPT_TOKENS", "32000"))
+
+# Runs per page of GET /projects/{id}/messages (each run is up to two messages)
+MESSAGES_PAGE_DEFAULT = int(os.getenv("MESSAGES_PAGE_DEFAULT", "50"))
+MESSAGES_PAGE_MAX = int(os.getenv("MESSAGES_PAGE_MAX", "200"))
+# GET /projects/{id}/messages/since re-sends runs changed this long before the cursor (clock skew, late commits)
+MESSAGES_SYNC_LOOKBACK_SECONDS = float(os.getenv("MESSAGES_SYNC_LOOKBACK_SECONDS", "2"))
+
+# Conversation history: recent turns are sent verbatim, older ones folded into a rolling summary
+HISTORY_VERBATIM_TURNS = int(os.getenv("HISTORY_VERBATIM_TURNS", "6"))
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "6"))
+
+# Outbound LLM governor: token buckets per minute, globally and per user (0 disables a bucket).
+# Limits are per process; split the provider's quota across workers.
+LLM_GLOBAL_RPM = int(os.getenv("LLM_GLOBAL_RPM", "500"))
+LLM_GLOBAL_TPM = int(os.getenv("LLM_GLOBAL_TPM", "300000"))
+LLM_USER_RPM = int(os.getenv("LLM_USER_RPM", "60"))
+LLM_USER_TPM = int(os.getenv("LLM_USER_TPM", "100000"))
+# Calls over the limit wait in a fair queue; beyond these bounds they fail fast with 429
+LLM_QUEUE_MAX_DEPTH = int(os.getenv("LLM_QUEUE_MAX_DEPTH", "256"))
+LLM_USER_QUEUE_MAX_DEPTH = int(os.getenv("LLM_USER_QUEUE_MAX_DEPTH", "16"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "15"))
+
+# Provider resilience: deadlines per call, jittered retries, and a circuit breaker that fails fast
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))  # whole non-streamed call, retries included
+LLM_STREAM_TTFT_SECONDS = float(os.getenv("LLM_STREAM_TTFT_SECONDS", "20"))
+LLM_STREAM_TOTAL_SECONDS = float(os.getenv("LLM_STREAM_TOTAL_SECONDS", "300"))
+FILE_FETCH_TIMEOUT_SECONDS = float(os.getenv("FILE_FETCH_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# The circuit opens when at least this share of the last CIRCUIT_WINDOW provider calls failed
+CIRCUIT_FAILURE_RATIO = float(os.getenv("CIRCUIT_FAILURE_RATIO", "0.5"))
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "30"))
 
-# OpenAI Client
+# LLM provider (services/providers.py): "openai", or "fake" to load-test the backend offline
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
\ No newline at end of file
+# Fake provider: deterministic synthetic replies with the given timing and injected failure rate
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "200"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+FAKE_LLM_COMPLETION_TOKENS = int(os.getenv("FAKE_LLM_COMPLETION_TOKENS", "100"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", "0"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
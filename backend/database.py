@@ -1,8 +1,15 @@
+import os
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker, declarative_base
 from passlib.context import CryptContext
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DB_USE_NULLPOOL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_SSLMODE,
+    DB_ASYNC, ASYNC_DATABASE_URL
+)
 
 
 # Password hashing
@@ -18,6 +25,59 @@ def get_db():
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.")
-engine = create_engine(DATABASE_URL, connect_args={"sslmode": "prefer"}, poolclass=NullPool)
+
+connect_args = {"sslmode": DB_SSLMODE} if DATABASE_URL.startswith("postgresql") else {}
+if DB_USE_NULLPOOL:
+    engine = create_engine(DATABASE_URL, connect_args=connect_args, poolclass=NullPool)
+else:
+    # Reuse connections instead of paying a TCP/TLS handshake per request; pre-ping drops
+    # connections the server or a proxy closed while idle, recycle bounds their lifetime
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args=connect_args,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def async_database_url(url: str) -> str:
+    # Same database through an async driver; psycopg 3 understands libpq options such as sslmode
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        return parsed.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
+
+
+if DB_ASYNC:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL or async_database_url(DATABASE_URL),
+        connect_args=connect_args,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def run_migrations() -> None:
+    # create_all never alters a table that exists, so schema changes ship as Alembic revisions
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    config.attributes["configure_logger"] = False  # keep the app's logging setup
+    command.upgrade(config, "head")
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
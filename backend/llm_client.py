@@ -1,6 +1,36 @@
-from config import openai_client
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator
 
-def generate_project_name(messages: list[dict]) -> str:
+from config import (
+    LLM_MODEL, LLM_MAX_OUTPUT_TOKENS,
+    LLM_TIMEOUT_SECONDS, LLM_STREAM_TTFT_SECONDS, LLM_STREAM_TOTAL_SECONDS, LLM_MAX_RETRIES,
+)
+from services.context import count_tokens, message_tokens
+from services.governor import Lease, llm_governor
+from services.providers import Completion, llm_provider
+from services.resilience import PROVIDER_FAILURES, call_provider, provider_breaker, retry_delay
+
+# Every call below takes a lease from the governor first: a request plus its prompt tokens and the
+# most it may generate. Calls that report usage settle the lease with the real figure. The call itself
+# runs under a deadline, with jittered retries and the provider circuit breaker, against whichever
+# provider LLM_PROVIDER selects.
+
+
+def _create_completion(user_id, messages: list[dict], model: str, max_output: int, max_tokens: int | None = None) -> Completion:
+    provider_breaker.check()  # an open circuit should not cost a rate-limit lease
+    lease = llm_governor.acquire(user_id, message_tokens(messages, model) + max_output)
+    completion = None
+    try:
+        # A completion that failed produced nothing to repeat, so retrying is safe
+        completion = call_provider(lambda timeout: llm_provider.complete(messages, model, timeout, max_tokens), LLM_TIMEOUT_SECONDS)
+        return completion
+    finally:
+        # A call that failed (deadline, open circuit, retries used up) did no work to bill
+        llm_governor.settle(lease, completion.total_tokens if completion is not None else 0)
+
+
+def generate_project_name(messages: list[dict], user_id=None) -> str:
     convo = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
 
     prompt = f"""
@@ -11,12 +41,80 @@ def generate_project_name(messages: list[dict]) -> str:
     {convo}
     """
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4-turbo",  # or whichever model you’re using
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=20,
-    )
+    completion = _create_completion(user_id, [{"role": "user", "content": prompt}], LLM_MODEL, 20, max_tokens=20)
 
-    content = response.choices[0].message.content
-    name = content.strip() if content is not None else None
+    name = completion.content.strip() if completion.content is not None else None
     return name or "New Conversation"
+
+
+def summarize_conversation(previous_summary: str, messages: list[dict]) -> str:
+    convo = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
+
+    prompt = f"""
+    You maintain a running summary of a conversation between a user and an assistant.
+    Update the summary with the new messages. Keep facts, decisions, names and open questions; drop pleasantries.
+    Keep it under 300 words.
+
+    Current summary:
+    {previous_summary or "(empty)"}
+
+    New messages:
+    {convo}
+    """
+
+    # Background work: only the global limits apply
+    completion = _create_completion(None, [{"role": "user", "content": prompt}], LLM_MODEL, 512, max_tokens=512)
+
+    return completion.content.strip() if completion.content else previous_summary
+
+
+def chat_completion(messages: list[dict], model: str = LLM_MODEL, user_id=None) -> tuple[str | None, int | None]:
+    # (reply, total tokens) for one non-streamed completion
+    completion = _create_completion(user_id, messages, model, LLM_MAX_OUTPUT_TOKENS)
+    return completion.content, completion.total_tokens
+
+
+def reserve_tokens(prompt_tokens: int) -> int:
+    return prompt_tokens + LLM_MAX_OUTPUT_TOKENS
+
+
+async def stream_chat_completion(messages: list[dict], model: str = LLM_MODEL, lease: Lease | None = None) -> AsyncIterator[str]:
+    # Non-blocking token stream: each read awaits the socket instead of stalling the event loop.
+    # Pass a lease taken up front to get a 429 before the response starts rather than mid-stream.
+    if lease is None:
+        provider_breaker.check()
+        lease = await llm_governor.acquire_async(None, reserve_tokens(message_tokens(messages, model)))
+
+    # The first token must arrive within the TTFT deadline, the whole reply within the total one.
+    # Until a token has been yielded a failed attempt is retried; after that it cannot be taken back.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_STREAM_TOTAL_SECONDS
+    output = []
+    attempt = 0
+    completed = False
+    try:
+        while True:
+            try:
+                with provider_breaker.call():
+                    async with asyncio.timeout(min(LLM_STREAM_TTFT_SECONDS, deadline - loop.time())) as timer:
+                        async with aclosing(llm_provider.stream(messages, model, max(deadline - loop.time(), 0.001))) as pieces:
+                            async for content_piece in pieces:
+                                if not output:
+                                    timer.reschedule(deadline)
+                                output.append(content_piece)
+                                yield content_piece
+            except PROVIDER_FAILURES:
+                delay = retry_delay(attempt)
+                if output or attempt >= LLM_MAX_RETRIES or loop.time() + delay >= deadline:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            break
+        completed = True
+    finally:
+        # However the stream ended (done, failed, cancelled, or closed by a reader that went away),
+        # leaving the block closed the provider connection. Streams report no usage, so bill the
+        # prompt and the reply counted locally; one that ended before its first token did no work.
+        produced = lease.tokens - LLM_MAX_OUTPUT_TOKENS + count_tokens("".join(output), model)
+        llm_governor.settle(lease, produced if completed or output else 0)
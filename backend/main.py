@@ -1,39 +1,96 @@
+from contextlib import asynccontextmanager
+
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
-from routes import users, login, projects, prompts, files
-from database import engine, Base
+from routes import users, login, projects, prompts, files, chat_socket
+from database import run_migrations
+from config import ALLOWED_ORIGINS, DB_ASYNC, DB_MIGRATE_ON_STARTUP, RUN_WORKERS
+from services.cache import file_content_cache, principal_cache, response_cache
+from services.inflight import inflight_stats
+from services.stream_resume import stream_buffer
+from services.providers import llm_provider
+from services.jobs import worker_pool
+from services.governor import RateLimited, llm_governor
+from services.resilience import ProviderUnavailable, provider_breaker
 
 from logger import init_sentry
 init_sentry()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Queued prompt runs execute on this process's worker pool unless it is disabled (RUN_WORKERS=0)
+    if RUN_WORKERS > 0:
+        worker_pool.start()
+    yield
+    worker_pool.stop()
+    if DB_ASYNC:
+        # Pooled aiosqlite connections each hold a thread that would keep the process from exiting
+        from database import async_engine
+        await async_engine.dispose()
 
-origins = [
-    "http://localhost:5173",
-    "http://127.0.0.1:5173",
-    "https://yellow-chatbot.vercel.app"
-]
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],
 )
 
+# First match wins: with DB_ASYNC the async read handlers take over their paths
+if DB_ASYNC:
+    from routes import async_reads
+    app.include_router(async_reads.router, prefix="/api")
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    # The LLM governor's queue is full or the wait ran out
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many LLM requests, try again later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable_handler(request: Request, exc: ProviderUnavailable):
+    # The provider circuit is open: fail fast instead of queueing behind a brownout
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "LLM provider unavailable, try again later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 app.include_router(users.router, prefix="/api")
 app.include_router(login.router, prefix="/api")
 app.include_router(projects.router, prefix="/api")
 app.include_router(prompts.router, prefix="/api")
 app.include_router(files.router, prefix="/api")
+app.include_router(chat_socket.router, prefix="/api")
 
 
-Base.metadata.create_all(bind=engine)
+if DB_MIGRATE_ON_STARTUP:
+    run_migrations()
 
 @app.get("/api/health")
 def health():
     return {"status":"ok"}
 
+@app.get("/api/metrics")
+def metrics():
+    return {
+        "file_cache": file_content_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "inflight": inflight_stats(),
+        "stream_resume": stream_buffer.stats(),
+        "run_workers": worker_pool.stats(),
+        "llm_governor": llm_governor.stats(),
+        "provider_breaker": provider_breaker.stats(),
+        "llm_provider": llm_provider.name,
+    }
+
 # TODO: check bcrypt.__about__ error later
\ No newline at end of file
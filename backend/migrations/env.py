@@ -0,0 +1,38 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import text
+
+from database import Base, engine
+# Every model must be registered for the metadata to be complete
+import models.user, models.project, models.prompt, models.file, models.analytics, models.summary  # noqa: F401
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+# Arbitrary, fixed: every process migrating the same database takes the same lock
+MIGRATION_LOCK_KEY = 7250812
+
+
+def run_migrations_offline() -> None:
+    context.configure(url=engine.url.render_as_string(hide_password=False), target_metadata=Base.metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        # Batch mode lets SQLite (tests, local dev) apply column changes by copying the table
+        context.configure(connection=connection, target_metadata=Base.metadata, render_as_batch=True)
+        with context.begin_transaction():
+            if connection.dialect.name == "postgresql":
+                # Workers starting together migrate one at a time; the rest then find the schema at head
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
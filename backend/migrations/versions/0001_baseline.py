@@ -0,0 +1,90 @@
+"""Baseline schema: the tables create_all made before migrations existed
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by create_all already have these; only fresh ones get them here
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        )
+        op.create_index("ix_users_id", "users", ["id"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "projects" not in existing:
+        op.create_table(
+            "projects",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("description", sa.String()),
+            sa.Column("owner_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("is_active", sa.Integer(), nullable=False),
+        )
+        op.create_index("ix_projects_id", "projects", ["id"], unique=True)
+        op.create_index("ix_projects_name", "projects", ["name"], unique=True)
+
+    if "prompts" not in existing:
+        op.create_table(
+            "prompts",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("description", sa.String()),
+            sa.Column("content", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        )
+        op.create_index("ix_prompts_id", "prompts", ["id"])
+
+    if "prompt_runs" not in existing:
+        op.create_table(
+            "prompt_runs",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("prompt_id", UUID(as_uuid=True), sa.ForeignKey("prompts.id"), nullable=False),
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), nullable=False),
+            sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("input_data", sa.Text()),
+            sa.Column("output_data", sa.Text()),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("tokens_used", sa.Integer()),
+            sa.Column("cost", sa.Float()),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        )
+        op.create_index("ix_prompt_runs_id", "prompt_runs", ["id"], unique=True)
+
+    if "project_files" not in existing:
+        op.create_table(
+            "project_files",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), nullable=False),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("file_id", sa.String(), nullable=False),
+            sa.Column("purpose", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        )
+        op.create_index("ix_project_files_id", "project_files", ["id"])
+
+
+def downgrade() -> None:
+    for table in ("project_files", "prompt_runs", "prompts", "projects", "users"):
+        op.drop_table(table)
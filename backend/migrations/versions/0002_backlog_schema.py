@@ -0,0 +1,131 @@
+"""Run metadata, local file text and retrieval chunks, usage rollups and conversation summaries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Skips what create_all already made on databases that ran this code before migrations existed
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    run_columns = {c["name"] for c in inspector.get_columns("prompt_runs")}
+    run_indexes = {i["name"] for i in inspector.get_indexes("prompt_runs")}
+    file_columns = {c["name"] for c in inspector.get_columns("project_files")}
+
+    with op.batch_alter_table("prompt_runs") as batch:
+        if "model" not in run_columns:
+            batch.add_column(sa.Column("model", sa.String()))
+        if "prompt_tokens" not in run_columns:
+            batch.add_column(sa.Column("prompt_tokens", sa.Integer()))
+        if "cache_hit" not in run_columns:
+            batch.add_column(sa.Column("cache_hit", sa.Boolean(), nullable=False, server_default=sa.false()))
+        for name, columns in (
+            ("ix_prompt_runs_project_created_id", ["project_id", "created_at", "id"]),
+            ("ix_prompt_runs_project_updated_id", ["project_id", "updated_at", "id"]),
+            ("ix_prompt_runs_status_created", ["status", "created_at"]),
+        ):
+            if name not in run_indexes:
+                batch.create_index(name, columns)
+
+    if "file_texts" not in tables:
+        op.create_table(
+            "file_texts",
+            sa.Column("content_hash", sa.String(64), primary_key=True),
+            sa.Column("text", sa.Text(), nullable=False),
+            sa.Column("size_bytes", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        )
+
+    with op.batch_alter_table("project_files") as batch:
+        if "content_hash" not in file_columns:
+            batch.add_column(sa.Column("content_hash", sa.String(64)))
+            batch.create_foreign_key("project_files_content_hash_fkey", "file_texts", ["content_hash"], ["content_hash"])
+            batch.create_index("ix_project_files_content_hash", ["content_hash"])
+        if "chunk_count" not in file_columns:
+            batch.add_column(sa.Column("chunk_count", sa.Integer()))
+
+    if "file_chunks" not in tables:
+        op.create_table(
+            "file_chunks",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), nullable=False),
+            sa.Column("project_file_id", UUID(as_uuid=True), sa.ForeignKey("project_files.id"), nullable=False),
+            sa.Column("ordinal", sa.Integer(), nullable=False),
+            sa.Column("text", sa.Text(), nullable=False),
+        )
+        op.create_index("ix_file_chunks_project_id", "file_chunks", ["project_id"])
+        op.create_index("ix_file_chunks_project_file_id", "file_chunks", ["project_file_id"])
+
+    if "project_usage" not in tables:
+        op.create_table(
+            "project_usage",
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), primary_key=True),
+            sa.Column("total_runs", sa.Integer(), nullable=False),
+            sa.Column("completed_runs", sa.Integer(), nullable=False),
+            sa.Column("failed_runs", sa.Integer(), nullable=False),
+            sa.Column("total_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("total_cost", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        )
+    else:
+        # create_all made the lifetime counter int4
+        with op.batch_alter_table("project_usage") as batch:
+            batch.alter_column("total_tokens", type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+
+    if "usage_buckets" not in tables:
+        op.create_table(
+            "usage_buckets",
+            sa.Column("granularity", sa.String(8), primary_key=True),
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), primary_key=True),
+            sa.Column("bucket_start", sa.DateTime(timezone=True), primary_key=True),
+            sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("model", sa.String(), primary_key=True),
+            sa.Column("runs", sa.Integer(), nullable=False),
+            sa.Column("completed_runs", sa.Integer(), nullable=False),
+            sa.Column("failed_runs", sa.Integer(), nullable=False),
+            sa.Column("tokens", sa.BigInteger(), nullable=False),
+            sa.Column("cost", sa.Float(), nullable=False),
+            sa.Column("latency_ms", sa.BigInteger(), nullable=False),
+        )
+        op.create_index("ix_usage_buckets_user_range", "usage_buckets", ["granularity", "user_id", "bucket_start"])
+    else:
+        with op.batch_alter_table("usage_buckets") as batch:
+            batch.alter_column("tokens", type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+
+    if "conversation_summaries" not in tables:
+        op.create_table(
+            "conversation_summaries",
+            sa.Column("project_id", UUID(as_uuid=True), sa.ForeignKey("projects.id"), primary_key=True),
+            sa.Column("summary", sa.Text(), nullable=False),
+            sa.Column("summarized_until_created_at", sa.DateTime(timezone=True)),
+            sa.Column("summarized_until_id", UUID(as_uuid=True)),
+            sa.Column("pending_turns", sa.Integer(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    for table in ("conversation_summaries", "usage_buckets", "project_usage", "file_chunks"):
+        op.drop_table(table)
+    with op.batch_alter_table("project_files") as batch:
+        batch.drop_index("ix_project_files_content_hash")
+        batch.drop_constraint("project_files_content_hash_fkey", type_="foreignkey")
+        batch.drop_column("content_hash")
+        batch.drop_column("chunk_count")
+    op.drop_table("file_texts")
+    with op.batch_alter_table("prompt_runs") as batch:
+        for name in ("ix_prompt_runs_status_created", "ix_prompt_runs_project_updated_id", "ix_prompt_runs_project_created_id"):
+            batch.drop_index(name)
+        for column in ("cache_hit", "prompt_tokens", "model"):
+            batch.drop_column(column)
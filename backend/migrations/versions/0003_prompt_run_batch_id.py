@@ -0,0 +1,25 @@
+"""Tag runs created by /batch_run so they stay out of the conversation
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable, so adding it rewrites nothing; batch runs from before this revision stay untagged
+    with op.batch_alter_table("prompt_runs") as batch:
+        batch.add_column(sa.Column("batch_id", UUID(as_uuid=True)))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("prompt_runs") as batch:
+        batch.drop_column("batch_id")
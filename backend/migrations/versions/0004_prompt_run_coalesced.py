@@ -0,0 +1,24 @@
+"""Record single-flight followers apart from response-cache hits
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Followers recorded before this revision keep cache_hit=true; there is nothing to tell them apart by
+    with op.batch_alter_table("prompt_runs") as batch:
+        batch.add_column(sa.Column("coalesced", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("prompt_runs") as batch:
+        batch.drop_column("coalesced")
@@ -0,0 +1,63 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Integer, BigInteger, Float, String, ForeignKey, DateTime, Index
+from database import Base
+from datetime import datetime, timezone
+import uuid
+
+
+# Per-project counters over finished runs, maintained in the same transaction that finishes a run
+class ProjectUsage(Base):
+    __tablename__ = "project_usage"
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id"), primary_key=True)
+    total_runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completed_runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed_runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # lifetime; outgrows int4 on a busy project
+    total_cost: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+class ProjectUsageResponse(BaseModel):
+    total_runs: int = 0
+    completed_runs: int = 0
+    failed_runs: int = 0
+    total_tokens: int = 0
+    total_cost: float = 0.0
+
+    class Config:
+        from_attributes = True
+
+
+# Usage per hour and per day, keyed by project, user and model; charts read these instead of prompt_runs
+class UsageBucket(Base):
+    __tablename__ = "usage_buckets"
+    __table_args__ = (
+        # Per-user series across projects; the primary key already serves per-project ranges
+        Index("ix_usage_buckets_user_range", "granularity", "user_id", "bucket_start"),
+    )
+
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)  # "hour" or "day"
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id"), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    model: Mapped[str] = mapped_column(String, primary_key=True)  # "" for runs that predate the model column
+    runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completed_runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed_runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    tokens: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    cost: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    latency_ms: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # summed; divide by runs
+
+class UsagePoint(BaseModel):
+    bucket_start: datetime
+    project_id: Optional[uuid.UUID] = None
+    user_id: Optional[uuid.UUID] = None
+    model: Optional[str] = None
+    runs: int
+    completed_runs: int
+    failed_runs: int
+    tokens: int
+    cost: float
+    avg_latency_ms: Optional[float] = None
@@ -1,5 +1,6 @@
+from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, ForeignKey, DateTime
+from sqlalchemy import String, ForeignKey, DateTime, Integer, Text
 from database import Base
 from datetime import datetime, timezone
 import uuid
@@ -13,4 +14,26 @@ class ProjectFile(Base):
     filename: Mapped[str] = mapped_column(String, nullable=False)
     file_id: Mapped[str] = mapped_column(String, nullable=False)  # OpenAI file ID
     purpose: Mapped[str] = mapped_column(String, nullable=False, default="answers")  # OpenAI usage purpose
+    # Extracted text lives in file_texts, keyed by sha256 of the uploaded bytes
+    content_hash: Mapped[Optional[str]] = mapped_column(ForeignKey("file_texts.content_hash"), nullable=True, index=True)
+    chunk_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # None until indexed for retrieval
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+# Content-addressed: identical uploads share one row
+class FileText(Base):
+    __tablename__ = "file_texts"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+# Retrieval units; the BM25 index itself is persisted next to the app (see services/retrieval.py)
+class FileChunk(Base):
+    __tablename__ = "file_chunks"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id"), nullable=False, index=True)
+    project_file_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("project_files.id"), nullable=False, index=True)
+    ordinal: Mapped[int] = mapped_column(Integer, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
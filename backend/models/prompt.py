@@ -1,7 +1,7 @@
 from typing import Optional
 from pydantic import BaseModel
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Integer, String, ForeignKey, DateTime, Text, Index, Boolean, false
 from database import Base
 from datetime import datetime, timezone
 import uuid
@@ -40,17 +40,31 @@ class PromptResponse(BaseModel):
         
 class PromptRun(Base):
     __tablename__ = "prompt_runs"
+    __table_args__ = (
+        # Conversation order within a project: history windows and keyset pagination
+        Index("ix_prompt_runs_project_created_id", "project_id", "created_at", "id"),
+        # Delta sync: runs changed since a client's cursor
+        Index("ix_prompt_runs_project_updated_id", "project_id", "updated_at", "id"),
+        # Job queue: oldest queued run first, stale running leases
+        Index("ix_prompt_runs_status_created", "status", "created_at"),
+    )
     
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, primary_key=True, index=True)
     prompt_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("prompts.id"), nullable=False)
     project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id"), nullable=False)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
+    model: Mapped[Optional[str]] = mapped_column(String, nullable=True)  # LLM that produced the output
     input_data: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     output_data: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     # TODO: Implement status enum later (e.g., pending, completed, failed)
+    # Queued stored-prompt runs go queued -> running -> completed/failed
     status: Mapped[str] = mapped_column(String, default="pending")  
     tokens_used: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, default=0)
+    prompt_tokens: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # assembled context size, counted locally
     cost: Mapped[Optional[float]] = mapped_column(nullable=True, default=0.0)
+    cache_hit: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default=false())  # reply replayed from the response cache
+    coalesced: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default=false())  # reply shared from a concurrent identical request
+    batch_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)  # runs from one /batch_run; never chat turns
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
@@ -58,17 +72,30 @@ class PromptRunResponse(BaseModel):
     id: uuid.UUID
     prompt_id: uuid.UUID
     user_id: uuid.UUID
+    model: Optional[str] = None
     input_data: Optional[str] = None
     output_data: Optional[str] = None
     status: str
     tokens_used: Optional[int] = 0
+    prompt_tokens: Optional[int] = None
     cost: Optional[float] = 0.0
+    cache_hit: bool = False
+    coalesced: bool = False
+    batch_id: Optional[uuid.UUID] = None
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
         
+class BatchRunItem(BaseModel):
+    prompt_id: uuid.UUID
+    input: Optional[str] = None  # appended to the prompt content, for running one prompt over many inputs
+
+class BatchRunRequest(BaseModel):
+    items: list[BatchRunItem]
+    parallelism: Optional[int] = None
+
 class SendPromptRequest(BaseModel):
     prompt_id: uuid.UUID
 
@@ -77,5 +104,7 @@ class SendPromptResponse(BaseModel):
     reply: str
     run_id: uuid.UUID
     status: str
+    cache_hit: bool = False
+    coalesced: bool = False
     created_at: datetime
     updated_at: datetime
\ No newline at end of file
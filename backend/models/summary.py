@@ -0,0 +1,21 @@
+from typing import Optional
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Integer, ForeignKey, DateTime, Text
+from database import Base
+from datetime import datetime, timezone
+import uuid
+from sqlalchemy.dialects.postgresql import UUID
+
+
+# Rolling summary of the turns that have aged out of the verbatim history window
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    project_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("projects.id"), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    # Last run folded into the summary, as a (created_at, id) cursor
+    summarized_until_created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    summarized_until_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)
+    pending_turns: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # completed turns after the cursor
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # optimistic lock for concurrent folds
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status, Path, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from models.project import ProjectResponse
+from models.prompt import PromptResponse
+from auth.auth import Principal, get_current_principal
+from services import queries
+from services.messages import message_page_query, build_message_page, version_query, version_etag, etag_matches, changes_query, build_delta
+from config import MESSAGES_PAGE_DEFAULT, MESSAGES_PAGE_MAX
+import uuid
+
+# Async versions of the hot read endpoints. main.py includes this router ahead of the sync
+# routers when DB_ASYNC is on, so these handlers take the matching paths and never touch the threadpool.
+router = APIRouter()
+
+@router.get("/projects/", response_model=list[ProjectResponse])
+async def get_projects(db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    return await queries.list_projects(db, user.id)
+
+@router.get("/projects/{project_id}", response_model=ProjectResponse)
+async def get_project(project_id: uuid.UUID = Path(..., description="ID of the project"), db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    project = await queries.get_owned_project(db, project_id, user.id)
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+
+    return project
+
+@router.get("/projects/{project_id}/prompts", response_model=list[PromptResponse])
+async def get_prompts_by_project(project_id: uuid.UUID, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    project = await queries.get_owned_project(db, project_id, user.id)
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+
+    return await queries.list_prompts(db, project_id)
+
+@router.get("/prompts/{prompt_id}", response_model=PromptResponse)
+async def get_prompt(prompt_id: uuid.UUID, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    db_prompt = await queries.get_owned_prompt(db, prompt_id, user.id)
+    if not db_prompt:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
+
+    return db_prompt
+
+@router.get("/projects/{project_id}/messages")
+async def get_project_messages(
+    project_id: uuid.UUID,
+    response: Response,
+    limit: int = Query(MESSAGES_PAGE_DEFAULT, ge=1, le=MESSAGES_PAGE_MAX),
+    before: str | None = Query(None, description="X-Next-Cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_principal)
+):
+    project = await queries.get_owned_project(db, project_id, user.id)
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+
+    try:
+        stmt = message_page_query(project.id, limit, before)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    messages, next_cursor = build_message_page((await db.execute(stmt)).all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
+
+@router.get("/projects/{project_id}/messages/since")
+async def get_project_message_changes(
+    project_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    cursor: str | None = Query(None, description="cursor from the previous sync; omit to start syncing"),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_principal)
+):
+    project = await queries.get_owned_project(db, project_id, user.id)
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+
+    version = (await db.execute(version_query(project.id))).first()
+    etag = version_etag(version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    if not cursor:
+        # First sync: hand out the current cursor, the client already has the history
+        return build_delta([], version)
+
+    try:
+        stmt = changes_query(project.id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return build_delta((await db.execute(stmt)).all(), version)
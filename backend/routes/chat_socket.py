@@ -0,0 +1,195 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from auth.auth import Principal, get_current_principal
+from config import ALLOWED_ORIGINS, WS_MAX_STREAMS_PER_CONNECTION, WS_SEND_QUEUE_SIZE
+from services.chat_stream import start_stream_run, open_replay
+from services.governor import RateLimited
+from services.history import fold_history
+from services.inflight import StreamFanout
+from services.resilience import ProviderUnavailable
+from services.sse import coalesce
+from services.stream_resume import StreamCancelled, StreamTrimmed, stream_buffer
+import asyncio
+import json
+import uuid
+import sentry_sdk
+from contextlib import aclosing
+from starlette.concurrency import run_in_threadpool
+
+router = APIRouter()
+
+# One authenticated socket carries any number of conversations and generations, with the message in
+# the frame body rather than a URL. Frames are JSON objects tagged by "type".
+#   client: send {ref, project_id, content} | resume {project_id, run_id, after} | cancel {run_id}
+#   server: started {ref, run_id} | delta {run_id, seq, delta} | end {run_id[, resync][, cancelled]}
+#           | error {ref or run_id, status, detail}
+# Runs are created, coalesced, buffered for resume and persisted exactly as for the SSE endpoint;
+# seq counts deltas the same way, so a resume can pick up from either transport.
+
+
+class ChatChannel:
+    def __init__(self, websocket: WebSocket, user: Principal):
+        self.websocket = websocket
+        self.user = user
+        # A client that stops reading fills the queue and its streams wait; nothing grows without bound
+        self.outbox: asyncio.Queue[dict] = asyncio.Queue(WS_SEND_QUEUE_SIZE)
+        self.tasks: set[asyncio.Task] = set()
+        self.runs: dict[uuid.UUID, tuple[asyncio.Task, StreamFanout | None]] = {}
+
+    async def write(self) -> None:
+        # The only writer, so frames from concurrent streams never interleave mid-send
+        try:
+            while True:
+                frame = await self.outbox.get()
+                await self.websocket.send_text(json.dumps(frame))
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # the receive loop sees the disconnect and tears the channel down
+
+    async def send(self, frame: dict) -> None:
+        await self.outbox.put(frame)
+
+    async def send_error(self, frame: dict, status_code: int, detail: str, **extra) -> None:
+        await self.send({"type": "error", **frame, "status": status_code, "detail": detail, **extra})
+
+    async def handle(self, frame: dict) -> None:
+        kind = frame["type"]
+        if kind == "cancel":
+            await self.cancel(uuid.UUID(frame["run_id"]))
+            return
+
+        if kind == "send":
+            work = self.start(frame.get("ref"), uuid.UUID(frame["project_id"]), str(frame["content"]))
+        elif kind == "resume":
+            work = self.resume(uuid.UUID(frame["project_id"]), uuid.UUID(frame["run_id"]), int(frame.get("after", 0)))
+        else:
+            raise ValueError(kind)
+
+        if len(self.tasks) >= WS_MAX_STREAMS_PER_CONNECTION:
+            work.close()
+            ref = {"ref": frame.get("ref")} if kind == "send" else {"run_id": frame["run_id"]}
+            await self.send_error(ref, status.HTTP_429_TOO_MANY_REQUESTS, "Too many streams on this connection")
+            return
+        task = asyncio.create_task(work)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def start(self, ref, project_id: uuid.UUID, content: str) -> None:
+        try:
+            stream = await start_stream_run(project_id, self.user, content)
+        except HTTPException as e:
+            await self.send_error({"ref": ref}, e.status_code, e.detail)
+            return
+        except RateLimited as e:
+            await self.send_error({"ref": ref}, status.HTTP_429_TOO_MANY_REQUESTS, "Too many LLM requests, try again later", retry_after=e.retry_after)
+            return
+        except ProviderUnavailable as e:
+            await self.send_error({"ref": ref}, status.HTTP_503_SERVICE_UNAVAILABLE, "LLM provider unavailable, try again later", retry_after=e.retry_after)
+            return
+        except Exception as e:
+            # The client is waiting on this ref; tell it rather than leave it hanging
+            sentry_sdk.capture_exception(e)
+            await self.send_error({"ref": ref}, status.HTTP_500_INTERNAL_SERVER_ERROR, "Failed to start generation")
+            return
+
+        self.runs[stream.run_id] = (asyncio.current_task(), stream.fanout)
+        await self.send({"type": "started", "ref": ref, "run_id": str(stream.run_id)})
+        try:
+            await self.forward(stream.run_id, stream.fanout.subscribe(), 0, stream.persisted)
+        finally:
+            self.runs.pop(stream.run_id, None)
+        # Fold aged-out turns into the summary once the stream has finished
+        await run_in_threadpool(fold_history, project_id)
+
+    async def resume(self, project_id: uuid.UUID, run_id: uuid.UUID, after: int) -> None:
+        if run_id in self.runs:
+            await self.send_error({"run_id": str(run_id)}, status.HTTP_409_CONFLICT, "Run already streaming on this connection")
+            return
+        try:
+            deltas = await open_replay(project_id, self.user, run_id, after)
+        except HTTPException as e:
+            await self.send_error({"run_id": str(run_id)}, e.status_code, e.detail)
+            return
+        except LookupError:
+            await self.send_error({"run_id": str(run_id)}, status.HTTP_404_NOT_FOUND, "Run not found")
+            return
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            await self.send_error({"run_id": str(run_id)}, status.HTTP_500_INTERNAL_SERVER_ERROR, "Failed to resume run")
+            return
+
+        self.runs[run_id] = (asyncio.current_task(), stream_buffer.fanout(run_id))
+        try:
+            await self.forward(run_id, deltas, after)
+        finally:
+            self.runs.pop(run_id, None)
+
+    async def forward(self, run_id: uuid.UUID, deltas, after: int, finished: asyncio.Task | None = None) -> None:
+        run_key = str(run_id)
+        end = {"type": "end", "run_id": run_key}
+        if deltas is None:
+            end["resync"] = True  # buffer gone: the client reloads the turn from the message list
+        else:
+            seq = after
+            try:
+                # Same coalescing as SSE frames; the socket has its own pings, so no heartbeats
+                async with aclosing(coalesce(deltas, heartbeat=0)) as batches:
+                    async for batch in batches:
+                        seq += len(batch)
+                        await self.send({"type": "delta", "run_id": run_key, "seq": seq, "delta": "".join(batch)})
+            except StreamCancelled:
+                end["cancelled"] = True
+            except StreamTrimmed:
+                end["resync"] = True
+            except Exception:
+                # reported (and the run marked failed) by the task that persists it
+                await self.send_error({"run_id": run_key}, status.HTTP_502_BAD_GATEWAY, "Error generating response")
+        if finished is not None:
+            await asyncio.shield(finished)  # the run is saved before the client is told it ended
+        await self.send(end)
+
+    async def cancel(self, run_id: uuid.UUID) -> None:
+        entry = self.runs.pop(run_id, None)
+        if entry is None:
+            return
+        task, fanout = entry
+        task.cancel()
+        await asyncio.wait((task,))  # releases this connection's subscription
+        # Stop generating unless another client (a second tab, an SSE reconnect) still reads it
+        if fanout is not None and fanout.subscribers == 0:
+            fanout.cancel()
+        await self.send({"type": "end", "run_id": str(run_id), "cancelled": True})
+
+    def close(self) -> None:
+        # Streams left running fall back to the stream cancel grace period, so a reconnect can resume them
+        for task in list(self.tasks):
+            task.cancel()
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    # Browsers send cookies with cross-site WebSocket handshakes and CORS does not apply, so the
+    # origin is checked here
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in ALLOWED_ORIGINS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        user = await get_current_principal(websocket)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    channel = ChatChannel(websocket, user)
+    writer = asyncio.create_task(channel.write())
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                await channel.handle(json.loads(message))
+            except (ValueError, KeyError, TypeError):
+                await channel.send_error({}, status.HTTP_400_BAD_REQUEST, "Invalid frame")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        channel.close()
+        writer.cancel()
@@ -3,34 +3,32 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models.project import Project
 from models.file import ProjectFile
-from models.user import User
-from auth.auth import get_current_user
-from config import openai_client
+from auth.ownership import owned_project
+from config import FILE_FETCH_TIMEOUT_SECONDS
+from services.providers import llm_provider
+from services.resilience import call_provider
+from services.file_store import extract_text, store_file_text
+from services.retrieval import index_project_file
 import uuid
 import sentry_sdk
 
 router = APIRouter()
 
 @router.post("/projects/{project_id}/files")
-def upload_file(project_id: uuid.UUID, uploaded_file: UploadFile = File(...), db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    # Verify project
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(404, "Project not found")
-
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(404, "User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(403, "Not authorized")
-
-    # Upload to OpenAI Files API
+def upload_file(project_id: uuid.UUID, uploaded_file: UploadFile = File(...), db: Session = Depends(get_db), project: Project = Depends(owned_project)):
+    # Upload to the provider's file store
     try:
-        response = openai_client.files.create(
-            file=uploaded_file.file,
-            purpose="assistants"
+        data = uploaded_file.file.read()
+
+        # Extract text once at upload so chat requests never re-download it
+        content_hash = store_file_text(db, data)
+
+        # Creating a file is not idempotent: deadline and breaker, but no retries
+        file_id = call_provider(
+            lambda timeout: llm_provider.upload_file(uploaded_file.filename, data, timeout),
+            FILE_FETCH_TIMEOUT_SECONDS,
+            retries=0,
         )
-        file_id = response.id
 
         # Save in DB
         new_file = ProjectFile(
@@ -38,12 +36,20 @@ def upload_file(project_id: uuid.UUID, uploaded_file: UploadFile = File(...), db
             project_id=project_id,
             filename=uploaded_file.filename,
             file_id=file_id,
-            purpose="answers"
+            purpose="answers",
+            content_hash=content_hash
         )
         db.add(new_file)
         db.commit()
         db.refresh(new_file)
 
+        # Index for retrieval now; if this fails the file is indexed lazily on the next message
+        try:
+            index_project_file(db, new_file, extract_text(data))
+        except Exception as e:
+            db.rollback()
+            sentry_sdk.capture_exception(e)
+
         return {
             "filename": new_file.filename,
             "file_id": new_file.file_id,
@@ -52,5 +58,6 @@ def upload_file(project_id: uuid.UUID, uploaded_file: UploadFile = File(...), db
         }
 
     except Exception as e:
+        db.rollback()
         sentry_sdk.capture_exception(e)
         raise HTTPException(500, f"Failed to upload file: {e}")
@@ -32,7 +32,7 @@ def login(login_request: LoginRequest, response: Response, db: Session = Depends
     user = db.query(User).filter(User.email == login_request.email).first()
     if user and verify_password(login_request.password, user.hashed_password):
         print("Received password:", repr(login_request.password)) # Backend debugging
-        access_token = create_access_token(data={"sub": user.email})
+        access_token = create_access_token(data={"sub": user.email, "uid": str(user.id)})
         
         # Standard cookie
         response.set_cookie(
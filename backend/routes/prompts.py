@@ -1,27 +1,49 @@
-from fastapi import APIRouter, Body, HTTPException, Depends, status, Query
+from fastapi import APIRouter, BackgroundTasks, Body, Header, HTTPException, Depends, Request, Response, status, Query
 from sqlalchemy.orm import Session
-from database import get_db
-from models.prompt import PromptCreate, PromptResponse, Prompt, PromptRun, PromptRunResponse, SendPromptRequest, SendPromptResponse
+from database import get_db, SessionLocal
+from models.prompt import PromptCreate, PromptResponse, Prompt, PromptRun, PromptRunResponse, SendPromptRequest, SendPromptResponse, BatchRunRequest
 from models.project import Project
-from auth.auth import get_current_user
-from models.user import User
-from models.file import ProjectFile
-from llm_client import generate_project_name
-from config import openai_client
+from models.analytics import ProjectUsageResponse, UsagePoint
+from auth.auth import Principal, get_current_principal
+from auth.ownership import load_owned_project, load_owned_prompt, owned_project, owned_prompt
+from llm_client import generate_project_name, chat_completion
+from config import (
+    LLM_MODEL, MESSAGES_PAGE_DEFAULT, MESSAGES_PAGE_MAX, RUN_QUEUE_POLL_SECONDS, RUN_WAIT_MAX_SECONDS,
+    BATCH_MAX_ITEMS, BATCH_DEFAULT_PARALLELISM, BATCH_MAX_PARALLELISM,
+)
+from services.retrieval import build_file_context
+from services.context import assemble_context
+from services.usage import GRANULARITIES, DEFAULT_RANGE, MAX_RANGE, usage_series
+from services.response_cache import request_key, get_cached_response, cache_response
+from services.inflight import single_flight
+from services.stream_resume import StreamCancelled, StreamTrimmed, parse_event_id
+from services.chat_stream import start_stream_run, open_replay
+from services.sse import SSEResponse, delta_frames
+from services.governor import RateLimited
+from services.resilience import ProviderUnavailable
+from services.jobs import notify_enqueued
+from services.batch import prepare_batch, execute_batch_job
+from services.runs import FINISHED_STATUSES, finish_run, load_project_usage, run_page_query
+from services.messages import encode_cursor, message_page_query, build_message_page, version_query, version_etag, etag_matches, changes_query, build_delta
+from services.history import load_history, history_system_prompt, record_turn, fold_history
+import asyncio
+import time
+from contextlib import aclosing
 import uuid
 import sentry_sdk
+from datetime import datetime, timezone
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import json
 
 router = APIRouter()
 
 @router.post("/prompts/", response_model=PromptResponse)
-def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == prompt.project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-    
+def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
+    # Verify project exists and belongs to the user
+    load_owned_project(db, prompt.project_id, user)
+
     try:
         new_prompt = Prompt(
             id=uuid.uuid4(),
@@ -43,40 +65,17 @@ def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db), user_emai
     return new_prompt
 
 @router.get("/projects/{project_id}/prompts", response_model=list[PromptResponse])
-def get_prompts_by_project(project_id: uuid.UUID, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-
-    # Check if user_email matches project owner_id for access control
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this project's prompts")
-
+def get_prompts_by_project(project_id: uuid.UUID, db: Session = Depends(get_db), project: Project = Depends(owned_project)):
     prompts = db.query(Prompt).filter(Prompt.project_id == project_id).all()
     return prompts
 
 @router.put("/prompts/{prompt_id}", response_model=PromptResponse)
-def update_prompt(prompt_id: uuid.UUID, prompt: PromptCreate, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    db_prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    if not db_prompt:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
-    
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == prompt.project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-    
-    # Check if user_email matches project owner_id for access control
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this prompt")
-    
+def update_prompt(prompt: PromptCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal), owned: tuple[Prompt, Project] = Depends(owned_prompt)):
+    db_prompt, project = owned
+    # Moving the prompt needs ownership of the target project too
+    if prompt.project_id != project.id:
+        load_owned_project(db, prompt.project_id, user)
+
     try:
         db_prompt.project_id = prompt.project_id
         db_prompt.name = prompt.name
@@ -94,23 +93,9 @@ def update_prompt(prompt_id: uuid.UUID, prompt: PromptCreate, db: Session = Depe
     return db_prompt
 
 @router.delete("/prompts/{prompt_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_prompt(prompt_id: uuid.UUID, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    db_prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    if not db_prompt:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
-    
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == db_prompt.project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-    
-    # Check if user_email matches project owner_id for access control
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this prompt")
-    
+def delete_prompt(db: Session = Depends(get_db), owned: tuple[Prompt, Project] = Depends(owned_prompt)):
+    db_prompt, _ = owned
+
     try:
         db.delete(db_prompt)
         db.commit()
@@ -122,160 +107,165 @@ def delete_prompt(prompt_id: uuid.UUID, db: Session = Depends(get_db), user_emai
     return
 
 @router.get("/prompts/{prompt_id}", response_model=PromptResponse)
-def get_prompt(prompt_id: uuid.UUID, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    db_prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    if not db_prompt:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
-
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == db_prompt.project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-
-    # Check if user_email matches project owner_id for access control
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this prompt")
-
+def get_prompt(owned: tuple[Prompt, Project] = Depends(owned_prompt)):
+    db_prompt, _ = owned
     return db_prompt
 
-# TODO: Create ORM model for storing prompt run history/logs later
-@router.post("/prompts/{prompt_id}/run", response_model=PromptRunResponse)
-def run_prompt(prompt_id: uuid.UUID, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    db_prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    if not db_prompt:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
-
-    project = db.query(Project).filter(Project.id == db_prompt.project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to run this prompt")
+@router.post("/prompts/{prompt_id}/run", response_model=PromptRunResponse, status_code=status.HTTP_202_ACCEPTED)
+def run_prompt(prompt_id: uuid.UUID, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal), owned: tuple[Prompt, Project] = Depends(owned_prompt)):
+    _, project = owned
 
+    # Queue the run and return at once; a worker assembles the context and calls the model.
+    # Poll GET /runs/{id} (optionally with ?wait=) for the result.
     run_entry = PromptRun(
         id=uuid.uuid4(),
         prompt_id=prompt_id,
         project_id=project.id,
         user_id=user.id,
-        status="pending"
+        model=LLM_MODEL,
+        status="queued"
     )
     db.add(run_entry)
     db.commit()
     db.refresh(run_entry)
+    notify_enqueued()
 
-    # TODO: Change to specific access file as needed
-    # Upload project files to OpenAI if missing file_id
-    try:
-        project_files = db.query(ProjectFile).filter(ProjectFile.project_id == project.id).all()
-        for f in project_files:
-            if not f.file_id:
-                try:
-                    with open(f.local_path, "rb") as file_obj:
-                        uploaded = openai_client.files.create(
-                            file=file_obj,
-                            purpose="assistants"
-                        )
-                        f.file_id = uploaded.id
-                        db.commit()
-                        db.refresh(f)
-                except Exception as e:
-                    sentry_sdk.capture_exception(e)
-                    continue  # skip failed uploads
-
-        # Retrieve contents of all project files
-        file_contents = ""
-        for f in project_files:
-            if f.file_id:
-                try:
-                    content = openai_client.files.content(f.file_id)
-                    if isinstance(content, bytes):
-                        content = content.decode("utf-8")
-                    elif not isinstance(content, str):
-                        content = str(content)
-                    file_contents += content + "\n"
-                except Exception as e:
-                    sentry_sdk.capture_exception(e)
-                    continue  # skip failed retrievals
-
-        # Combine prompt content with file contents
-        full_prompt_content = db_prompt.content + "\n" + file_contents if file_contents else db_prompt.content
-    except Exception as e_fallback:
-        sentry_sdk.capture_exception(e_fallback)
-        full_prompt_content = db_prompt.content  # fallback to just prompt content
-
-    # Call OpenAI API to run the prompt
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo",     
-            messages=[{"role": "user", "content": full_prompt_content}],
-        )
+    return run_entry
 
-        output = response.choices[0].message.content
-        tokens = response.usage.total_tokens if response.usage is not None else None
-        # TODO: Use actual pricing model based on model used
-        cost = (tokens / 1000) * 0.03 if tokens else 0.0  # example cost
+# Batches keep running (and recording their runs) if the client disconnects mid-stream
+_running_batches: set[asyncio.Future] = set()
+
+@router.post("/projects/{project_id}/batch_run")
+async def batch_run(project_id: uuid.UUID, payload: BatchRunRequest, user: Principal = Depends(get_current_principal)):
+    if not payload.items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No items provided")
+    if len(payload.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    parallelism = min(BATCH_DEFAULT_PARALLELISM if payload.parallelism is None else payload.parallelism, BATCH_MAX_PARALLELISM)
+    if parallelism < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="parallelism must be positive")
+
+    # File context is assembled once for the whole batch and every item gets its PromptRun up front
+    def prepare():
+        with SessionLocal() as db:
+            project = load_owned_project(db, project_id, user)
+            try:
+                return prepare_batch(db, project.id, user.id, payload.items)
+            except LookupError:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
 
-        run_entry.output_data = output
-        run_entry.tokens_used = tokens
-        run_entry.cost = cost
-        run_entry.status = "completed"
-        db.commit()
-        db.refresh(run_entry)
+    jobs = await run_in_threadpool(prepare)
 
-    except Exception as e:
-        run_entry.status = "failed"
-        db.commit()
-        db.refresh(run_entry)
-        sentry_sdk.capture_exception(e)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to run prompt via OpenAI API"
-        )
+    results: asyncio.Queue = asyncio.Queue()
+    limit = asyncio.Semaphore(parallelism)
 
-    return run_entry
+    async def run_job(job):
+        async with limit:
+            try:
+                line = await run_in_threadpool(execute_batch_job, job)
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                line = {"index": job.index, "run_id": str(job.run_id), "prompt_id": str(job.prompt_id), "status": "failed"}
+        results.put_nowait(line)
+
+    batch = asyncio.gather(*(run_job(job) for job in jobs))
+    _running_batches.add(batch)
+    batch.add_done_callback(_running_batches.discard)
+
+    # One JSON line per run, in completion order; "index" maps it back to the request
+    async def ndjson():
+        for _ in jobs:
+            yield json.dumps(await results.get()) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.get("/runs/{run_id}", response_model=PromptRunResponse)
+async def get_run(run_id: uuid.UUID, wait: int = Query(0, ge=0, le=RUN_WAIT_MAX_SECONDS), user: Principal = Depends(get_current_principal)):
+    # Long-poll: with wait > 0 the response is held until the run finishes or the wait runs out.
+    # Each check is a short-lived session, so a waiting client never pins a pooled connection.
+    def load_run():
+        with SessionLocal() as db:
+            run = db.get(PromptRun, run_id)
+            if not run:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Run not found")
+            load_owned_project(db, run.project_id, user)
+            return PromptRunResponse.model_validate(run)
+
+    deadline = time.monotonic() + wait
+    run = await run_in_threadpool(load_run)
+    while run.status not in FINISHED_STATUSES and time.monotonic() < deadline:
+        await asyncio.sleep(min(RUN_QUEUE_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+        run = await run_in_threadpool(load_run)
+    return run
 
 
 # basic project-level analytics, expand later for per-user or time-based analytics
-# TODO: check response model later
-@router.get("/analytics/projects/{project_id}/")
-def project_analytics(project_id: uuid.UUID, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-
-    # Check if user_email matches project owner_id for access control
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to access this project")
-
-    runs = db.query(PromptRun).filter(PromptRun.project_id == project_id).all()
-    
-    total_tokens = sum(run.tokens_used or 0 for run in runs)
-    total_cost = sum(run.cost or 0.0 for run in runs)
-    total_runs = len(runs)
-    completed_runs = sum(1 for run in runs if run.status == "completed")
-    failed_runs = sum(1 for run in runs if run.status == "failed")
-    
-    return {
-        "total_runs": total_runs,
-        "completed_runs": completed_runs,
-        "failed_runs": failed_runs,
-        "total_tokens": total_tokens,
-        "total_cost": total_cost,
-        "runs": runs
-    }
+@router.get("/analytics/projects/{project_id}/", response_model=ProjectUsageResponse)
+def project_analytics(project_id: uuid.UUID, db: Session = Depends(get_db), project: Project = Depends(owned_project)):
+    # One row read from the rollup; the runs themselves are paged from /runs
+    return load_project_usage(db, project.id)
+
+@router.get("/analytics/projects/{project_id}/runs", response_model=list[PromptRunResponse])
+def project_runs(
+    project_id: uuid.UUID,
+    response: Response,
+    limit: int = Query(MESSAGES_PAGE_DEFAULT, ge=1, le=MESSAGES_PAGE_MAX),
+    before: str | None = Query(None, description="X-Next-Cursor from the previous page"),
+    db: Session = Depends(get_db),
+    project: Project = Depends(owned_project)
+):
+    try:
+        stmt = run_page_query(project.id, limit, before)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    runs = db.execute(stmt).scalars().all()
+    if len(runs) > limit:
+        runs = runs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(runs[-1].created_at, runs[-1].id)
+    return runs
+
+def _usage_range(granularity: str, start: datetime | None, end: datetime | None, group_by: str, dimensions: tuple[str, ...]):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    groups = tuple(g for g in group_by.split(",") if g)
+    if any(g not in dimensions for g in groups):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"group_by accepts {', '.join(dimensions)}")
+    # Naive timestamps are taken as UTC, like the buckets
+    end = end.replace(tzinfo=end.tzinfo or timezone.utc) if end else datetime.now(timezone.utc)
+    start = start.replace(tzinfo=start.tzinfo or timezone.utc) if start else end - DEFAULT_RANGE[granularity]
+    if start >= end or end - start > MAX_RANGE[granularity]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"range must be positive and at most {MAX_RANGE[granularity].days} days for {granularity} buckets")
+    return start, end, groups
+
+@router.get("/analytics/projects/{project_id}/usage", response_model=list[UsagePoint])
+def project_usage_series(
+    project_id: uuid.UUID,
+    granularity: str = Query("day"),
+    start: datetime | None = Query(None),
+    end: datetime | None = Query(None),
+    group_by: str = Query("", description="comma-separated: user, model"),
+    db: Session = Depends(get_db),
+    project: Project = Depends(owned_project)
+):
+    # Reads pre-aggregated buckets: a 90-day daily chart is ~90 rows per user/model
+    start, end, groups = _usage_range(granularity, start, end, group_by, ("user_id", "model"))
+    return usage_series(db, granularity, start, end, project_id=project.id, group_by=groups)
+
+@router.get("/analytics/users/me/usage", response_model=list[UsagePoint])
+def user_usage_series(
+    granularity: str = Query("day"),
+    start: datetime | None = Query(None),
+    end: datetime | None = Query(None),
+    group_by: str = Query("", description="comma-separated: project_id, model"),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_principal)
+):
+    start, end, groups = _usage_range(granularity, start, end, group_by, ("project_id", "model"))
+    return usage_series(db, granularity, start, end, user_id=user.id, group_by=groups)
 
 @router.post("/projects/{project_id}/send_prompt", response_model=SendPromptResponse)
-def send_project_message(project_id: uuid.UUID, payload: SendPromptRequest = Body(...), db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
+def send_project_message(project_id: uuid.UUID, payload: SendPromptRequest = Body(...), db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     # Get prompt_id from request body
     prompt_id = payload.prompt_id
     if not prompt_id:
@@ -284,21 +274,9 @@ def send_project_message(project_id: uuid.UUID, payload: SendPromptRequest = Bod
             detail="prompt_id is required"
         )
 
-    # Verify project exists
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-
-    # Verify user access
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-
-    # Fetch the prompt
-    prompt = db.query(Prompt).filter(Prompt.id == prompt_id, Prompt.project_id == project.id).first()
-    if not prompt:
+    # Prompt, project and ownership in one query; the prompt must belong to this project
+    prompt, project = load_owned_prompt(db, prompt_id, user)
+    if project.id != project_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prompt not found")
 
     # Create a PromptRun entry
@@ -307,6 +285,7 @@ def send_project_message(project_id: uuid.UUID, payload: SendPromptRequest = Bod
         prompt_id=prompt.id,
         project_id=project.id,
         user_id=user.id,
+        model=LLM_MODEL,
         status="pending",
         output_data=None
     )
@@ -314,42 +293,41 @@ def send_project_message(project_id: uuid.UUID, payload: SendPromptRequest = Bod
     db.commit()
     db.refresh(run_entry)
 
-    # Attach project files if any
-    project_files = db.query(ProjectFile).filter(ProjectFile.project_id == project.id).all()
-    file_contents = ""
-    for f in project_files:
-        if f.file_id:
-            try:
-                content = openai_client.files.content(f.file_id)
-                if isinstance(content, bytes):
-                    content = content.decode("utf-8")
-                elif not isinstance(content, str):
-                    content = str(content)
-                file_contents += content + "\n"
-            except Exception as e:
-                sentry_sdk.capture_exception(e)
-                continue
-
     # Combine prompt content with project files
-    full_prompt = prompt.content + ("\n" + file_contents if file_contents else "")
+    context = assemble_context(LLM_MODEL, prompt.content, build_file_context(db, project.id, prompt.content))
+    run_entry.prompt_tokens = context.prompt_tokens
 
-    # Call OpenAI API
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "user", "content": full_prompt}]
+    cache_key = request_key(db, project.id, LLM_MODEL, context.messages)
+    reply = get_cached_response(cache_key)
+    if reply is not None:
+        finish_run(db, run_entry, "completed", output=reply, tokens=0, cost=0.0, cache_hit=True)
+        db.commit()
+        db.refresh(run_entry)
+        return SendPromptResponse(
+            reply=reply,
+            run_id=run_entry.id,
+            status=run_entry.status,
+            cache_hit=True,
+            created_at=run_entry.created_at,
+            updated_at=run_entry.updated_at
         )
-        reply = response.choices[0].message.content
+
+    # Call OpenAI API; identical concurrent sends wait for one upstream call
+    try:
+        (reply, _), shared = single_flight(cache_key, lambda: chat_completion(context.messages, LLM_MODEL, user.id))
         if reply is None:
             reply = ""
-        run_entry.output_data = reply
-        run_entry.status = "completed"
+        finish_run(db, run_entry, "completed", output=reply, coalesced=shared)
         db.commit()
         db.refresh(run_entry)
+        cache_response(cache_key, reply)
     except Exception as e:
-        run_entry.status = "failed"
+        db.rollback()
+        finish_run(db, run_entry, "failed")
         db.commit()
         db.refresh(run_entry)
+        if isinstance(e, (RateLimited, ProviderUnavailable)):
+            raise  # 429 / 503 with Retry-After
         sentry_sdk.capture_exception(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -360,22 +338,14 @@ def send_project_message(project_id: uuid.UUID, payload: SendPromptRequest = Bod
         reply=reply,
         run_id=run_entry.id,
         status=run_entry.status,
+        cache_hit=run_entry.cache_hit,
+        coalesced=run_entry.coalesced,
         created_at=run_entry.created_at,
         updated_at=run_entry.updated_at
     )
     
 @router.post("/projects/{project_id}/messages", response_model=SendPromptResponse)
-def send_message(project_id: uuid.UUID, payload: dict = Body(...), db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-
+def send_message(project_id: uuid.UUID, background_tasks: BackgroundTasks, payload: dict = Body(...), db: Session = Depends(get_db), user: Principal = Depends(get_current_principal), project: Project = Depends(owned_project)):
     content = payload.get("content")
     if not content:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Content is required")
@@ -397,6 +367,7 @@ def send_message(project_id: uuid.UUID, payload: dict = Body(...), db: Session =
         prompt_id=prompt.id,
         project_id=project.id,
         user_id=user.id,
+        model=LLM_MODEL,
         status="pending",
         input_data=content
     )
@@ -404,43 +375,38 @@ def send_message(project_id: uuid.UUID, payload: dict = Body(...), db: Session =
     db.commit()
     db.refresh(run_entry)
 
-    # Fetch project files if needed
-    file_contents = ""
-    project_files = db.query(ProjectFile).filter(ProjectFile.project_id == project.id).all()
-    for f in project_files:
-        if f.file_id:
-            try:
-                fc = openai_client.files.content(f.file_id)
-                if isinstance(fc, bytes):
-                    fc = fc.decode("utf-8")
-                elif not isinstance(fc, str):
-                    fc = str(fc)
-                file_contents += fc + "\n"
-            except Exception as e:
-                sentry_sdk.capture_exception(e)
-                continue
-
-    # Combine user message with project files
-    full_prompt = content + ("\n" + file_contents if file_contents else "")
+    # Combine recent history, the rolling summary and project files with the user message
+    summary, history = load_history(db, project.id)
+    context = assemble_context(
+        LLM_MODEL,
+        content,
+        build_file_context(db, project.id, content),
+        history=history,
+        system=history_system_prompt(summary)
+    )
+    run_entry.prompt_tokens = context.prompt_tokens
 
     # Call OpenAI API
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "user", "content": full_prompt}]
-        )
-        reply = response.choices[0].message.content or ""
-        run_entry.output_data = reply
-        run_entry.status = "completed"
+        reply, _ = chat_completion(context.messages, LLM_MODEL, user.id)
+        reply = reply or ""
+        finish_run(db, run_entry, "completed", output=reply)
+        record_turn(db, project.id)
         db.commit()
         db.refresh(run_entry)
     except Exception as e:
-        run_entry.status = "failed"
+        db.rollback()
+        finish_run(db, run_entry, "failed")
         db.commit()
         db.refresh(run_entry)
+        if isinstance(e, (RateLimited, ProviderUnavailable)):
+            raise  # 429 / 503 with Retry-After
         sentry_sdk.capture_exception(e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate response")
 
+    # Fold aged-out turns into the summary after the response is sent
+    background_tasks.add_task(fold_history, project.id)
+
     return SendPromptResponse(
         reply=reply,
         run_id=run_entry.id,
@@ -450,146 +416,117 @@ def send_message(project_id: uuid.UUID, payload: dict = Body(...), db: Session =
     )
     
 @router.get("/projects/{project_id}/messages")
-def get_project_messages(project_id: uuid.UUID, db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
-    if project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-
-    runs = db.query(PromptRun).filter(PromptRun.project_id == project.id).all()
-    messages = []
-    for run in runs:
-        if run.input_data:
-            messages.append({
-                "id": run.id,
-                "role": "user",
-                "content": run.input_data
-            })
-        if run.output_data:
-            messages.append({
-                "id": run.id,
-                "role": "assistant",
-                "content": run.output_data
-            })
+def get_project_messages(
+    project_id: uuid.UUID,
+    response: Response,
+    limit: int = Query(MESSAGES_PAGE_DEFAULT, ge=1, le=MESSAGES_PAGE_MAX),
+    before: str | None = Query(None, description="X-Next-Cursor from the previous page"),
+    db: Session = Depends(get_db),
+    project: Project = Depends(owned_project)
+):
+    # Latest page first; older pages via the cursor
+    try:
+        stmt = message_page_query(project.id, limit, before)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    messages, next_cursor = build_message_page(db.execute(stmt).all(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return messages
 
-@router.post("/projects/{project_id}/generate_name")
-def generate_name(project_id: uuid.UUID, payload: dict, db: Session = Depends(get_db)):
-    # Find project
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+@router.get("/projects/{project_id}/messages/since")
+def get_project_message_changes(
+    project_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    cursor: str | None = Query(None, description="cursor from the previous sync; omit to start syncing"),
+    db: Session = Depends(get_db),
+    project: Project = Depends(owned_project)
+):
+    # Unchanged conversation: one index seek and a bodyless 304
+    version = db.execute(version_query(project.id)).first()
+    etag = version_etag(version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    if not cursor:
+        # First sync: hand out the current cursor, the client already has the history
+        return build_delta([], version)
 
+    try:
+        stmt = changes_query(project.id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return build_delta(db.execute(stmt).all(), version)
+
+@router.post("/projects/{project_id}/generate_name")
+def generate_name(project_id: uuid.UUID, payload: dict, db: Session = Depends(get_db), project: Project = Depends(owned_project)):
     messages = payload.get("messages", [])
     if not messages:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No messages provided")
 
     # Call LLM helper
-    new_name = generate_project_name(messages)
+    new_name = generate_project_name(messages, project.owner_id)
     project.name = new_name
     db.commit()
     db.refresh(project)
 
     return {"id": str(project.id), "name": project.name}
 
-# TODO: SSE Streaming works but figure out how to display properly in the frontend
-@router.get("/projects/{project_id}/messages/stream")
-async def stream_message(project_id: uuid.UUID, content: str = Query(...), db: Session = Depends(get_db), user_email: str = Depends(get_current_user)):
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+def sse_events(run_id: uuid.UUID, deltas, after: int = 0, finished=None):
+    async def events():
+        # The run id lets the client key this turn like the rows it fetches later
+        end = {"run_id": str(run_id)}
+        if deltas is None:
+            end["resync"] = True  # buffer gone: the client reloads the turn from the message list
+        else:
+            try:
+                async with aclosing(delta_frames(run_id, deltas, after)) as frames:
+                    async for frame in frames:
+                        yield frame
+            except StreamCancelled:
+                end["cancelled"] = True
+            except StreamTrimmed:
+                end["resync"] = True
+            except Exception:
+                # reported (and the run marked failed) by the task that persists it
+                yield f"data: {json.dumps({'role':'assistant','delta':'[Error generating response]'})}\n\n".encode()
+        if finished is not None:
+            await asyncio.shield(finished)  # the run is saved before the client is told it ended
 
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project or project.owner_id != user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+        # send a custom end event so frontend can close the EventSource & run post-stream logic
+        yield f"event: end\ndata: {json.dumps(end)}\n\n".encode()
 
-    # Save prompt & run
-    prompt = Prompt(id=uuid.uuid4(), project_id=project.id, name="Chat message", content=content)
-    db.add(prompt)
-    db.commit()
-    db.refresh(prompt)
+    return events()
 
-    run_entry = PromptRun(
-        id=uuid.uuid4(),
-        prompt_id=prompt.id,
-        project_id=project.id,
-        user_id=user.id,
-        status="pending",
-        input_data=content
-    )
-    db.add(run_entry)
-    db.commit()
-    db.refresh(run_entry)
 
-    # Collect file contents
-    file_contents = ""
-    for f in db.query(ProjectFile).filter(ProjectFile.project_id == project.id).all():
-        if f.file_id:
-            try:
-                fc = openai_client.files.content(f.file_id)
-                if isinstance(fc, bytes):
-                    fc = fc.decode("utf-8")
-                file_contents += str(fc) + "\n"
-            except Exception:
-                continue
+# TODO: SSE Streaming works but figure out how to display properly in the frontend
+@router.get("/projects/{project_id}/messages/stream")
+async def stream_message(
+    project_id: uuid.UUID,
+    content: str = Query(...),
+    run_id: uuid.UUID | None = Query(None),
+    last_event_id: str | None = Header(None),
+    user: Principal = Depends(get_current_principal),
+):
+    # A reconnect (Last-Event-ID, or ?run_id= to follow a run from the start) replays the run's buffer
+    # and attaches to it live; it never starts a new run or a new upstream call.
+    if last_event_id or run_id:
+        try:
+            resume_run, after = parse_event_id(last_event_id) if last_event_id else (run_id, 0)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Last-Event-ID")
+        try:
+            deltas = await open_replay(project_id, user, resume_run, after)
+        except LookupError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Run not found")
+        return SSEResponse(sse_events(resume_run, deltas, after))
 
-    full_prompt = content + ("\n" + file_contents if file_contents else "")
+    stream = await start_stream_run(project_id, user, content)
 
-    async def event_generator():
-        assistant_content = ""
-        try:
-            # Keep your current pattern: call create(..., stream=True) and iterate
-            completion = openai_client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=[{"role": "user", "content": full_prompt}],
-                stream=True
-            )
-
-            for chunk in completion:
-                try:
-                    choice = chunk.choices[0]
-                except Exception:
-                    continue
-
-                # robustly extract delta
-                delta = None
-                if isinstance(choice, dict):
-                    delta = choice.get("delta")
-                else:
-                    delta = getattr(choice, "delta", None)
-
-                # robustly extract content piece
-                content_piece = None
-                if isinstance(delta, dict):
-                    content_piece = delta.get("content")
-                else:
-                    content_piece = getattr(delta, "content", None)
-
-                if content_piece:
-                    assistant_content += content_piece
-                    # send only the new delta to the client
-                    payload = {"role": "assistant", "delta": content_piece}
-                    yield f"data: {json.dumps(payload)}\n\n"
-
-            # stream finished - persist final output and signal client
-            run_entry.output_data = assistant_content
-            run_entry.status = "completed"
-            db.commit()
-
-            # send a custom end event so frontend can close the EventSource & run post-stream logic
-            yield "event: end\ndata: {}\n\n"
-
-        except Exception as e:
-            # mark failed and return an error delta + end event
-            run_entry.status = "failed"
-            db.commit()
-            sentry_sdk.capture_exception(e)
-            yield f"data: {json.dumps({'role':'assistant','delta':'[Error generating response]'})}\n\n"
-            yield "event: end\ndata: {}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    # Fold aged-out turns into the summary once the stream has finished
+    return SSEResponse(sse_events(stream.run_id, stream.fanout.subscribe(), finished=stream.persisted), background=BackgroundTask(fold_history, project_id))
@@ -0,0 +1,87 @@
+import uuid
+from dataclasses import dataclass
+
+import sentry_sdk
+from sqlalchemy.orm import Session
+
+from config import LLM_MODEL
+from database import SessionLocal
+from models.prompt import Prompt, PromptRun, BatchRunItem
+from services.context import assemble_context
+from services.jobs import complete_run
+from services.retrieval import build_file_context
+from services.runs import finish_run
+
+
+@dataclass
+class BatchJob:
+    index: int
+    run_id: uuid.UUID
+    prompt_id: uuid.UUID
+    messages: list[dict]
+
+
+def batch_content(prompt: Prompt, item: BatchRunItem) -> str:
+    return f"{prompt.content}\n\n{item.input}" if item.input else prompt.content
+
+
+def prepare_batch(db: Session, project_id: uuid.UUID, user_id: uuid.UUID, items: list[BatchRunItem]) -> list[BatchJob]:
+    # One query for the prompts, one retrieval pass for the files, one commit for the runs.
+    # Retrieval ranks against every distinct item at once, so the shared file context covers all of them.
+    prompt_ids = {item.prompt_id for item in items}
+    prompts = {p.id: p for p in db.query(Prompt).filter(Prompt.id.in_(prompt_ids), Prompt.project_id == project_id)}
+    missing = prompt_ids - prompts.keys()
+    if missing:
+        raise LookupError(sorted(str(m) for m in missing))
+
+    contents = [batch_content(prompts[item.prompt_id], item) for item in items]
+    try:
+        files = build_file_context(db, project_id, "\n".join(dict.fromkeys(contents)))
+    except Exception as e_fallback:
+        sentry_sdk.capture_exception(e_fallback)
+        files = []  # fallback to just prompt content
+
+    # Tagged so the items stay out of the conversation: its history, summary and message list
+    batch_id = uuid.uuid4()
+    jobs, runs = [], []
+    for i, (item, content) in enumerate(zip(items, contents)):
+        context = assemble_context(LLM_MODEL, content, files)
+        run = PromptRun(
+            id=uuid.uuid4(),
+            prompt_id=item.prompt_id,
+            project_id=project_id,
+            user_id=user_id,
+            model=LLM_MODEL,
+            status="pending",
+            input_data=item.input,
+            prompt_tokens=context.prompt_tokens,
+            batch_id=batch_id,
+        )
+        runs.append(run)
+        jobs.append(BatchJob(i, run.id, item.prompt_id, context.messages))
+    db.add_all(runs)
+    db.commit()
+    return jobs
+
+
+def execute_batch_job(job: BatchJob) -> dict:
+    # Never raises: a failed item is recorded and reported on its own line, the rest carry on
+    with SessionLocal() as db:
+        run = db.get(PromptRun, job.run_id)
+        try:
+            complete_run(db, run, job.messages)
+        except Exception as e:
+            db.rollback()
+            finish_run(db, run, "failed")
+            db.commit()
+            sentry_sdk.capture_exception(e)
+        return {
+            "index": job.index,
+            "run_id": str(run.id),
+            "prompt_id": str(job.prompt_id),
+            "status": run.status,
+            "output": run.output_data,
+            "tokens_used": run.tokens_used,
+            "cache_hit": run.cache_hit,
+            "coalesced": run.coalesced,
+        }
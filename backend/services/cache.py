@@ -0,0 +1,103 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from config import (
+    FILE_CACHE_MAX_BYTES, FILE_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_BYTES, PRINCIPAL_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS
+)
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    return len(repr(value))
+
+
+class ByteBudgetCache:
+    # LRU bounded by the total size of its values rather than entry count, with per-entry TTL
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[Any, tuple[Any, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Any) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return  # never let one value flush the whole cache
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: Any) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_where(self, predicate: Callable[[Any, Any], bool]) -> None:
+        # For values indexed by something other than their key; a full scan, so keep it off hot paths
+        with self._lock:
+            for key in [k for k, (v, _, _) in self._entries.items() if predicate(k, v)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Any) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Project file text keyed by file_id, shared by every prompt path in this worker
+file_content_cache = ByteBudgetCache(FILE_CACHE_MAX_BYTES, FILE_CACHE_TTL_SECONDS)
+
+# Verified access token -> (Principal, token expiry), so authenticated requests skip the users table
+principal_cache = ByteBudgetCache(PRINCIPAL_CACHE_MAX_BYTES, PRINCIPAL_CACHE_TTL_SECONDS)
+
+# LLM replies keyed by a hash of everything that went into the request (see services/response_cache.py)
+response_cache = ByteBudgetCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS)
@@ -0,0 +1,138 @@
+import asyncio
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import sentry_sdk
+from sqlalchemy import update
+from starlette.concurrency import run_in_threadpool
+
+from auth.auth import Principal
+from auth.ownership import load_owned_project
+from config import LLM_MODEL
+from database import SessionLocal
+from llm_client import reserve_tokens, stream_chat_completion
+from models.prompt import Prompt, PromptRun
+from services.context import assemble_context, count_tokens
+from services.governor import RateLimited, llm_governor
+from services.history import load_history, history_system_prompt, record_turn
+from services.inflight import StreamFanout, join_stream, stream_in_flight, record_stream_outcome
+from services.resilience import ProviderUnavailable, provider_breaker
+from services.response_cache import request_key
+from services.retrieval import build_file_context
+from services.runs import record_run_finished
+from services.stream_resume import stream_buffer
+
+# Streamed chat turns, whatever carries them to the client (SSE or the WebSocket channel): create the
+# run, attach to (or start) the upstream stream, and persist the run when that stream ends.
+
+
+@dataclass
+class StreamRun:
+    run_id: uuid.UUID
+    fanout: StreamFanout
+    persisted: asyncio.Task
+
+
+# Streamed runs are persisted when the upstream stream ends, whether or not their client is still connected
+_persisting_streams: set[asyncio.Task] = set()
+
+
+def persist_stream_run(run: PromptRun, run_status: str, output: str | None, shared: bool = False):
+    # run is detached from the session that created it; write by id rather than re-loading it
+    with SessionLocal() as db:
+        db.execute(update(PromptRun).where(PromptRun.id == run.id).values(output_data=output, status=run_status, coalesced=shared))
+        record_run_finished(db, run, run_status)
+        if run_status == "completed":
+            record_turn(db, run.project_id)
+        db.commit()
+
+
+async def start_stream_run(project_id: uuid.UUID, user: Principal, content: str) -> StreamRun:
+    # Blocking DB work runs in the threadpool so the event loop only ever awaits I/O.
+    # The session is closed before generation starts, so a stream never pins a pooled connection.
+    def prepare_run():
+        # One transaction, and no reloads: the run's columns are all set here, so it stays usable
+        # after the session closes
+        with SessionLocal(expire_on_commit=False) as db:
+            project = load_owned_project(db, project_id, user)
+
+            # Combine recent history, the rolling summary and the relevant project file text
+            summary, history = load_history(db, project.id)
+            context = assemble_context(
+                LLM_MODEL,
+                content,
+                build_file_context(db, project.id, content),
+                history=history,
+                system=history_system_prompt(summary)
+            )
+            key = request_key(db, project.id, LLM_MODEL, context.messages)
+
+            # Save prompt & run
+            prompt = Prompt(id=uuid.uuid4(), project_id=project.id, name="Chat message", content=content)
+            run_entry = PromptRun(
+                id=uuid.uuid4(),
+                prompt_id=prompt.id,
+                project_id=project.id,
+                user_id=user.id,
+                model=LLM_MODEL,
+                status="pending",
+                input_data=content,
+                prompt_tokens=context.prompt_tokens
+            )
+            db.add_all((prompt, run_entry))
+            db.commit()
+            return run_entry, context, key
+
+    run_entry, context, key = await run_in_threadpool(prepare_run)
+
+    # Take the rate-limit lease before anything is sent so an over-limit user gets a plain 429
+    # (or 503 while the provider circuit is open).
+    # A turn that joins a stream already in flight costs nothing upstream.
+    lease = None
+    if not stream_in_flight(key):
+        try:
+            provider_breaker.check()
+            lease = await llm_governor.acquire_async(user.id, reserve_tokens(context.prompt_tokens))
+        except (RateLimited, ProviderUnavailable):
+            await run_in_threadpool(persist_stream_run, run_entry, "failed", None)
+            raise
+
+    # Identical concurrent turns (e.g. the same message sent from two tabs) subscribe to one upstream stream
+    fanout, shared = join_stream(key, lambda: stream_chat_completion(context.messages, LLM_MODEL, lease))
+    if shared and lease:
+        llm_governor.settle(lease, 0)  # lost the race to start it; hand the reservation back
+    stream_buffer.register(run_entry.id, fanout)
+
+    async def persist_when_done():
+        await asyncio.wait((fanout.task,))  # the pump ends cancelled when every client left
+        output = "".join(fanout.chunks)
+        if fanout.cancelled:
+            run_status = "cancelled"
+        elif fanout.error is not None:
+            run_status = "failed"
+            if not shared:
+                sentry_sdk.capture_exception(fanout.error)
+        else:
+            run_status = "completed"
+        if not shared and run_status != "failed":
+            record_stream_outcome(fanout.cancelled, count_tokens(output, LLM_MODEL))
+        await run_in_threadpool(persist_stream_run, run_entry, run_status, output if run_status == "completed" else output or None, shared)
+
+    persisted = asyncio.create_task(persist_when_done())
+    _persisting_streams.add(persisted)
+    persisted.add_done_callback(_persisting_streams.discard)
+    return StreamRun(run_entry.id, fanout, persisted)
+
+
+async def open_replay(project_id: uuid.UUID, user: Principal, run_id: uuid.UUID, after: int) -> AsyncIterator[str] | None:
+    # Deltas of a run after seq `after`, then live ones; None once its buffer has expired.
+    # Raises LookupError if the run is not in the (owned) project.
+    def check_run():
+        with SessionLocal() as db:
+            load_owned_project(db, project_id, user)
+            if not db.query(PromptRun.id).filter(PromptRun.id == run_id, PromptRun.project_id == project_id).first():
+                raise LookupError(run_id)
+
+    await run_in_threadpool(check_run)
+    return await stream_buffer.replay(run_id, after)
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import sentry_sdk
+import tiktoken
+
+from config import MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, LLM_MAX_OUTPUT_TOKENS, CONTEXT_MAX_PROMPT_TOKENS
+
+# Chat framing overhead per message and for the reply primer (OpenAI cookbook figures)
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMER_TOKENS = 3
+CHARS_PER_TOKEN = 4  # fallback estimate when no tokenizer is available
+TOKEN_COUNT_CACHE_SIZE = 4096
+
+
+_encodings: dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def _load_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # BPE files are fetched on first use; estimate rather than fail requests if that is impossible
+        sentry_sdk.capture_exception(e)
+        return None
+
+
+def _get_encoding(model: str):
+    if model not in _encodings:
+        # The first turns after startup arrive together; one of them loads the file, the rest wait
+        with _encodings_lock:
+            if model not in _encodings:
+                _encodings[model] = _load_encoding(model)
+    return _encodings[model]
+
+
+# Keyed by a digest of the text: entries stay a few bytes however large the texts counted
+# (whole files, long histories)
+_token_counts: OrderedDict[tuple[bytes, str], int] = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def count_tokens(text: str, model: str) -> int:
+    key = (hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest(), model)
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        count = -(-len(text) // CHARS_PER_TOKEN)
+    else:
+        count = len(encoding.encode(text, disallowed_special=()))
+
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def message_tokens(messages: list[dict], model: str) -> int:
+    return sum(count_tokens(m["content"], model) + TOKENS_PER_MESSAGE for m in messages) + REPLY_PRIMER_TOKENS
+
+
+def prompt_budget(model: str) -> int:
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return min(window - LLM_MAX_OUTPUT_TOKENS, CONTEXT_MAX_PROMPT_TOKENS)
+
+
+@dataclass
+class AssembledContext:
+    messages: list[dict]
+    prompt_tokens: int
+    dropped: dict = field(default_factory=dict)
+
+
+def assemble_context(
+    model: str,
+    user_content: str,
+    files: list[tuple[str, str]] | None = None,
+    history: list[dict] | None = None,
+    system: str | None = None,
+) -> AssembledContext:
+    # Priority when over budget: the user's message (only truncated if it alone overflows),
+    # then system text, then the most recent history, then files in the order retrieval ranked them
+    budget = prompt_budget(model) - REPLY_PRIMER_TOKENS
+    dropped = {"files": 0, "history": 0, "system_truncated": False, "user_truncated": False}
+
+    user_tokens = count_tokens(user_content, model) + TOKENS_PER_MESSAGE
+    if user_tokens > budget:
+        user_content = truncate_tokens(user_content, budget - TOKENS_PER_MESSAGE, model)
+        user_tokens = budget
+        dropped["user_truncated"] = True
+    remaining = budget - user_tokens
+
+    system_message = None
+    if system:
+        system_tokens = count_tokens(system, model) + TOKENS_PER_MESSAGE
+        if system_tokens > remaining:
+            system = truncate_tokens(system, remaining - TOKENS_PER_MESSAGE, model)
+            system_tokens = count_tokens(system, model) + TOKENS_PER_MESSAGE if system else 0
+            dropped["system_truncated"] = True
+        if system:
+            system_message = {"role": "system", "content": system}
+            remaining -= system_tokens
+
+    kept_history = []
+    for message in reversed(history or []):
+        tokens = count_tokens(message["content"], model) + TOKENS_PER_MESSAGE
+        if tokens > remaining:
+            dropped["history"] = len(history) - len(kept_history)
+            break
+        kept_history.append(message)
+        remaining -= tokens
+    kept_history.reverse()
+    # A cut between a question and its reply would leave the reply without the question it answers
+    while dropped["history"] and kept_history and kept_history[0]["role"] == "assistant":
+        remaining += count_tokens(kept_history.pop(0)["content"], model) + TOKENS_PER_MESSAGE
+        dropped["history"] += 1
+
+    # Files ride on the user message, as they always have
+    file_parts = []
+    for i, (_, text) in enumerate(files or []):
+        tokens = count_tokens(text, model) + 1
+        if tokens > remaining:
+            # Keep a truncated head of the first file that does not fit, drop the rest
+            head = truncate_tokens(text, remaining - 1, model)
+            if head:
+                file_parts.append(head)
+                remaining -= count_tokens(head, model) + 1
+            dropped["files"] = len(files) - i - (1 if head else 0)
+            break
+        file_parts.append(text)
+        remaining -= tokens
+
+    if file_parts:
+        user_content = user_content + "\n" + "".join(part + "\n" for part in file_parts)
+
+    messages = ([system_message] if system_message else []) + kept_history + [{"role": "user", "content": user_content}]
+    return AssembledContext(messages=messages, prompt_tokens=budget - remaining + REPLY_PRIMER_TOKENS, dropped=dropped)
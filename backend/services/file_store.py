@@ -0,0 +1,69 @@
+import hashlib
+import uuid
+
+import sentry_sdk
+from sqlalchemy.orm import Session
+
+from config import FILE_FETCH_TIMEOUT_SECONDS
+from models.file import ProjectFile, FileText
+from services.cache import file_content_cache
+from services.providers import llm_provider
+from services.resilience import call_provider
+
+
+def extract_text(data: bytes) -> str:
+    # Postgres TEXT rejects NUL bytes
+    return data.decode("utf-8", errors="replace").replace("\x00", "")
+
+
+def store_file_text(db: Session, data: bytes) -> str:
+    content_hash = hashlib.sha256(data).hexdigest()
+    if db.get(FileText, content_hash) is None:
+        db.add(FileText(content_hash=content_hash, text=extract_text(data), size_bytes=len(data)))
+    return content_hash
+
+
+def _backfill_file_text(db: Session, f: ProjectFile) -> str | None:
+    # Files uploaded before the local store existed: fetch once, then never again
+    try:
+        data = call_provider(lambda timeout: llm_provider.file_content(f.file_id, timeout), FILE_FETCH_TIMEOUT_SECONDS)
+        f.content_hash = store_file_text(db, data)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        sentry_sdk.capture_exception(e)
+        return None
+    return extract_text(data)
+
+
+def load_file_texts(db: Session, files: list[ProjectFile]) -> dict[str, str]:
+    # Text comes from the in-process cache when hot
+    texts = {f.file_id: file_content_cache.get(f.file_id) for f in files}
+
+    # One local query for every cache miss; no provider round-trips on the chat hot path
+    missing = {f.content_hash for f in files if texts[f.file_id] is None and f.content_hash}
+    if missing:
+        stored = dict(db.query(FileText.content_hash, FileText.text).filter(FileText.content_hash.in_(missing)).all())
+        for f in files:
+            if texts[f.file_id] is None and f.content_hash in stored:
+                texts[f.file_id] = stored[f.content_hash]
+                file_content_cache.set(f.file_id, texts[f.file_id])
+
+    for f in files:
+        if texts[f.file_id] is None and f.file_id and not f.content_hash:
+            texts[f.file_id] = _backfill_file_text(db, f)
+            if texts[f.file_id] is not None:
+                file_content_cache.set(f.file_id, texts[f.file_id])
+    return {file_id: text for file_id, text in texts.items() if text}
+
+
+def load_project_file_texts(db: Session, project_id: uuid.UUID, files: list[ProjectFile] | None = None) -> list[tuple[str, str]]:
+    if files is None:
+        files = (
+            db.query(ProjectFile)
+            .filter(ProjectFile.project_id == project_id)
+            .order_by(ProjectFile.created_at)
+            .all()
+        )
+    texts = load_file_texts(db, files)
+    return [(f.filename, texts[f.file_id]) for f in files if f.file_id in texts]
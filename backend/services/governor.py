@@ -0,0 +1,252 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from config import (
+    LLM_GLOBAL_RPM, LLM_GLOBAL_TPM, LLM_USER_RPM, LLM_USER_TPM,
+    LLM_QUEUE_MAX_DEPTH, LLM_USER_QUEUE_MAX_DEPTH, LLM_QUEUE_TIMEOUT_SECONDS,
+)
+
+RECHECK_SECONDS = 1.0  # backstop only: a waiter is woken when the next lease becomes its turn
+MAX_TRACKED_USERS = 10000
+
+
+class RateLimited(Exception):
+    # Turned into 429 + Retry-After by the app's exception handler
+    def __init__(self, retry_after: float):
+        super().__init__("LLM rate limit exceeded")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0  # disabled
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request larger than the whole bucket only needs a full one, or it could never run
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        # Level may go negative when a settled call used more than it reserved; later calls repay it.
+        # A negative amount is a refund, capped at a full bucket.
+        if self.capacity:
+            self.level = min(self.capacity, self.level - amount)
+
+    def full(self) -> bool:
+        return self.level >= self.capacity
+
+
+@dataclass
+class Lease:
+    user_id: object
+    tokens: int
+
+
+@dataclass(eq=False)
+class _Waiter:
+    user_id: object
+    tokens: int
+    arrived: float
+    queued: bool = True
+    wake: Callable[[], None] | None = None  # async waiters; blocking ones wait on the condition
+
+
+class Governor:
+    # Every outbound LLM call takes a lease first: one request and an estimate of its tokens from the
+    # global buckets and the caller's own. Waiters are served least-recently-served user first, so one
+    # user's burst queues behind itself instead of in front of everyone else.
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.requests = TokenBucket(LLM_GLOBAL_RPM)
+        self.tokens = TokenBucket(LLM_GLOBAL_TPM)
+        self.users: dict[object, tuple[TokenBucket, TokenBucket]] = {}
+        self.queues: dict[object, deque[_Waiter]] = {}
+        self.last_served: dict[object, float] = {}
+        self.depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queued_admissions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _user_buckets(self, user_id) -> tuple[TokenBucket, TokenBucket] | None:
+        if user_id is None:
+            return None  # background work (summaries) only counts against the global limits
+        buckets = self.users.get(user_id)
+        if buckets is None:
+            if len(self.users) >= MAX_TRACKED_USERS:
+                # Users whose buckets have refilled carry no state worth keeping
+                for key in [k for k, (r, t) in self.users.items() if r.full() and t.full() and k not in self.queues]:
+                    del self.users[key]
+            buckets = self.users[user_id] = (TokenBucket(LLM_USER_RPM), TokenBucket(LLM_USER_TPM))
+        return buckets
+
+    def _user_delay(self, w: _Waiter, now: float) -> float:
+        buckets = self._user_buckets(w.user_id)
+        if buckets is None:
+            return 0.0
+        requests, tokens = buckets
+        return max(requests.wait_time(1, now), tokens.wait_time(w.tokens, now))
+
+    def _global_delay(self, w: _Waiter, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(w.tokens, now))
+
+    def _enter(self, user_id, tokens: int) -> _Waiter:
+        queue = self.queues.get(user_id)
+        if self.depth >= LLM_QUEUE_MAX_DEPTH or (queue and len(queue) >= LLM_USER_QUEUE_MAX_DEPTH):
+            self.rejected += 1
+            # Roughly how long until the backlog ahead drains at the request rate that is full
+            backlog, rate = (self.depth, LLM_GLOBAL_RPM) if self.depth >= LLM_QUEUE_MAX_DEPTH else (len(queue), LLM_USER_RPM)
+            raise RateLimited(60 * backlog / rate if rate else LLM_QUEUE_TIMEOUT_SECONDS)
+        w = _Waiter(user_id, tokens, time.monotonic())
+        self.queues.setdefault(user_id, deque()).append(w)
+        self.depth += 1
+        return w
+
+    def _leave(self, w: _Waiter) -> None:
+        if not w.queued:
+            return
+        w.queued = False
+        queue = self.queues[w.user_id]
+        queue.remove(w)
+        if not queue:
+            del self.queues[w.user_id]
+        self.depth -= 1
+        self._notify()
+
+    def _turn(self, now: float) -> _Waiter | None:
+        # The waiter the next lease goes to, once the global buckets allow it
+        heads = sorted((q[0] for q in self.queues.values()), key=lambda h: (self.last_served.get(h.user_id, 0.0), h.arrived))
+        return next((h for h in heads if self._user_delay(h, now) == 0), None)
+
+    def _notify(self) -> None:
+        # A lease was granted, given up or settled, so the turn may have moved. Only the waiter whose
+        # turn it is gets woken: waking every async waiter costs a sort of the queue heads each.
+        self.cond.notify_all()
+        turn = self._turn(time.monotonic()) if self.queues else None
+        if turn is not None and turn.wake is not None:
+            turn.wake()
+
+    def _try_admit(self, w: _Waiter, now: float) -> float:
+        # 0 once w holds its lease; otherwise about how long until it might
+        if self._turn(now) is not w:
+            # A waiter that becomes eligible as its own buckets refill wakes itself; one that is
+            # passed the turn by another's lease is woken by _notify
+            if self.queues[w.user_id][0] is not w:
+                return max(self._user_delay(w, now), RECHECK_SECONDS)
+            return self._user_delay(w, now) or RECHECK_SECONDS
+        delay = self._global_delay(w, now)
+        if delay:
+            return delay
+
+        self.requests.take(1)
+        self.tokens.take(w.tokens)
+        buckets = self._user_buckets(w.user_id)
+        if buckets:
+            buckets[0].take(1)
+            buckets[1].take(w.tokens)
+        self.last_served[w.user_id] = now
+        if len(self.last_served) > MAX_TRACKED_USERS:
+            self.last_served = {k: v for k, v in self.last_served.items() if k in self.queues}
+
+        waited = now - w.arrived
+        self.admitted += 1
+        if waited > 0.001:
+            self.queued_admissions += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self._leave(w)
+        return 0.0
+
+    def acquire(self, user_id, tokens: int) -> Lease:
+        # Blocking form for threadpool callers
+        with self.cond:
+            w = self._enter(user_id, tokens)
+            deadline = w.arrived + LLM_QUEUE_TIMEOUT_SECONDS
+            while True:
+                now = time.monotonic()
+                delay = self._try_admit(w, now)
+                if not delay:
+                    return Lease(user_id, tokens)
+                if now >= deadline:
+                    self._give_up(w)
+                    raise RateLimited(delay)
+                self.cond.wait(min(delay, deadline - now))
+
+    async def acquire_async(self, user_id, tokens: int) -> Lease:
+        # Event-loop form: never blocks the loop for longer than a lock hold
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        with self.cond:
+            w = self._enter(user_id, tokens)
+            # Settles and admissions can happen on threadpool threads
+            w.wake = lambda: loop.call_soon_threadsafe(woken.set)
+        deadline = w.arrived + LLM_QUEUE_TIMEOUT_SECONDS
+        try:
+            while True:
+                woken.clear()  # before the check, so a wake-up during it is not lost
+                with self.cond:
+                    now = time.monotonic()
+                    delay = self._try_admit(w, now)
+                    if not delay:
+                        return Lease(user_id, tokens)
+                    if now >= deadline:
+                        self._give_up(w)
+                        raise RateLimited(delay)
+                try:
+                    async with asyncio.timeout(min(delay, deadline - now)):
+                        await woken.wait()
+                except TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self.cond:
+                self._leave(w)
+            raise
+
+    def _give_up(self, w: _Waiter) -> None:
+        self.timed_out += 1
+        self._leave(w)
+
+    def settle(self, lease: Lease, actual_tokens: int | None) -> None:
+        # Swap the reservation for what the call really used; None keeps the estimate
+        if actual_tokens is None:
+            return
+        with self.cond:
+            difference = actual_tokens - lease.tokens
+            self.tokens.take(difference)
+            buckets = self._user_buckets(lease.user_id)
+            if buckets:
+                buckets[1].take(difference)
+            self._notify()
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "queue_depth": self.depth,
+                "queued_users": len(self.queues),
+                "admitted": self.admitted,
+                "queued_admissions": self.queued_admissions,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_wait_ms": round(1000 * self.total_wait / self.admitted, 2) if self.admitted else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 2),
+                "global_requests_available": round(self.requests.level, 2),
+                "global_tokens_available": round(self.tokens.level),
+            }
+
+
+llm_governor = Governor()
@@ -0,0 +1,109 @@
+import uuid
+
+import sentry_sdk
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import HISTORY_VERBATIM_TURNS, HISTORY_SUMMARY_BATCH
+from database import SessionLocal
+from llm_client import summarize_conversation
+from models.prompt import PromptRun
+from models.summary import ConversationSummary
+
+
+def _turn_messages(runs: list[PromptRun]) -> list[dict]:
+    messages = []
+    for run in runs:
+        messages.append({"role": "user", "content": run.input_data})
+        if run.output_data:
+            messages.append({"role": "assistant", "content": run.output_data})
+    return messages
+
+
+def _chat_turns(db: Session, project_id: uuid.UUID):
+    return db.query(PromptRun).filter(
+        PromptRun.project_id == project_id,
+        PromptRun.status == "completed",
+        PromptRun.input_data.isnot(None),
+        PromptRun.batch_id.is_(None),
+    )
+
+
+def load_history(db: Session, project_id: uuid.UUID) -> tuple[str | None, list[dict]]:
+    # Two bounded reads per turn however long the conversation is: the summary row and the unsummarized tail
+    summary = db.get(ConversationSummary, project_id)
+    window = min(summary.pending_turns, HISTORY_VERBATIM_TURNS + HISTORY_SUMMARY_BATCH) if summary else HISTORY_VERBATIM_TURNS
+    if window <= 0:
+        return (summary.summary or None) if summary else None, []
+
+    runs = (
+        _chat_turns(db, project_id)
+        .order_by(PromptRun.created_at.desc(), PromptRun.id.desc())
+        .limit(window)
+        .all()
+    )
+    runs.reverse()
+    return (summary.summary or None) if summary else None, _turn_messages(runs)
+
+
+def history_system_prompt(summary: str | None) -> str | None:
+    if not summary:
+        return None
+    return f"Summary of the earlier conversation:\n{summary}"
+
+
+def record_turn(db: Session, project_id: uuid.UUID) -> None:
+    # Runs inside the caller's transaction so the counter moves with the completed run
+    increment = (
+        update(ConversationSummary)
+        .where(ConversationSummary.project_id == project_id)
+        .values(pending_turns=ConversationSummary.pending_turns + 1)
+    )
+    if db.execute(increment).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(ConversationSummary(project_id=project_id, summary="", pending_turns=1, version=0))
+    except IntegrityError:
+        db.execute(increment)  # another request created the row first
+
+
+def fold_history(project_id: uuid.UUID) -> None:
+    # Background step: once enough turns age out of the window, fold the oldest batch into the summary
+    db = SessionLocal()
+    try:
+        summary = db.get(ConversationSummary, project_id)
+        if not summary or summary.pending_turns < HISTORY_VERBATIM_TURNS + HISTORY_SUMMARY_BATCH:
+            return
+
+        query = _chat_turns(db, project_id)
+        if summary.summarized_until_id is not None:
+            query = query.filter(or_(
+                PromptRun.created_at > summary.summarized_until_created_at,
+                and_(PromptRun.created_at == summary.summarized_until_created_at, PromptRun.id > summary.summarized_until_id),
+            ))
+        runs = query.order_by(PromptRun.created_at, PromptRun.id).limit(HISTORY_SUMMARY_BATCH).all()
+        if not runs:
+            return
+
+        new_summary = summarize_conversation(summary.summary, _turn_messages(runs))
+
+        # Only one fold wins if two workers raced on the same batch
+        db.execute(
+            update(ConversationSummary)
+            .where(ConversationSummary.project_id == project_id, ConversationSummary.version == summary.version)
+            .values(
+                summary=new_summary,
+                summarized_until_created_at=runs[-1].created_at,
+                summarized_until_id=runs[-1].id,
+                pending_turns=ConversationSummary.pending_turns - len(runs),
+                version=summary.version + 1,
+            )
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        sentry_sdk.capture_exception(e)
+    finally:
+        db.close()
@@ -0,0 +1,190 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Callable, TypeVar
+
+from config import LLM_SINGLE_FLIGHT_ENABLED, LLM_MAX_OUTPUT_TOKENS, STREAM_BUFFER_MAX_DELTAS, STREAM_CANCEL_GRACE_SECONDS
+
+# In-flight registries are per process: duplicates landing on other workers make their own call
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+_calls: dict[str, _Call] = {}
+_calls_lock = threading.Lock()
+
+
+def single_flight(key: str | None, fn: Callable[[], T]) -> tuple[T, bool]:
+    # Blocking handlers run in the threadpool: the first caller for a key runs fn, the rest wait for
+    # its result (or its exception). Returns (result, shared) where shared means another caller paid.
+    if key is None or not LLM_SINGLE_FLIGHT_ENABLED:
+        return fn(), False
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    try:
+        call.result = fn()
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+    return call.result, False
+
+
+class StreamFanout:
+    # One upstream token stream replayed to every subscriber; late joiners get the buffered prefix first.
+    # The pump runs as its own task, so a subscriber disconnecting never cuts the stream for the others.
+    # Once the last subscriber has been gone for STREAM_CANCEL_GRACE_SECONDS (long enough for an
+    # EventSource to reconnect) the pump is cancelled, which closes the provider connection.
+
+    def __init__(self, key: str | None):
+        self.key = key
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.task: asyncio.Task | None = None
+        self.subscribers = 0
+        self.cancelled = False
+        self._changed = asyncio.Event()
+        self._idle_timer: asyncio.TimerHandle | None = None
+
+    def _notify(self) -> None:
+        # Waiters hold the old event; swapping in a fresh one re-arms it without a lost wake-up
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for piece in source:
+                if len(self.chunks) >= STREAM_BUFFER_MAX_DELTAS:
+                    raise RuntimeError("stream exceeded the delta buffer")
+                self.chunks.append(piece)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            if _streams.get(self.key) is self:
+                del _streams[self.key]
+            self._notify()
+
+    def _attach(self) -> None:
+        self.subscribers += 1
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _detach(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done and STREAM_CANCEL_GRACE_SECONDS >= 0:
+            self._idle_timer = asyncio.get_running_loop().call_later(STREAM_CANCEL_GRACE_SECONDS, self._cancel_if_idle)
+
+    def _cancel_if_idle(self) -> None:
+        self._idle_timer = None
+        if self.subscribers == 0:
+            self.cancel()
+
+    def cancel(self) -> None:
+        # Stop generating now; the pump's cancellation closes the provider connection
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        if not self.done:
+            self.cancelled = True
+            self.task.cancel()
+
+    async def subscribe(self, start: int = 0, counted: bool = True) -> AsyncIterator[str]:
+        # start skips deltas the subscriber already has (a resumed SSE connection). Only counted
+        # subscribers (clients) keep the stream alive; internal readers pass counted=False.
+        i = start
+        if counted:
+            self._attach()
+        try:
+            while True:
+                if i < len(self.chunks):
+                    i += 1
+                    yield self.chunks[i - 1]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            if counted:
+                self._detach()
+
+
+_streams: dict[str, StreamFanout] = {}
+
+
+def stream_in_flight(key: str | None) -> bool:
+    return key is not None and LLM_SINGLE_FLIGHT_ENABLED and key in _streams
+
+
+def join_stream(key: str | None, start: Callable[[], AsyncIterator[str]]) -> tuple[StreamFanout, bool]:
+    # Attach to the running stream for key, or start one. Returns (fanout, shared).
+    if key is not None and LLM_SINGLE_FLIGHT_ENABLED:
+        fanout = _streams.get(key)
+        if fanout is not None:
+            return fanout, True
+
+    fanout = StreamFanout(key)
+    if key is not None and LLM_SINGLE_FLIGHT_ENABLED:
+        _streams[key] = fanout
+    fanout.task = asyncio.create_task(fanout._pump(start()))
+    return fanout, False
+
+
+_outcomes = {"completed": 0, "completion_tokens": 0, "cancelled": 0, "tokens_saved": 0, "unestimated": 0, "unestimated_tokens": 0}
+
+
+def record_stream_outcome(cancelled: bool, tokens: int) -> None:
+    # Once per upstream stream. Saved tokens are estimated from the mean length of the replies that
+    # ran to completion, since the provider never says how long a cancelled one would have been.
+    # Cancellations seen before any stream completed are estimated when the stats are read.
+    if not cancelled:
+        _outcomes["completed"] += 1
+        _outcomes["completion_tokens"] += tokens
+        return
+    _outcomes["cancelled"] += 1
+    if _outcomes["completed"]:
+        _outcomes["tokens_saved"] += max(_mean_completion_tokens() - tokens, 0)
+    else:
+        _outcomes["unestimated"] += 1
+        _outcomes["unestimated_tokens"] += tokens
+
+
+def _mean_completion_tokens() -> int:
+    # Until a stream has completed, the most a cancelled one could have run to
+    if not _outcomes["completed"]:
+        return LLM_MAX_OUTPUT_TOKENS
+    return _outcomes["completion_tokens"] // _outcomes["completed"]
+
+
+def inflight_stats() -> dict:
+    unestimated = max(_outcomes["unestimated"] * _mean_completion_tokens() - _outcomes["unestimated_tokens"], 0)
+    return {
+        "calls": len(_calls),
+        "streams": len(_streams),
+        "cancelled_streams": _outcomes["cancelled"],
+        "tokens_saved": _outcomes["tokens_saved"] + unestimated,
+    }
@@ -0,0 +1,189 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import sentry_sdk
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from config import LLM_MODEL, RUN_WORKERS, RUN_QUEUE_POLL_SECONDS, RUN_LEASE_SECONDS
+from database import SessionLocal
+from llm_client import chat_completion
+from models.prompt import Prompt, PromptRun
+from services.context import assemble_context
+from services.inflight import single_flight
+from services.response_cache import request_key, get_cached_response, cache_response
+from services.retrieval import build_file_context
+from services.runs import finish_run
+
+# prompt_runs is the queue: a queued row is a job, claiming it is a conditional status update, so any
+# number of API processes and standalone workers can share it without a broker
+
+# Wakes local workers as soon as a job is enqueued; workers in other processes find it on their next poll
+_wakeup = threading.Semaphore(0)
+
+
+def notify_enqueued() -> None:
+    _wakeup.release()
+
+
+def requeue_stale_runs() -> int:
+    # A worker that died mid-run leaves its job running; hand it to someone else once the lease lapses
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=RUN_LEASE_SECONDS)
+    with SessionLocal() as db:
+        count = db.execute(
+            update(PromptRun)
+            .where(PromptRun.status == "running", PromptRun.updated_at < cutoff)
+            .values(status="queued")
+        ).rowcount
+        db.commit()
+    return count
+
+
+def claim_next_run() -> uuid.UUID | None:
+    with SessionLocal() as db:
+        run_id = db.scalar(
+            select(PromptRun.id)
+            .where(PromptRun.status == "queued")
+            .order_by(PromptRun.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if run_id is None:
+            return None
+        # The status check keeps the claim exclusive where SKIP LOCKED is unavailable (SQLite)
+        claimed = db.execute(
+            update(PromptRun)
+            .where(PromptRun.id == run_id, PromptRun.status == "queued")
+            .values(status="running", updated_at=datetime.now(timezone.utc))
+        ).rowcount
+        db.commit()
+    return run_id if claimed else None
+
+
+def complete_run(db: Session, run: PromptRun, messages: list[dict]) -> None:
+    # Model call for a run whose context is assembled; commits the finished run, raises on failure.
+    # Identical input to an earlier run (prompt, file set, model) replays its reply.
+    key = request_key(db, run.project_id, LLM_MODEL, messages)
+    cached = get_cached_response(key)
+    if cached is not None:
+        finish_run(db, run, "completed", output=cached, tokens=0, cost=0.0, cache_hit=True)
+        db.commit()
+        return
+
+    # Identical concurrent runs wait for one upstream call
+    (output, tokens), shared = single_flight(key, lambda: chat_completion(messages, LLM_MODEL, run.user_id))
+    if shared:
+        tokens = 0  # the run that made the call carries the spend
+    # TODO: Use actual pricing model based on model used
+    cost = (tokens / 1000) * 0.03 if tokens else 0.0  # example cost
+
+    finish_run(db, run, "completed", output=output, tokens=tokens, cost=cost, coalesced=shared)
+    db.commit()
+    cache_response(key, output)
+
+
+def execute_run(run_id: uuid.UUID) -> None:
+    with SessionLocal() as db:
+        run = db.get(PromptRun, run_id)
+        prompt = db.get(Prompt, run.prompt_id) if run else None
+        if prompt is None:
+            if run:
+                finish_run(db, run, "failed")  # prompt deleted while the run was queued
+                db.commit()
+            return
+        try:
+            # Assemble prompt content with the relevant project file text within the model's token budget
+            try:
+                context = assemble_context(LLM_MODEL, prompt.content, build_file_context(db, run.project_id, prompt.content))
+            except Exception as e_fallback:
+                sentry_sdk.capture_exception(e_fallback)
+                context = assemble_context(LLM_MODEL, prompt.content)  # fallback to just prompt content
+            run.prompt_tokens = context.prompt_tokens
+
+            complete_run(db, run, context.messages)
+        except Exception as e:
+            db.rollback()
+            finish_run(db, run, "failed")
+            db.commit()
+            sentry_sdk.capture_exception(e)
+
+
+def fail_stranded_run(run_id: uuid.UUID) -> None:
+    # execute_run raised past its own failure handling (e.g. the DB connection dropped): settle the
+    # run unless it got as far as a final status
+    with SessionLocal() as db:
+        run = db.get(PromptRun, run_id)
+        if run is not None and run.status == "running":
+            finish_run(db, run, "failed")
+            db.commit()
+
+
+class WorkerPool:
+    # Bounded: at most `size` runs execute at once per process, the rest wait in the table
+
+    def __init__(self, size: int = RUN_WORKERS):
+        self.size = size
+        self.stop_event = threading.Event()
+        self.threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.size):
+            thread = threading.Thread(target=self._work, name=f"run-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        # Jobs still running are left to the lease and picked up again elsewhere
+        self.stop_event.set()
+        for _ in self.threads:
+            _wakeup.release()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def _work(self) -> None:
+        last_requeue = 0.0
+        while not self.stop_event.is_set():
+            try:
+                if time.monotonic() - last_requeue > RUN_LEASE_SECONDS / 4:
+                    last_requeue = time.monotonic()
+                    requeue_stale_runs()
+                run_id = claim_next_run()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                run_id = None
+            if run_id is None:
+                _wakeup.acquire(timeout=RUN_QUEUE_POLL_SECONDS)
+                continue
+            try:
+                execute_run(run_id)
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                try:
+                    fail_stranded_run(run_id)
+                except Exception as e_settle:
+                    # Still failing; the lease lapses and the run is requeued
+                    sentry_sdk.capture_exception(e_settle)
+                    self.stop_event.wait(RUN_QUEUE_POLL_SECONDS)
+
+    def stats(self) -> dict:
+        return {"workers": sum(t.is_alive() for t in self.threads)}
+
+
+worker_pool = WorkerPool()
+
+
+if __name__ == "__main__":
+    # Standalone worker process, e.g. with RUN_WORKERS=0 on the API servers.
+    # Foreign keys resolve by table name, so every referenced model must be registered.
+    import models.user, models.project  # noqa: F401
+
+    worker_pool = WorkerPool(max(RUN_WORKERS, 1))
+    worker_pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        worker_pool.stop()
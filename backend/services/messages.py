@@ -0,0 +1,107 @@
+import base64
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Select, and_, or_, select
+
+from config import MESSAGES_SYNC_LOOKBACK_SECONDS, MESSAGES_PAGE_MAX
+from models.prompt import PromptRun
+
+# Chat history pages are keyset-paginated on (created_at, id), served newest-first by
+# ix_prompt_runs_project_created_id, so page N costs the same as page 1 however long the conversation is.
+
+
+def encode_cursor(created_at: datetime, run_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{run_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    # Raises ValueError on anything that is not a cursor we issued
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    created_at, run_id = raw.split("|")
+    return datetime.fromisoformat(created_at), uuid.UUID(run_id)
+
+
+def message_page_query(project_id: uuid.UUID, limit: int, before: str | None = None) -> Select:
+    # Only the columns the chat view renders; one extra row tells us whether an older page exists
+    stmt = select(PromptRun.id, PromptRun.input_data, PromptRun.output_data, PromptRun.created_at).where(
+        PromptRun.project_id == project_id,
+        PromptRun.batch_id.is_(None),  # batch items are not part of the conversation
+    )
+    if before:
+        created_at, run_id = decode_cursor(before)
+        stmt = stmt.where(or_(
+            PromptRun.created_at < created_at,
+            and_(PromptRun.created_at == created_at, PromptRun.id < run_id),
+        ))
+    return stmt.order_by(PromptRun.created_at.desc(), PromptRun.id.desc()).limit(limit + 1)
+
+
+def _run_messages(runs) -> list[dict]:
+    messages = []
+    for run in runs:
+        if run.input_data:
+            messages.append({"id": run.id, "role": "user", "content": run.input_data})
+        if run.output_data:
+            messages.append({"id": run.id, "role": "assistant", "content": run.output_data})
+    return messages
+
+
+def build_message_page(rows, limit: int) -> tuple[list[dict], str | None]:
+    # Rows arrive newest-first; the page goes out oldest-first, ready to render
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+    return _run_messages(reversed(page)), next_cursor
+
+
+# Delta sync keys on (updated_at, id) instead, served by ix_prompt_runs_project_updated_id. The
+# conversation's version is its most recently changed run; it doubles as the ETag.
+
+def version_query(project_id: uuid.UUID) -> Select:
+    return (
+        select(PromptRun.updated_at, PromptRun.id)
+        .where(PromptRun.project_id == project_id, PromptRun.batch_id.is_(None))
+        .order_by(PromptRun.updated_at.desc(), PromptRun.id.desc())
+        .limit(1)
+    )
+
+
+def version_cursor(version) -> str:
+    # An empty conversation still gets a cursor, so its first message shows up in the next sync
+    if not version:
+        return encode_cursor(datetime(1970, 1, 1, tzinfo=timezone.utc), uuid.UUID(int=0))
+    return encode_cursor(version.updated_at, version.id)
+
+
+def version_etag(version) -> str:
+    return f'"{version_cursor(version)}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(","))
+
+
+def changes_query(project_id: uuid.UUID, since: str) -> Select:
+    # Rows stamped just before the cursor may commit just after it was issued, so re-send a short
+    # lookback window; clients merge by (id, role) and repeats are harmless
+    updated_at, _ = decode_cursor(since)
+    return (
+        select(PromptRun.id, PromptRun.input_data, PromptRun.output_data, PromptRun.created_at, PromptRun.updated_at)
+        .where(
+            PromptRun.project_id == project_id,
+            PromptRun.batch_id.is_(None),
+            PromptRun.updated_at > updated_at - timedelta(seconds=MESSAGES_SYNC_LOOKBACK_SECONDS),
+        )
+        .order_by(PromptRun.updated_at, PromptRun.id)
+        .limit(MESSAGES_PAGE_MAX + 1)
+    )
+
+
+def build_delta(rows, version) -> dict:
+    # Too many changes to ship as a delta: the client reloads the latest page instead
+    if len(rows) > MESSAGES_PAGE_MAX:
+        return {"reset": True, "messages": [], "cursor": None}
+    runs = sorted(rows, key=lambda r: (r.created_at, r.id))
+    return {"reset": False, "messages": _run_messages(runs), "cursor": version_cursor(version)}
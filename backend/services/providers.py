@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Protocol
+
+from openai import OpenAI, AsyncOpenAI
+
+from config import (
+    LLM_PROVIDER, OPENAI_API_KEY, LLM_TIMEOUT_SECONDS, LLM_STREAM_TOTAL_SECONDS,
+    FAKE_LLM_TTFT_MS, FAKE_LLM_TOKENS_PER_SEC, FAKE_LLM_COMPLETION_TOKENS, FAKE_LLM_ERROR_RATE,
+    FAKE_LLM_JITTER_MS, FAKE_LLM_SEED,
+)
+from services.context import count_tokens, message_tokens
+
+# Everything the backend asks of a model vendor. Deadlines, retries, the circuit breaker and rate
+# limits live in llm_client/resilience and wrap whichever provider LLM_PROVIDER selects.
+
+
+class ProviderError(Exception):
+    # A transient failure of a provider without its own exception types; retried like a 5xx
+    pass
+
+
+@dataclass
+class Completion:
+    content: str | None
+    total_tokens: int | None  # None when the provider reported no usage
+
+
+class LLMProvider(Protocol):
+    name: str
+
+    def complete(self, messages: list[dict], model: str, timeout: float, max_tokens: int | None = None) -> Completion: ...
+
+    def stream(self, messages: list[dict], model: str, timeout: float) -> AsyncIterator[str]: ...
+
+    def upload_file(self, filename: str, data: bytes, timeout: float) -> str: ...
+
+    def file_content(self, file_id: str, timeout: float) -> bytes: ...
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key: str | None):
+        # Retries and deadlines are applied by services/resilience.py, so the SDK's own are turned off
+        self.client = OpenAI(api_key=api_key, max_retries=0, timeout=LLM_TIMEOUT_SECONDS)
+        # Async client for the streaming paths so token reads never block the event loop
+        self.async_client = AsyncOpenAI(api_key=api_key, max_retries=0, timeout=LLM_STREAM_TOTAL_SECONDS)
+
+    def complete(self, messages, model, timeout, max_tokens=None) -> Completion:
+        params = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        response = self.client.chat.completions.create(model=model, messages=messages, timeout=timeout, **params)
+        usage = response.usage.total_tokens if response.usage is not None else None
+        return Completion(response.choices[0].message.content, usage)
+
+    async def stream(self, messages, model, timeout) -> AsyncIterator[str]:
+        # SSE lines are parsed directly; building SDK models per chunk dominates CPU at hundreds of streams
+        async with self.async_client.chat.completions.with_streaming_response.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            timeout=timeout,
+        ) as response:
+            async for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                content_piece = extract_delta(json.loads(data))
+                if content_piece:
+                    yield content_piece
+
+    def upload_file(self, filename, data, timeout) -> str:
+        return self.client.files.create(file=(filename, data), purpose="assistants", timeout=timeout).id
+
+    def file_content(self, file_id, timeout) -> bytes:
+        return self.client.files.content(file_id, timeout=timeout).read()
+
+
+def extract_delta(chunk) -> str | None:
+    # Streamed chunks may arrive as SDK objects or plain dicts
+    try:
+        choice = chunk["choices"][0] if isinstance(chunk, dict) else chunk.choices[0]
+    except Exception:
+        return None
+
+    if isinstance(choice, dict):
+        delta = choice.get("delta")
+    else:
+        delta = getattr(choice, "delta", None)
+
+    if isinstance(delta, dict):
+        return delta.get("content")
+    return getattr(delta, "content", None)
+
+
+FAKE_WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor")
+FAKE_TICK_SECONDS = 0.01  # tokens due within a tick are sent together, as they would arrive off a socket
+
+
+class FakeProvider:
+    # In-process stand-in for load tests and capacity planning: no network, no bill. The reply is a
+    # function of the messages and FAKE_LLM_SEED, so caching and coalescing behave as with a real model.
+    # Timing and failures come from one seeded sequence, so a single-process run replays exactly.
+    name = "fake"
+
+    def __init__(
+        self,
+        ttft_ms: float = FAKE_LLM_TTFT_MS,
+        tokens_per_sec: float = FAKE_LLM_TOKENS_PER_SEC,
+        completion_tokens: int = FAKE_LLM_COMPLETION_TOKENS,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        jitter_ms: float = FAKE_LLM_JITTER_MS,
+        seed: int = FAKE_LLM_SEED,
+    ):
+        self.ttft = ttft_ms / 1000
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.jitter = jitter_ms / 1000
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.files: dict[str, bytes] = {}  # per process, like everything else about this provider
+
+    def _attempt(self) -> float:
+        # Time to first token for this call, or a ProviderError for the injected share of calls
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            jitter = self.random.uniform(0, self.jitter)
+        if failed:
+            raise ProviderError("injected fake provider failure")
+        return self.ttft + jitter
+
+    def _tokens(self, messages: list[dict], max_tokens: int | None) -> list[str]:
+        digest = hashlib.sha256(json.dumps([self.seed, messages], sort_keys=True).encode()).digest()
+        words = random.Random(digest).choices(FAKE_WORDS, k=min(self.completion_tokens, max_tokens or self.completion_tokens))
+        return [f" {w}" for w in words]
+
+    def _duration(self, n_tokens: int) -> float:
+        return n_tokens / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def complete(self, messages, model, timeout, max_tokens=None) -> Completion:
+        tokens = self._tokens(messages, max_tokens)
+        latency = self._attempt() + self._duration(len(tokens))
+        if latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("fake provider call exceeded its deadline")
+        time.sleep(latency)
+        content = "".join(tokens)
+        return Completion(content, message_tokens(messages, model) + count_tokens(content, model))
+
+    async def stream(self, messages, model, timeout) -> AsyncIterator[str]:
+        # The caller's deadlines are enforced around the stream, as for a real provider
+        tokens = self._tokens(messages, None)
+        await asyncio.sleep(self._attempt())
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        sent = 0
+        while sent < len(tokens):
+            due = len(tokens) if self.tokens_per_sec <= 0 else min(int((loop.time() - start) * self.tokens_per_sec) + 1, len(tokens))
+            while sent < due:
+                yield tokens[sent]
+                sent += 1
+            if sent < len(tokens):
+                await asyncio.sleep(FAKE_TICK_SECONDS)
+
+    def upload_file(self, filename, data, timeout) -> str:
+        self._attempt()
+        file_id = f"file-fake-{uuid.uuid4().hex}"
+        self.files[file_id] = data
+        return file_id
+
+    def file_content(self, file_id, timeout) -> bytes:
+        self._attempt()
+        if file_id not in self.files:
+            raise KeyError(file_id)
+        return self.files[file_id]
+
+
+def make_provider(name: str) -> LLMProvider:
+    if name == "fake":
+        return FakeProvider()
+    if name == "openai":
+        return OpenAIProvider(OPENAI_API_KEY)
+    raise ValueError(f"Unknown LLM_PROVIDER {name!r}")
+
+
+llm_provider = make_provider(LLM_PROVIDER)
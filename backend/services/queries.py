@@ -0,0 +1,32 @@
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.project import Project
+from models.prompt import Prompt
+
+# Async counterparts of the read queries in routes/projects.py and routes/prompts.py (used when DB_ASYNC is on)
+
+
+async def get_project(db: AsyncSession, project_id: uuid.UUID) -> Project | None:
+    return (await db.execute(select(Project).where(Project.id == project_id))).scalars().first()
+
+
+async def get_owned_project(db: AsyncSession, project_id: uuid.UUID, owner_id: uuid.UUID) -> Project | None:
+    stmt = select(Project).where(Project.id == project_id, Project.owner_id == owner_id)
+    return (await db.execute(stmt)).scalars().first()
+
+
+async def list_projects(db: AsyncSession, owner_id: uuid.UUID) -> list[Project]:
+    return list((await db.execute(select(Project).where(Project.owner_id == owner_id))).scalars().all())
+
+
+async def get_owned_prompt(db: AsyncSession, prompt_id: uuid.UUID, owner_id: uuid.UUID) -> Prompt | None:
+    # The ownership check rides on the join, so another user's prompt looks like a missing one
+    stmt = select(Prompt).join(Project, Prompt.project_id == Project.id).where(Prompt.id == prompt_id, Project.owner_id == owner_id)
+    return (await db.execute(stmt)).scalars().first()
+
+
+async def list_prompts(db: AsyncSession, project_id: uuid.UUID) -> list[Prompt]:
+    return list((await db.execute(select(Prompt).where(Prompt.project_id == project_id))).scalars().all())
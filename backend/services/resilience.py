@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+import openai
+
+from config import (
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS,
+    CIRCUIT_FAILURE_RATIO, CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_COOLDOWN_SECONDS,
+)
+from services.providers import ProviderError
+
+T = TypeVar("T")
+
+# Failures that say the provider is unhealthy: worth a retry and counted by the breaker. Anything
+# else (bad request, auth, content filter) proves the provider answered.
+PROVIDER_FAILURES = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+    ProviderError,
+)
+
+
+class ProviderUnavailable(Exception):
+    # Turned into 503 + Retry-After by the app's exception handler
+    def __init__(self, retry_after: float):
+        super().__init__("LLM provider unavailable")
+        self.retry_after = max(1, round(retry_after))
+
+
+class CircuitBreaker:
+    # closed: calls flow. open: calls fail at once until the cooldown passes. half-open: one probe
+    # call is let through; its outcome closes or re-opens the circuit. Judged on the failure ratio of
+    # recent calls rather than a consecutive streak, which concurrent callers hit together on a
+    # provider that is merely flaky.
+
+    def __init__(self, cooldown: float = CIRCUIT_COOLDOWN_SECONDS):
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.recent: deque[bool] = deque(maxlen=CIRCUIT_WINDOW)  # True = failed
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+
+    def check(self) -> None:
+        # Fail fast without taking the half-open probe slot (e.g. before starting an SSE response)
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                raise ProviderUnavailable(self.opened_at + self.cooldown - time.monotonic())
+
+    def before_call(self) -> None:
+        with self.lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"  # this caller is the probe
+                return
+            self.rejected += 1
+            raise ProviderUnavailable(max(remaining, 1))
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        # One attempt, settled however it ends; raises ProviderUnavailable while the circuit is open
+        self.before_call()
+        try:
+            yield
+        except PROVIDER_FAILURES:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        except BaseException:
+            # Cancelled, or a generator closed early: says nothing about the provider
+            self.release_probe()
+            raise
+        self.record_success()
+
+    def release_probe(self) -> None:
+        # Hand the half-open slot to the next caller; the cooldown has already passed
+        with self.lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.state == "half_open":
+                self.state = "closed"
+                self.recent.clear()
+            self.recent.append(False)
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.recent.append(True)
+            if self.state == "half_open" or (
+                self.state == "closed"
+                and len(self.recent) >= CIRCUIT_MIN_CALLS
+                and sum(self.recent) >= CIRCUIT_FAILURE_RATIO * len(self.recent)
+            ):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opens += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"state": self.state, "recent_failures": sum(self.recent), "recent_calls": len(self.recent), "opens": self.opens, "rejected": self.rejected}
+
+
+provider_breaker = CircuitBreaker()
+
+
+def retry_delay(attempt: int) -> float:
+    # Full jitter: spreads retries from many callers instead of synchronising them into waves
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def call_provider(fn: Callable[[float], T], deadline_seconds: float, retries: int = LLM_MAX_RETRIES) -> T:
+    # fn gets the time left as its per-attempt timeout. Only pass retries > 0 for idempotent calls.
+    deadline = time.monotonic() + deadline_seconds
+    attempt = 0
+    while True:
+        try:
+            with provider_breaker.call():
+                return fn(max(deadline - time.monotonic(), 0.001))
+        except PROVIDER_FAILURES:
+            delay = retry_delay(attempt)
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            time.sleep(delay)
+
@@ -0,0 +1,32 @@
+import hashlib
+import json
+import uuid
+
+from sqlalchemy.orm import Session
+
+from config import RESPONSE_CACHE_ENABLED
+from models.file import ProjectFile
+from services.cache import response_cache
+
+
+def _file_versions(db: Session, project_id: uuid.UUID) -> list[list[str]]:
+    # The assembled prompt only carries the chunks retrieval picked; any upload, delete or
+    # re-upload in the project must still produce a new key
+    rows = db.query(ProjectFile.id, ProjectFile.content_hash).filter(ProjectFile.project_id == project_id).order_by(ProjectFile.id).all()
+    return [[str(r.id), r.content_hash or ""] for r in rows]
+
+
+def request_key(db: Session, project_id: uuid.UUID, model: str, messages: list[dict], **params) -> str:
+    # Identifies one upstream completion: used for the response cache and for coalescing in-flight calls
+    payload = {"model": model, "params": params, "messages": messages, "files": _file_versions(db, project_id)}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def get_cached_response(key: str | None) -> str | None:
+    return response_cache.get(key) if key and RESPONSE_CACHE_ENABLED else None
+
+
+def cache_response(key: str | None, reply: str | None) -> None:
+    # Failed or empty replies are never cached
+    if key and reply and RESPONSE_CACHE_ENABLED:
+        response_cache.set(key, reply)
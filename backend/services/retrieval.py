@@ -0,0 +1,273 @@
+import os
+import re
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import sentry_sdk
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from config import RETRIEVAL_INDEX_DIR, RETRIEVAL_TOP_K, RETRIEVAL_CHUNK_WORDS, RETRIEVAL_FULL_TEXT_MAX_BYTES
+from models.file import ProjectFile, FileText, FileChunk
+from services.file_store import load_file_texts, load_project_file_texts
+
+# BM25 over hashed terms: no vocabulary to persist or grow, collisions are rare at 2^20 buckets
+TERM_BITS = 20
+TERM_MASK = (1 << TERM_BITS) - 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+CHUNK_OVERLAP_WORDS = 40
+MAX_SEGMENTS = 8
+MAX_LOADED_PROJECTS = 64
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1 << 20)
+def _term_id(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) & TERM_MASK
+
+
+def _term_ids(text: str) -> list[int]:
+    return [_term_id(t) for t in TOKEN_RE.findall(text.lower())]
+
+
+def chunk_text(text: str, chunk_words: int = RETRIEVAL_CHUNK_WORDS) -> list[str]:
+    words = text.split()
+    step = max(1, chunk_words - CHUNK_OVERLAP_WORDS)
+    return [" ".join(words[i:i + chunk_words]) for i in range(0, max(len(words) - CHUNK_OVERLAP_WORDS, 1), step)]
+
+
+class Segment:
+    # Immutable slice of the index: postings sorted by term so a lookup is one searchsorted
+
+    def __init__(self, chunk_ids, doc_len, terms, docs, tfs):
+        self.chunk_ids = chunk_ids
+        self.doc_len = doc_len
+        self.terms = terms
+        self.docs = docs
+        self.tfs = tfs
+
+    @classmethod
+    def build(cls, chunks: list[tuple[int, str]]) -> "Segment":
+        doc_terms = [np.asarray(_term_ids(text), dtype=np.int64) for _, text in chunks]
+        doc_len = np.array([len(t) for t in doc_terms], dtype=np.float32)
+        all_terms = np.concatenate(doc_terms) if doc_terms else np.empty(0, dtype=np.int64)
+        all_docs = np.repeat(np.arange(len(chunks), dtype=np.int64), doc_len.astype(np.int64))
+
+        # (term, doc) pairs with their counts, ordered by term then doc
+        keys, tfs = np.unique((all_terms << 32) | all_docs, return_counts=True)
+        return cls(
+            np.array([cid for cid, _ in chunks], dtype=np.int64),
+            doc_len,
+            (keys >> 32).astype(np.int32),
+            (keys & 0xFFFFFFFF).astype(np.int32),
+            tfs.astype(np.float32),
+        )
+
+    @classmethod
+    def merge(cls, segments: list["Segment"]) -> "Segment":
+        offsets = np.cumsum([0] + [len(s.chunk_ids) for s in segments[:-1]])
+        terms = np.concatenate([s.terms for s in segments])
+        order = np.argsort(terms, kind="stable")
+        return cls(
+            np.concatenate([s.chunk_ids for s in segments]),
+            np.concatenate([s.doc_len for s in segments]),
+            terms[order],
+            np.concatenate([s.docs + off for s, off in zip(segments, offsets)])[order],
+            np.concatenate([s.tfs for s in segments])[order],
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Segment":
+        with np.load(path) as data:
+            return cls(data["chunk_ids"], data["doc_len"], data["terms"], data["docs"], data["tfs"])
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, chunk_ids=self.chunk_ids, doc_len=self.doc_len, terms=self.terms, docs=self.docs, tfs=self.tfs)
+        os.replace(tmp, path)  # readers in other workers never see a partial file
+
+
+class ProjectIndex:
+    # Log-structured: each upload appends a segment file, small segments are merged once there are too many
+
+    def __init__(self, project_id: uuid.UUID):
+        self.directory = os.path.join(RETRIEVAL_INDEX_DIR, str(project_id))
+        self.segments: dict[str, Segment] = {}
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        # Pick up segments written by other workers since the last query
+        while True:
+            try:
+                names = {n for n in os.listdir(self.directory) if n.endswith(".npz")}
+            except FileNotFoundError:
+                names = set()
+            if not set(self.segments) <= names:
+                self.segments = {}  # another worker compacted; reload everything
+            try:
+                for name in sorted(names - set(self.segments)):
+                    self.segments[name] = Segment.load(os.path.join(self.directory, name))
+                return
+            except FileNotFoundError:
+                continue  # compacted away between listing and loading; list again
+
+    def add(self, chunks: list[tuple[int, str]]) -> None:
+        if not chunks:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{uuid.uuid4().hex}.npz"
+        segment = Segment.build(chunks)
+        segment.save(os.path.join(self.directory, name))
+        self.segments[name] = segment
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+
+    def compact(self) -> None:
+        merged_name = f"{uuid.uuid4().hex}.npz"
+        Segment.merge(list(self.segments.values())).save(os.path.join(self.directory, merged_name))
+        for name in self.segments:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # another worker compacted the same segments
+        self.segments = {merged_name: Segment.load(os.path.join(self.directory, merged_name))}
+
+    def chunk_ids(self) -> np.ndarray:
+        # Sorted distinct ids; a rebuild racing in two workers can index a chunk twice
+        if not self.segments:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([s.chunk_ids for s in self.segments.values()]))
+
+    def search(self, query: str, k: int) -> list[int]:
+        segments = list(self.segments.values())
+        q_terms = np.unique(np.asarray(_term_ids(query), dtype=np.int32))
+        if not segments or not len(q_terms):
+            return []
+
+        ranges = [(np.searchsorted(s.terms, q_terms, "left"), np.searchsorted(s.terms, q_terms, "right")) for s in segments]
+        n_docs = sum(len(s.chunk_ids) for s in segments)
+        avgdl = max(float(sum(s.doc_len.sum() for s in segments)) / n_docs, 1.0)
+        df = sum(hi - lo for lo, hi in ranges)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        scores, chunk_ids = [], []
+        for s, (lo, hi) in zip(segments, ranges):
+            seg_scores = np.zeros(len(s.chunk_ids), dtype=np.float32)
+            for i in np.nonzero(hi > lo)[0]:
+                docs = s.docs[lo[i]:hi[i]]
+                tf = s.tfs[lo[i]:hi[i]]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * s.doc_len[docs] / avgdl)
+                seg_scores[docs] += idf[i] * tf * (BM25_K1 + 1) / (tf + norm)
+            scores.append(seg_scores)
+            chunk_ids.append(s.chunk_ids)
+
+        scores = np.concatenate(scores)
+        chunk_ids = np.concatenate(chunk_ids)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        # A rebuild racing in two workers can duplicate chunks; keep the first hit
+        return list(dict.fromkeys(int(chunk_ids[i]) for i in top if scores[i] > 0))
+
+
+_indexes: OrderedDict[uuid.UUID, ProjectIndex] = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_project_index(project_id: uuid.UUID) -> ProjectIndex:
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+        if index is None:
+            index = _indexes[project_id] = ProjectIndex(project_id)
+            if len(_indexes) > MAX_LOADED_PROJECTS:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(project_id)
+        return index
+
+
+def index_project_file(db: Session, project_file: ProjectFile, text: str) -> None:
+    # Commits. Claiming chunk_count first makes this a no-op for a file another request already indexed.
+    texts = chunk_text(text)
+    claimed = db.execute(
+        update(ProjectFile)
+        .where(ProjectFile.id == project_file.id, ProjectFile.chunk_count.is_(None))
+        .values(chunk_count=len(texts))
+    )
+    if claimed.rowcount == 0:
+        return
+    chunks = [
+        FileChunk(project_id=project_file.project_id, project_file_id=project_file.id, ordinal=i, text=chunk)
+        for i, chunk in enumerate(texts)
+    ]
+    db.add_all(chunks)
+    db.commit()  # the index only ever holds committed chunk ids
+
+    index = get_project_index(project_file.project_id)
+    with index.lock:
+        index.refresh()
+        index.add([(c.id, c.text) for c in chunks])
+
+
+def _reconcile_with_db(db: Session, index: ProjectIndex, project_id: uuid.UUID) -> None:
+    # Index files are a cache of file_chunks. A wiped disk (a fresh container) or a worker on another
+    # host can hold only some of them; index the rest. Costs one aggregate query when in sync.
+    count, max_id = db.query(func.count(FileChunk.id), func.max(FileChunk.id)).filter(FileChunk.project_id == project_id).one()
+    indexed = index.chunk_ids()
+    if max_id is None or (count <= len(indexed) and indexed[-1] == max_id):
+        return
+    known = set(indexed.tolist())
+    chunks = db.query(FileChunk.id, FileChunk.text).filter(FileChunk.project_id == project_id).order_by(FileChunk.id).all()
+    index.add([(c.id, c.text) for c in chunks if c.id not in known])
+
+
+def build_file_context(db: Session, project_id: uuid.UUID, query: str, k: int = RETRIEVAL_TOP_K) -> list[tuple[str, str]]:
+    files = (
+        db.query(ProjectFile, FileText.size_bytes)
+        .outerjoin(FileText, ProjectFile.content_hash == FileText.content_hash)
+        .filter(ProjectFile.project_id == project_id)
+        .order_by(ProjectFile.created_at)
+        .all()
+    )
+    if not files:
+        return []
+
+    # Small attachments go in whole; chunking them only loses context
+    if sum(size or 0 for _, size in files) <= RETRIEVAL_FULL_TEXT_MAX_BYTES:
+        return load_project_file_texts(db, project_id, [f for f, _ in files])
+
+    index = get_project_index(project_id)
+    unindexed = [f for f, _ in files if f.chunk_count is None]
+    try:
+        if unindexed:
+            texts = load_file_texts(db, unindexed)
+            for f in unindexed:
+                text = texts.get(f.file_id)
+                if text is None and not f.content_hash:
+                    continue  # a legacy file whose text could not be fetched yet; the next request retries it
+                index_project_file(db, f, text or "")  # stored text that is empty still counts as indexed
+        with index.lock:
+            index.refresh()
+            _reconcile_with_db(db, index, project_id)
+            chunk_ids = index.search(query, k)
+    except Exception as e:
+        db.rollback()
+        sentry_sdk.capture_exception(e)
+        return load_project_file_texts(db, project_id, [f for f, _ in files])
+
+    if not chunk_ids:
+        return []
+    rows = (
+        db.query(FileChunk.id, ProjectFile.filename, FileChunk.text)
+        .join(ProjectFile, FileChunk.project_file_id == ProjectFile.id)
+        .filter(FileChunk.id.in_(chunk_ids))
+        .all()
+    )
+    by_id = {r.id: (r.filename, r.text) for r in rows}
+    return [by_id[cid] for cid in chunk_ids if cid in by_id]
@@ -0,0 +1,105 @@
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import Select, and_, case, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.analytics import ProjectUsage
+from models.prompt import PromptRun
+from services.messages import decode_cursor
+from services.usage import record_usage
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+def _usage_aggregate(db: Session, project_id: uuid.UUID) -> dict:
+    # Full scan of one project's finished runs; only used to seed a missing rollup row
+    row = db.execute(
+        select(
+            func.count(PromptRun.id),
+            func.coalesce(func.sum(case((PromptRun.status == "completed", 1), else_=0)), 0),
+            func.coalesce(func.sum(case((PromptRun.status == "failed", 1), else_=0)), 0),
+            func.coalesce(func.sum(PromptRun.tokens_used), 0),
+            func.coalesce(func.sum(PromptRun.cost), 0.0),
+        ).where(PromptRun.project_id == project_id, PromptRun.status.in_(FINISHED_STATUSES))
+    ).one()
+    return dict(zip(("total_runs", "completed_runs", "failed_runs", "total_tokens", "total_cost"), row))
+
+
+def record_run_finished(db: Session, run: PromptRun, run_status: str) -> None:
+    # Runs inside the caller's transaction, after the run's final status is written, so the
+    # rollups can never disagree with prompt_runs
+    tokens, cost = run.tokens_used or 0, run.cost or 0.0
+    increment = (
+        update(ProjectUsage)
+        .where(ProjectUsage.project_id == run.project_id)
+        .values(
+            total_runs=ProjectUsage.total_runs + 1,
+            completed_runs=ProjectUsage.completed_runs + (1 if run_status == "completed" else 0),
+            failed_runs=ProjectUsage.failed_runs + (1 if run_status == "failed" else 0),
+            total_tokens=ProjectUsage.total_tokens + tokens,
+            total_cost=ProjectUsage.total_cost + cost,
+        )
+    )
+    if not db.execute(increment).rowcount:
+        # First finished run since the table existed: seed from the runs already there, this one included
+        try:
+            with db.begin_nested():
+                db.add(ProjectUsage(project_id=run.project_id, **_usage_aggregate(db, run.project_id)))
+        except IntegrityError:
+            db.execute(increment)  # another request seeded the row first, without our uncommitted run
+
+    record_usage(db, run, run_status, datetime.now(timezone.utc))
+
+
+def finish_run(
+    db: Session,
+    run: PromptRun,
+    run_status: str,
+    output: str | None = None,
+    tokens: int | None = None,
+    cost: float | None = None,
+    cache_hit: bool = False,
+    coalesced: bool = False,
+) -> None:
+    # The one place a run reaches a final status; the caller commits
+    run.status = run_status
+    run.cache_hit = cache_hit
+    run.coalesced = coalesced
+    if output is not None:
+        run.output_data = output
+    if tokens is not None:
+        run.tokens_used = tokens
+    if cost is not None:
+        run.cost = cost
+    db.flush()
+    record_run_finished(db, run, run_status)
+
+
+def load_project_usage(db: Session, project_id: uuid.UUID) -> ProjectUsage:
+    usage = db.get(ProjectUsage, project_id)
+    if usage is not None:
+        return usage
+    # Projects that predate the rollup are aggregated once and read in O(1) from then on
+    try:
+        with db.begin_nested():
+            usage = ProjectUsage(project_id=project_id, **_usage_aggregate(db, project_id))
+            db.add(usage)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        usage = db.get(ProjectUsage, project_id)
+    return usage
+
+
+def run_page_query(project_id: uuid.UUID, limit: int, before: str | None = None) -> Select:
+    # Newest runs first, keyset-paginated on the same (created_at, id) cursor as the message history
+    stmt = select(PromptRun).where(PromptRun.project_id == project_id)
+    if before:
+        created_at, run_id = decode_cursor(before)
+        stmt = stmt.where(or_(
+            PromptRun.created_at < created_at,
+            and_(PromptRun.created_at == created_at, PromptRun.id < run_id),
+        ))
+    return stmt.order_by(PromptRun.created_at.desc(), PromptRun.id.desc()).limit(limit + 1)
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import uuid
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from starlette.responses import StreamingResponse
+
+from config import SSE_COALESCE_MAX_BYTES, SSE_COALESCE_MAX_DELAY_MS, SSE_HEARTBEAT_SECONDS
+
+# Token streams as SSE frames. After a frame goes out the next one waits SSE_COALESCE_MAX_DELAY_MS,
+# and whatever arrived meanwhile is sent together (up to SSE_COALESCE_MAX_BYTES per frame). A fast
+# reply becomes tens of writes and client renders instead of one per token; a slow one, or the first
+# token, is sent as soon as it arrives. A stream with nothing to send gets a comment every
+# SSE_HEARTBEAT_SECONDS so idle proxies keep it open.
+
+HEARTBEAT = b": keep-alive\n\n"
+RECONNECT_MS = 1000  # well inside STREAM_CANCEL_GRACE_SECONDS, so a reconnect finds the run still going
+DELTA_OPEN = b'\ndata: {"role": "assistant", "delta": '
+DELTA_CLOSE = b"}\n\n"
+
+
+async def coalesce(
+    deltas: AsyncIterator[str],
+    max_bytes: int = SSE_COALESCE_MAX_BYTES,
+    max_delay: float = SSE_COALESCE_MAX_DELAY_MS / 1000,
+    heartbeat: float = SSE_HEARTBEAT_SECONDS,
+) -> AsyncIterator[list[str] | None]:
+    # Yields the deltas for each frame, or None when a heartbeat is due. One reader task buffers
+    # deltas while the frame loop waits, so waiting costs nothing per delta.
+    loop = asyncio.get_running_loop()
+    buffer: list[str] = []
+    changed = asyncio.Event()
+    done = False
+    error = None
+
+    async def read():
+        nonlocal done, error
+        try:
+            async for piece in deltas:
+                buffer.append(piece)
+                changed.set()
+        except Exception as e:
+            error = e
+        finally:
+            done = True
+            changed.set()
+
+    reader = asyncio.create_task(read())
+    next_frame = 0.0
+    try:
+        while True:
+            if not buffer:
+                if done:
+                    break
+                changed.clear()
+                try:
+                    async with asyncio.timeout(heartbeat if heartbeat > 0 else None):
+                        await changed.wait()
+                except TimeoutError:
+                    yield None
+                continue
+
+            wait = next_frame - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # At least one delta per frame, however large
+            size, n = 0, 0
+            for piece in buffer:
+                size += len(piece.encode())
+                n += 1
+                if size >= max_bytes:
+                    break
+            batch = buffer[:n]
+            del buffer[:n]
+            next_frame = loop.time() + max_delay
+            yield batch
+        if error is not None:
+            raise error
+    finally:
+        reader.cancel()
+
+
+async def delta_frames(run_id: uuid.UUID, deltas: AsyncIterator[str], after: int = 0, **coalescing) -> AsyncIterator[bytes]:
+    # Each frame's id is "<run_id>:<seq>" with seq counting deltas, not frames, so Last-Event-ID
+    # resumes at the same point however the deltas were grouped.
+    # An id-only event is not dispatched but sets Last-Event-ID, so even a connection that drops
+    # before the first token reconnects to this run rather than sending the message again.
+    id_prefix = f"id: {run_id}:".encode()
+    seq = after
+    yield id_prefix + str(seq).encode() + b"\nretry: " + str(RECONNECT_MS).encode() + b"\n\n"
+    async with aclosing(coalesce(deltas, **coalescing)) as batches:
+        async for batch in batches:
+            if batch is None:
+                yield HEARTBEAT
+                continue
+            seq += len(batch)
+            text = batch[0] if len(batch) == 1 else "".join(batch)
+            yield id_prefix + str(seq).encode() + DELTA_OPEN + json.dumps(text).encode() + DELTA_CLOSE
+
+
+class SSEResponse(StreamingResponse):
+    # Streams until done or until the client disconnects. Starlette only watches for the disconnect
+    # message on old ASGI servers and otherwise relies on a failing write, which uvicorn never reports.
+    # Either way the body generator is closed, unwinding the chain down to the fanout subscription so
+    # an abandoned stream can be cancelled.
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope, receive, send) -> None:
+        streaming = asyncio.create_task(self.stream_response(send))
+        listening = asyncio.create_task(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait((streaming, listening), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            streaming.cancel()
+            listening.cancel()
+            await asyncio.gather(streaming, listening, return_exceptions=True)
+            await self.body_iterator.aclose()
+        if not streaming.cancelled() and streaming.exception() is not None:
+            raise streaming.exception()
+        if self.background is not None:
+            await self.background()
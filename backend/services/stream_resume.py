@@ -0,0 +1,157 @@
+import asyncio
+import math
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator
+
+import sentry_sdk
+
+from config import (
+    STREAM_RESUME_BACKEND, REDIS_URL, STREAM_RESUME_GRACE_SECONDS, STREAM_RESUME_MAX_RUNS,
+    STREAM_BUFFER_MAX_DELTAS, LLM_STREAM_TOTAL_SECONDS,
+)
+from services.inflight import StreamFanout
+
+# Resumable SSE. Every delta of a streamed run has an event id "<run_id>:<seq>". A client that drops
+# reconnects with Last-Event-ID, gets the deltas after seq from the run's buffer and then follows the
+# live stream, without a second upstream call. Buffers outlive the run by a grace period.
+
+REDIS_READ_BLOCK_MS = 5000
+
+
+class StreamCancelled(Exception):
+    # Raised at the end of a replayed run that was cancelled: the deltas already sent are all there is
+    pass
+
+
+class StreamTrimmed(Exception):
+    # Deltas the reader still needed were trimmed from the buffer: like an expired one, the client
+    # reloads the turn from the message list
+    pass
+
+
+def parse_event_id(event_id: str) -> tuple[uuid.UUID, int]:
+    # Raises ValueError on anything that is not "<run_id>:<seq>"
+    run_id, _, seq = event_id.partition(":")
+    return uuid.UUID(run_id), int(seq or 0)
+
+
+class MemoryStreamBuffer:
+    # The fanout already holds every delta; keep it reachable by run id until the grace period ends
+
+    def __init__(self):
+        self.runs: OrderedDict[uuid.UUID, StreamFanout] = OrderedDict()
+
+    def register(self, run_id: uuid.UUID, fanout: StreamFanout) -> None:
+        self.runs[run_id] = fanout
+        while len(self.runs) > STREAM_RESUME_MAX_RUNS:
+            self.runs.popitem(last=False)
+
+        loop = asyncio.get_running_loop()
+        fanout.task.add_done_callback(lambda _: loop.call_later(STREAM_RESUME_GRACE_SECONDS, self._evict, run_id, fanout))
+
+    def _evict(self, run_id: uuid.UUID, fanout: StreamFanout) -> None:
+        if self.runs.get(run_id) is fanout:
+            del self.runs[run_id]
+
+    def fanout(self, run_id: uuid.UUID) -> StreamFanout | None:
+        # The live stream behind a run, if this worker produces it
+        return self.runs.get(run_id)
+
+    async def replay(self, run_id: uuid.UUID, after: int) -> AsyncIterator[str] | None:
+        fanout = self.runs.get(run_id)
+        return self._follow(fanout, after) if fanout is not None else None
+
+    async def _follow(self, fanout: StreamFanout, after: int) -> AsyncIterator[str]:
+        async with aclosing(fanout.subscribe(after)) as deltas:
+            async for piece in deltas:
+                yield piece
+        if fanout.cancelled:
+            raise StreamCancelled()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "runs": len(self.runs)}
+
+
+class RedisStreamBuffer:
+    # Mirrors each run into a Redis stream (entry ids 0-<seq>) so a reconnect routed to another worker
+    # can replay it. Reconnects that land on the worker producing the run are served from memory.
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # only needed for this backend
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.local = MemoryStreamBuffer()
+        self.mirrors: set[asyncio.Task] = set()
+
+    def register(self, run_id: uuid.UUID, fanout: StreamFanout) -> None:
+        self.local.register(run_id, fanout)
+        task = asyncio.create_task(self._mirror(run_id, fanout))
+        self.mirrors.add(task)
+        task.add_done_callback(self.mirrors.discard)
+
+    async def _mirror(self, run_id: uuid.UUID, fanout: StreamFanout) -> None:
+        key = f"stream:{run_id}"
+        seq = 0
+        try:
+            try:
+                async for piece in fanout.subscribe(counted=False):
+                    seq += 1
+                    if seq == 1:
+                        # Created together with its TTL: a worker that dies mid-stream leaves no end
+                        # marker, but the key still expires
+                        await (
+                            self.redis.pipeline()
+                            .xadd(key, {"d": piece}, id="0-1", maxlen=STREAM_BUFFER_MAX_DELTAS)
+                            .expire(key, math.ceil(LLM_STREAM_TOTAL_SECONDS) + STREAM_RESUME_GRACE_SECONDS)  # EXPIRE takes whole seconds
+                            .execute()
+                        )
+                    else:
+                        await self.redis.xadd(key, {"d": piece}, id=f"0-{seq}", maxlen=STREAM_BUFFER_MAX_DELTAS)
+                end = "cancelled" if fanout.cancelled else "completed"
+            except Exception:
+                end = "failed"
+            await self.redis.pipeline().xadd(key, {"end": end}, id=f"0-{seq + 1}").expire(key, STREAM_RESUME_GRACE_SECONDS).execute()
+        except Exception as e:
+            # Losing the mirror only costs cross-worker resumes
+            sentry_sdk.capture_exception(e)
+
+    def fanout(self, run_id: uuid.UUID) -> StreamFanout | None:
+        return self.local.fanout(run_id)
+
+    async def replay(self, run_id: uuid.UUID, after: int) -> AsyncIterator[str] | None:
+        local = await self.local.replay(run_id, after)
+        if local is not None:
+            return local
+        key = f"stream:{run_id}"
+        if not await self.redis.exists(key):
+            return None
+        return self._read(key, after)
+
+    async def _read(self, key: str, after: int) -> AsyncIterator[str]:
+        seq = after
+        while True:
+            entries = await self.redis.xread({key: f"0-{seq}"}, count=256, block=REDIS_READ_BLOCK_MS)
+            if not entries:
+                if not await self.redis.exists(key):
+                    raise RuntimeError("stream buffer expired before the run finished")
+                continue
+            for entry_id, fields in entries[0][1]:
+                # Entry ids are contiguous; a jump means maxlen trimmed deltas this reader never got
+                if int(entry_id.partition("-")[2]) != seq + 1:
+                    raise StreamTrimmed()
+                seq += 1
+                if "end" in fields:
+                    if fields["end"] == "cancelled":
+                        raise StreamCancelled()
+                    if fields["end"] != "completed":
+                        raise RuntimeError("stream failed upstream")
+                    return
+                yield fields["d"]
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "runs": len(self.local.runs), "mirrors": len(self.mirrors)}
+
+
+stream_buffer = RedisStreamBuffer(REDIS_URL) if STREAM_RESUME_BACKEND == "redis" else MemoryStreamBuffer()
@@ -0,0 +1,126 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.analytics import UsageBucket
+from models.prompt import PromptRun
+
+GRANULARITIES = ("hour", "day")
+# Widest range one request may ask for: ~750 hourly or ~370 daily points per series
+MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=366)}
+DEFAULT_RANGE = {"hour": timedelta(days=2), "day": timedelta(days=90)}
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    if granularity == "day":
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def record_usage(db: Session, run: PromptRun, run_status: str, finished_at: datetime) -> None:
+    # One hourly and one daily bucket per finished run, inside the caller's transaction.
+    # Latency is creation to finish, so it includes context assembly as well as the model call.
+    created_at = run.created_at if run.created_at.tzinfo else run.created_at.replace(tzinfo=timezone.utc)
+    latency_ms = max(int((finished_at - created_at).total_seconds() * 1000), 0)
+    counts = {
+        "runs": 1,
+        "completed_runs": 1 if run_status == "completed" else 0,
+        "failed_runs": 1 if run_status == "failed" else 0,
+        "tokens": run.tokens_used or 0,
+        "cost": run.cost or 0.0,
+        "latency_ms": latency_ms,
+    }
+    for granularity in GRANULARITIES:
+        key = {
+            "granularity": granularity,
+            "project_id": run.project_id,
+            "bucket_start": bucket_start(finished_at, granularity),
+            "user_id": run.user_id,
+            "model": run.model or "",
+        }
+        increment = (
+            update(UsageBucket)
+            .where(*(getattr(UsageBucket, column) == value for column, value in key.items()))
+            .values({column: getattr(UsageBucket, column) + value for column, value in counts.items()})
+        )
+        if db.execute(increment).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(UsageBucket(**key, **counts))
+        except IntegrityError:
+            db.execute(increment)  # another run opened the bucket first
+
+
+def usage_series(
+    db: Session,
+    granularity: str,
+    start: datetime,
+    end: datetime,
+    project_id: uuid.UUID | None = None,
+    user_id: uuid.UUID | None = None,
+    group_by: tuple[str, ...] = (),
+) -> list[dict]:
+    # Sums buckets over whichever of project/user/model is not in group_by
+    dimensions = [getattr(UsageBucket, column) for column in group_by]
+    stmt = (
+        select(
+            UsageBucket.bucket_start,
+            *dimensions,
+            func.sum(UsageBucket.runs).label("runs"),
+            func.sum(UsageBucket.completed_runs).label("completed_runs"),
+            func.sum(UsageBucket.failed_runs).label("failed_runs"),
+            func.sum(UsageBucket.tokens).label("tokens"),
+            func.sum(UsageBucket.cost).label("cost"),
+            func.sum(UsageBucket.latency_ms).label("latency_ms"),
+        )
+        .where(
+            UsageBucket.granularity == granularity,
+            UsageBucket.bucket_start >= bucket_start(start, granularity),
+            UsageBucket.bucket_start < end,
+        )
+        .group_by(UsageBucket.bucket_start, *dimensions)
+        .order_by(UsageBucket.bucket_start, *dimensions)
+    )
+    if project_id is not None:
+        stmt = stmt.where(UsageBucket.project_id == project_id)
+    if user_id is not None:
+        stmt = stmt.where(UsageBucket.user_id == user_id)
+
+    series = []
+    for row in db.execute(stmt):
+        point = dict(row._mapping)
+        point["avg_latency_ms"] = point.pop("latency_ms") / point["runs"] if point["runs"] else None
+        series.append(point)
+    return series
+
+
+def backfill_usage(db: Session) -> int:
+    # One-off for runs that finished before buckets existed; run once on an empty usage_buckets table
+    now = datetime.now(timezone.utc)
+    count = 0
+    runs = db.execute(
+        select(
+            PromptRun.project_id, PromptRun.user_id, PromptRun.model, PromptRun.status,
+            PromptRun.tokens_used, PromptRun.cost, PromptRun.created_at, PromptRun.updated_at,
+        )
+        .where(PromptRun.status.in_(("completed", "failed", "cancelled")))
+        .execution_options(yield_per=1000)
+    )
+    for run in runs:
+        finished_at = run.updated_at or run.created_at or now
+        record_usage(db, run, run.status, finished_at if finished_at.tzinfo else finished_at.replace(tzinfo=timezone.utc))
+        count += 1
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    with SessionLocal() as session:
+        print(f"backfilled {backfill_usage(session)} runs")
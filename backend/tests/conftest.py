@@ -0,0 +1,39 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# Modules read config at import time; point them at throwaway local resources before any is imported
+_scratch = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/app.db")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("RETRIEVAL_INDEX_DIR", f"{_scratch}/retrieval")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("RUN_WORKERS", "0")
+
+
+@pytest.fixture(scope="session")
+def schema():
+    from database import run_migrations
+    run_migrations()
+
+
+@pytest.fixture
+def db(schema):
+    from database import SessionLocal
+    with SessionLocal() as db:
+        yield db
+
+
+@pytest.fixture
+def project(db):
+    from models.project import Project
+    from models.user import User
+    user = User(email=f"{uuid.uuid4().hex}@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    project = Project(name=f"p-{uuid.uuid4().hex}", owner_id=user.id)
+    db.add(project)
+    db.commit()
+    return project
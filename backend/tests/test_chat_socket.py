@@ -0,0 +1,74 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import llm_client
+from routes import chat_socket
+from services.providers import FakeProvider
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(llm_client, "llm_provider", FakeProvider(ttft_ms=0, tokens_per_sec=0, completion_tokens=5, jitter_ms=0))
+
+    import main
+    with TestClient(main.app) as client:
+        email, password = f"{uuid.uuid4().hex}@example.com", "pw"
+        client.post("/api/users/", json={"email": email, "password": password}).raise_for_status()
+        response = client.post("/api/login/", json={"email": email, "password": password})
+        response.raise_for_status()
+        client.headers["Cookie"] = f"access_token={response.cookies['access_token']}"
+        yield client
+
+
+@pytest.fixture
+def project_id(client) -> str:
+    response = client.post("/api/projects/", json={"name": f"p-{uuid.uuid4().hex}"})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def test_send_streams_a_reply(client, project_id):
+    with client.websocket_connect("/api/ws/chat", headers={"Cookie": client.headers["Cookie"]}) as socket:
+        socket.send_json({"type": "send", "ref": "r1", "project_id": project_id, "content": "hello"})
+
+        started = socket.receive_json()
+        assert started["type"] == "started" and started["ref"] == "r1"
+        deltas = []
+        while (frame := socket.receive_json())["type"] == "delta":
+            deltas.append(frame["delta"])
+
+    assert frame == {"type": "end", "run_id": started["run_id"]}
+    assert "".join(deltas)
+
+
+def test_unexpected_error_starting_a_run_answers_the_ref(client, project_id, monkeypatch):
+    async def broken(*args):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(chat_socket, "start_stream_run", broken)
+
+    with client.websocket_connect("/api/ws/chat", headers={"Cookie": client.headers["Cookie"]}) as socket:
+        socket.send_json({"type": "send", "ref": "r1", "project_id": project_id, "content": "hello"})
+        frame = socket.receive_json()
+
+        assert frame == {"type": "error", "ref": "r1", "status": 500, "detail": "Failed to start generation"}
+
+        # The connection stays usable
+        monkeypatch.undo()
+        socket.send_json({"type": "send", "ref": "r2", "project_id": project_id, "content": "hello"})
+        assert socket.receive_json()["type"] == "started"
+
+
+def test_unexpected_error_resuming_a_run_answers_the_run(client, project_id, monkeypatch):
+    async def broken(*args):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(chat_socket, "open_replay", broken)
+    run_id = str(uuid.uuid4())
+
+    with client.websocket_connect("/api/ws/chat", headers={"Cookie": client.headers["Cookie"]}) as socket:
+        socket.send_json({"type": "resume", "project_id": project_id, "run_id": run_id, "after": 0})
+
+        assert socket.receive_json() == {"type": "error", "run_id": run_id, "status": 500, "detail": "Failed to resume run"}
@@ -0,0 +1,160 @@
+import hashlib
+
+import pytest
+
+from services import context
+from services.context import CHARS_PER_TOKEN, REPLY_PRIMER_TOKENS, TOKENS_PER_MESSAGE, assemble_context, count_tokens
+
+MODEL = "gpt-4-turbo"
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # The character estimate keeps budgets exact and needs no BPE download
+    monkeypatch.setattr(context, "_get_encoding", lambda model: None)
+    context._token_counts.clear()
+    yield
+    context._token_counts.clear()
+
+
+def with_budget(monkeypatch, tokens: int) -> None:
+    monkeypatch.setattr(context, "prompt_budget", lambda model: tokens)
+
+
+def words(n: int, token: str = "abc ") -> str:
+    # n tokens under the estimate
+    assert len(token) == CHARS_PER_TOKEN
+    return token * n
+
+
+def test_everything_fits():
+    result = assemble_context(MODEL, "hi", files=[("a.txt", "alpha")], history=[{"role": "user", "content": "q"}], system="sys")
+
+    assert [m["role"] for m in result.messages] == ["system", "user", "user"]
+    assert result.messages[-1]["content"] == "hi\nalpha\n"
+    assert result.dropped == {"files": 0, "history": 0, "system_truncated": False, "user_truncated": False}
+    # Files are counted piece by piece, so the estimate may round up but never under-counts
+    assert result.prompt_tokens >= context.message_tokens(result.messages, MODEL)
+
+
+def test_priority_under_tight_budget(monkeypatch):
+    # Room for the user message and system text only: history and files go first
+    with_budget(monkeypatch, REPLY_PRIMER_TOKENS + 2 * (10 + TOKENS_PER_MESSAGE))
+    history = [{"role": "user", "content": words(5)}, {"role": "assistant", "content": words(5)}]
+
+    result = assemble_context(MODEL, words(10), files=[("a.txt", words(5))], history=history, system=words(10))
+
+    assert [m["role"] for m in result.messages] == ["system", "user"]
+    assert result.messages[0]["content"] == words(10)
+    assert result.messages[1]["content"] == words(10)
+    assert result.dropped == {"files": 1, "history": 2, "system_truncated": False, "user_truncated": False}
+
+
+def test_system_outranks_history_and_history_outranks_files(monkeypatch):
+    # User and system fit, then one history message, and nothing is left for files
+    with_budget(monkeypatch, REPLY_PRIMER_TOKENS + 3 * (5 + TOKENS_PER_MESSAGE))
+    history = [{"role": "user", "content": words(5)}]
+
+    result = assemble_context(MODEL, words(5), files=[("a.txt", words(5))], history=history, system=words(5))
+
+    assert [m["role"] for m in result.messages] == ["system", "user", "user"]
+    assert result.messages[-1]["content"] == words(5)
+    assert result.dropped["files"] == 1
+    assert result.dropped["history"] == 0
+
+
+def test_user_message_is_truncated_only_when_it_alone_overflows(monkeypatch):
+    with_budget(monkeypatch, REPLY_PRIMER_TOKENS + 10 + TOKENS_PER_MESSAGE)
+
+    result = assemble_context(MODEL, words(50), system="sys")
+
+    assert result.messages == [{"role": "user", "content": words(10)}]
+    assert result.dropped["user_truncated"] is True
+    assert result.dropped["system_truncated"] is True
+
+
+def test_truncates_the_first_file_that_does_not_fit_and_drops_the_rest(monkeypatch):
+    # 20 tokens of file room after the user message; each file part costs one newline token
+    with_budget(monkeypatch, REPLY_PRIMER_TOKENS + 5 + TOKENS_PER_MESSAGE + 20)
+    files = [("a.txt", words(9, "aaa ")), ("b.txt", words(30, "bbb ")), ("c.txt", words(5, "ccc "))]
+
+    result = assemble_context(MODEL, words(5), files=files)
+
+    content = result.messages[-1]["content"]
+    assert content == words(5) + "\n" + words(9, "aaa ") + "\n" + words(9, "bbb ") + "\n"
+    assert "ccc" not in content
+    assert result.dropped["files"] == 1
+    assert result.prompt_tokens <= REPLY_PRIMER_TOKENS + 5 + TOKENS_PER_MESSAGE + 20
+
+
+def test_drops_oldest_history_first(monkeypatch):
+    with_budget(monkeypatch, REPLY_PRIMER_TOKENS + 3 * (5 + TOKENS_PER_MESSAGE))
+    history = [
+        {"role": "user", "content": words(5, "old ")},
+        {"role": "assistant", "content": words(5, "ans ")},
+        {"role": "user", "content": words(5, "new ")},
+        {"role": "assistant", "content": words(5, "rep ")},
+    ]
+
+    result = assemble_context(MODEL, words(5), history=history)
+
+    assert [m["content"] for m in result.messages[:-1]] == [words(5, "new "), words(5, "rep ")]
+    assert result.dropped["history"] == 2
+
+
+def test_does_not_keep_a_reply_whose_question_was_dropped(monkeypatch):
+    # The budget cuts between the older turn's question and its reply
+    with_budget(monkeypatch, REPLY_PRIMER_TOKENS + 4 * (5 + TOKENS_PER_MESSAGE))
+    history = [
+        {"role": "user", "content": words(5, "old ")},
+        {"role": "assistant", "content": words(5, "ans ")},
+        {"role": "user", "content": words(5, "new ")},
+        {"role": "assistant", "content": words(5, "rep ")},
+    ]
+
+    result = assemble_context(MODEL, words(5), history=history)
+
+    assert [m["role"] for m in result.messages] == ["user", "assistant", "user"]
+    assert result.messages[0]["content"] == words(5, "new ")
+    assert result.dropped["history"] == 2
+    # The orphan's tokens go back to the budget
+    assert result.prompt_tokens == context.message_tokens(result.messages, MODEL)
+
+
+def test_untruncated_history_may_start_with_a_reply():
+    history = [{"role": "assistant", "content": "welcome"}]
+
+    result = assemble_context(MODEL, "hi", history=history)
+
+    assert result.messages[0] == {"role": "assistant", "content": "welcome"}
+    assert result.dropped["history"] == 0
+
+
+def test_count_cache_is_keyed_by_digest_and_model():
+    text = "x" * 10_000
+
+    assert count_tokens(text, MODEL) == 2500
+    assert count_tokens(text, "gpt-4") == 2500
+
+    digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+    assert set(context._token_counts) == {(digest, MODEL), (digest, "gpt-4")}
+
+
+def test_count_cache_hit_skips_the_tokenizer(monkeypatch):
+    count_tokens("cached text", MODEL)
+    monkeypatch.setattr(context, "_get_encoding", lambda model: pytest.fail("tokenizer called on a cache hit"))
+
+    assert count_tokens("cached text", MODEL) == 3
+
+
+def test_count_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(context, "TOKEN_COUNT_CACHE_SIZE", 2)
+    count_tokens("first", MODEL)
+    count_tokens("second", MODEL)
+    count_tokens("first", MODEL)  # refreshes "first"
+    count_tokens("third", MODEL)
+
+    def key(text):
+        return hashlib.blake2b(text.encode(), digest_size=16).digest(), MODEL
+
+    assert list(context._token_counts) == [key("first"), key("third")]
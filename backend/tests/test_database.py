@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_async_engine_serves_sqlite(tmp_path):
+    # DB_ASYNC is read when database.py is imported, so check it in a fresh interpreter
+    script = (
+        "import asyncio\n"
+        "from sqlalchemy import text\n"
+        "import database\n"
+        "async def main():\n"
+        "    async with database.AsyncSessionLocal() as db:\n"
+        "        print((await db.execute(text('select 1'))).scalar())\n"
+        "    await database.async_engine.dispose()\n"
+        "asyncio.run(main())\n"
+    )
+    env = {**os.environ, "DB_ASYNC": "true", "DATABASE_URL": f"sqlite:///{tmp_path}/async.db"}
+    env.pop("ASYNC_DATABASE_URL", None)
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND, env=env, capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "1"
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from services import governor as governor_module
+from services.governor import Governor, RateLimited, TokenBucket
+
+
+@pytest.fixture
+def governor(monkeypatch) -> Governor:
+    # 100 tokens a minute and nothing else: a spent bucket takes a minute to refill, so any
+    # admission within a test comes from a lease being handed back
+    monkeypatch.setattr(governor_module, "LLM_QUEUE_TIMEOUT_SECONDS", 5)
+    governor = Governor()
+    governor.tokens = TokenBucket(100)
+    return governor
+
+
+def count_checks(governor: Governor, monkeypatch) -> list:
+    checks = []
+    try_admit = governor._try_admit
+
+    def counted(w, now):
+        checks.append(w.user_id)
+        return try_admit(w, now)
+
+    monkeypatch.setattr(governor, "_try_admit", counted)
+    return checks
+
+
+def test_waiter_is_woken_when_a_lease_is_handed_back(governor, monkeypatch):
+    lease = governor.acquire("a", 100)
+    checks = count_checks(governor, monkeypatch)
+
+    async def scenario():
+        waiter = asyncio.create_task(governor.acquire_async("b", 100))
+        await asyncio.sleep(0.5)
+        assert not waiter.done()
+        # Settled from a threadpool thread, as completions are
+        await asyncio.to_thread(governor.settle, lease, 0)
+        return await asyncio.wait_for(waiter, 0.2)
+
+    assert asyncio.run(scenario()).user_id == "b"
+    assert len(checks) <= 3  # it slept while waiting instead of re-checking
+
+
+def test_queued_waiters_are_admitted_one_after_another(governor, monkeypatch):
+    lease = governor.acquire("a", 100)
+    checks = count_checks(governor, monkeypatch)
+
+    async def scenario():
+        waiters = [asyncio.create_task(governor.acquire_async(user, 25)) for user in ("b", "c", "b", "d")]
+        await asyncio.sleep(0.5)
+        assert not any(w.done() for w in waiters)
+        governor.settle(lease, 0)
+        return await asyncio.wait_for(asyncio.gather(*waiters), 0.2)
+
+    assert [lease.user_id for lease in asyncio.run(scenario())] == ["b", "c", "b", "d"]
+    assert len(checks) <= 4 * 3
+
+
+def test_cancelled_waiter_passes_the_turn_on(governor):
+    lease = governor.acquire("a", 100)
+
+    async def scenario():
+        first = asyncio.create_task(governor.acquire_async("b", 50))
+        second = asyncio.create_task(governor.acquire_async("c", 50))
+        await asyncio.sleep(0.1)
+        governor.settle(lease, 50)  # enough for one of them
+        first.cancel()
+        return await asyncio.wait_for(second, 0.2)
+
+    assert asyncio.run(scenario()).user_id == "c"
+    assert governor.depth == 0
+
+
+def test_waiter_gives_up_at_the_queue_timeout(governor, monkeypatch):
+    monkeypatch.setattr(governor_module, "LLM_QUEUE_TIMEOUT_SECONDS", 0.3)
+    governor.acquire("a", 100)
+
+    with pytest.raises(RateLimited):
+        asyncio.run(governor.acquire_async("b", 100))
+    assert governor.timed_out == 1
+    assert governor.depth == 0
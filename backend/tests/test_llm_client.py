@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_client
+from services import resilience
+from services.context import count_tokens, message_tokens
+from services.governor import Governor
+from services.providers import FakeProvider, ProviderError
+from services.resilience import CircuitBreaker, ProviderUnavailable
+
+MODEL = "gpt-4-turbo"
+MESSAGES = [{"role": "user", "content": "hello there"}]
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    # Buckets that do not refill, so every token taken or refunded shows in the level
+    governor = Governor()
+    governor.tokens.rate = 0
+    monkeypatch.setattr(llm_client, "llm_governor", governor)
+    return governor
+
+
+def user_tokens(governor: Governor, user_id) -> float:
+    return governor._user_buckets(user_id)[1].level
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker()
+    monkeypatch.setattr(resilience, "provider_breaker", breaker)
+    monkeypatch.setattr(llm_client, "provider_breaker", breaker)
+    monkeypatch.setattr(resilience, "retry_delay", lambda attempt: 0.0)
+    monkeypatch.setattr(llm_client, "retry_delay", lambda attempt: 0.0)
+    return breaker
+
+
+def use_provider(monkeypatch, **options) -> FakeProvider:
+    provider = FakeProvider(**{"ttft_ms": 0, "tokens_per_sec": 0, "completion_tokens": 20, "jitter_ms": 0, **options})
+    monkeypatch.setattr(llm_client, "llm_provider", provider)
+    return provider
+
+
+def test_completion_settles_reported_usage(monkeypatch, governor, breaker):
+    use_provider(monkeypatch)
+    governor._user_buckets("u1")[1].rate = 0
+    full = governor.tokens.level
+
+    reply, tokens = llm_client.chat_completion(MESSAGES, MODEL, "u1")
+
+    assert reply and tokens > message_tokens(MESSAGES, MODEL)
+    assert governor.tokens.level == full - tokens
+    assert user_tokens(governor, "u1") == governor._user_buckets("u1")[1].capacity - tokens
+
+
+def test_failed_completion_refunds_its_reservation(monkeypatch, governor, breaker):
+    use_provider(monkeypatch, error_rate=1.0)
+    governor._user_buckets("u1")[1].rate = 0
+    full = governor.tokens.level
+
+    with pytest.raises(ProviderError):
+        llm_client.chat_completion(MESSAGES, MODEL, "u1")
+
+    assert governor.tokens.level == full
+    assert user_tokens(governor, "u1") == governor._user_buckets("u1")[1].capacity
+
+
+def test_completion_rejected_by_an_open_circuit_refunds_its_reservation(monkeypatch, governor, breaker):
+    use_provider(monkeypatch)
+    full = governor.tokens.level
+    # Opens between the governor's lease and the attempt, as when another call trips it meanwhile
+    monkeypatch.setattr(breaker, "check", lambda: None)
+    breaker.state, breaker.opened_at = "open", time.monotonic()
+
+    with pytest.raises(ProviderUnavailable):
+        llm_client.chat_completion(MESSAGES, MODEL)
+
+    assert governor.tokens.level == full
+
+
+async def take(stream, n: int) -> list[str]:
+    pieces = []
+    async for piece in stream:
+        pieces.append(piece)
+        if len(pieces) == n:
+            break
+    return pieces
+
+
+def test_stream_settles_the_reply_it_produced(monkeypatch, governor, breaker):
+    use_provider(monkeypatch)
+    full = governor.tokens.level
+
+    async def run():
+        return [piece async for piece in llm_client.stream_chat_completion(MESSAGES, MODEL)]
+
+    pieces = asyncio.run(run())
+
+    assert len(pieces) == 20
+    assert governor.tokens.level == full - message_tokens(MESSAGES, MODEL) - count_tokens("".join(pieces), MODEL)
+
+
+def test_stream_closed_by_its_reader_settles_what_was_produced(monkeypatch, governor, breaker):
+    use_provider(monkeypatch)
+    full = governor.tokens.level
+
+    async def run():
+        stream = llm_client.stream_chat_completion(MESSAGES, MODEL)
+        pieces = await take(stream, 3)
+        await stream.aclose()  # GeneratorExit, not CancelledError
+        return pieces
+
+    pieces = asyncio.run(run())
+
+    assert governor.tokens.level == full - message_tokens(MESSAGES, MODEL) - count_tokens("".join(pieces), MODEL)
+    assert breaker.state == "closed"
+
+
+def test_stream_cancelled_mid_reply_settles_what_was_produced(monkeypatch, governor, breaker):
+    use_provider(monkeypatch, tokens_per_sec=100)
+    full = governor.tokens.level
+    pieces = []
+
+    async def run():
+        async def consume():
+            async for piece in llm_client.stream_chat_completion(MESSAGES, MODEL):
+                pieces.append(piece)
+        task = asyncio.create_task(consume())
+        while len(pieces) < 3:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert 3 <= len(pieces) < 20
+    assert governor.tokens.level == full - message_tokens(MESSAGES, MODEL) - count_tokens("".join(pieces), MODEL)
+
+
+def test_stream_that_fails_after_its_retries_refunds_its_reservation(monkeypatch, governor, breaker):
+    use_provider(monkeypatch, error_rate=1.0)
+    full = governor.tokens.level
+
+    async def run():
+        return [piece async for piece in llm_client.stream_chat_completion(MESSAGES, MODEL)]
+
+    with pytest.raises(ProviderError):
+        asyncio.run(run())
+
+    assert governor.tokens.level == full
@@ -0,0 +1,216 @@
+import asyncio
+import time
+
+import pytest
+
+from services import resilience
+from services.providers import FakeProvider, ProviderError
+from services.resilience import CircuitBreaker, ProviderUnavailable, call_provider
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(resilience, "CIRCUIT_WINDOW", 20)
+    monkeypatch.setattr(resilience, "CIRCUIT_MIN_CALLS", 10)
+    monkeypatch.setattr(resilience, "CIRCUIT_FAILURE_RATIO", 0.5)
+    breaker = CircuitBreaker(cooldown=30)
+    monkeypatch.setattr(resilience, "provider_breaker", breaker)
+    return breaker
+
+
+def fail(breaker: CircuitBreaker, n: int = 1) -> None:
+    for _ in range(n):
+        with pytest.raises(ProviderError):
+            with breaker.call():
+                raise ProviderError("down")
+
+
+def succeed(breaker: CircuitBreaker, n: int = 1) -> None:
+    for _ in range(n):
+        with breaker.call():
+            pass
+
+
+def cool_down(breaker: CircuitBreaker) -> None:
+    breaker.opened_at -= breaker.cooldown
+
+
+def test_stays_closed_below_the_minimum_number_of_calls(breaker):
+    fail(breaker, 9)
+
+    assert breaker.state == "closed"
+
+
+def test_opens_at_the_failure_ratio(breaker):
+    succeed(breaker, 6)
+    fail(breaker, 5)
+    assert breaker.state == "closed"  # 5 of 11 failed
+
+    fail(breaker)  # 6 of 12
+
+    assert breaker.state == "open"
+    assert breaker.opens == 1
+    with pytest.raises(ProviderUnavailable) as rejected:
+        breaker.check()
+    assert 1 <= rejected.value.retry_after <= 30
+
+
+def test_judges_only_the_recent_window(breaker):
+    fail(breaker, 9)
+    succeed(breaker, 20)  # the failures slide out of the window
+
+    fail(breaker, 9)
+
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_rejects_calls_until_the_cooldown_passes(breaker):
+    fail(breaker, 10)
+
+    with pytest.raises(ProviderUnavailable):
+        with breaker.call():
+            pytest.fail("called through an open circuit")
+    assert breaker.rejected == 1
+
+
+def test_half_open_lets_one_probe_through(breaker):
+    fail(breaker, 10)
+    cool_down(breaker)
+
+    probe = breaker.call()
+    probe.__enter__()
+    assert breaker.state == "half_open"
+    with pytest.raises(ProviderUnavailable):
+        breaker.before_call()  # a second caller while the probe is out
+
+    probe.__exit__(None, None, None)
+    assert breaker.state == "closed"
+    assert list(breaker.recent) == [False]
+
+
+def test_failed_probe_reopens_the_circuit(breaker):
+    fail(breaker, 10)
+    cool_down(breaker)
+
+    fail(breaker)
+
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+    with pytest.raises(ProviderUnavailable):
+        breaker.check()
+
+
+@pytest.mark.parametrize("interruption", [asyncio.CancelledError, GeneratorExit, KeyboardInterrupt])
+def test_interrupted_probe_hands_the_slot_to_the_next_caller(breaker, interruption):
+    fail(breaker, 10)
+    cool_down(breaker)
+
+    with pytest.raises(interruption):
+        with breaker.call():
+            raise interruption()
+
+    assert breaker.state == "open"
+    assert breaker.opens == 1  # says nothing about the provider, so no new cooldown
+    succeed(breaker)
+    assert breaker.state == "closed"
+
+
+def test_non_provider_exception_counts_as_success(breaker):
+    fail(breaker, 5)
+
+    for _ in range(6):
+        with pytest.raises(ValueError):
+            with breaker.call():
+                raise ValueError("bad request")  # the provider answered
+
+    assert breaker.state == "closed"  # 5 of 11 failed; counted as failures, 11 of 11 would have opened it
+    assert list(breaker.recent).count(False) == 6
+
+
+def test_non_provider_exception_closes_a_half_open_circuit(breaker):
+    fail(breaker, 10)
+    cool_down(breaker)
+
+    with pytest.raises(ValueError):
+        with breaker.call():
+            raise ValueError("bad request")
+
+    assert breaker.state == "closed"
+
+
+def test_retries_provider_failures_up_to_the_limit(breaker, monkeypatch):
+    monkeypatch.setattr(resilience, "retry_delay", lambda attempt: 0.0)
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise TimeoutError()
+        return "ok"
+
+    assert call_provider(flaky, 10, retries=2) == "ok"
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(TimeoutError):
+        call_provider(flaky, 10, retries=1)
+    assert len(attempts) == 2
+
+
+def test_retries_stop_at_the_deadline(breaker, monkeypatch):
+    monkeypatch.setattr(resilience, "retry_delay", lambda attempt: 0.2)
+    timeouts = []
+
+    def down(timeout):
+        timeouts.append(timeout)
+        raise TimeoutError()
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        call_provider(down, 0.5, retries=10)
+    elapsed = time.monotonic() - start
+
+    # Attempts at about 0, 0.2 and 0.4s; a retry due at 0.6s would land past the deadline
+    assert len(timeouts) == 3
+    assert elapsed < 0.5
+    assert timeouts == sorted(timeouts, reverse=True)  # each attempt gets only the time left
+    assert timeouts[0] <= 0.5
+
+
+def test_does_not_retry_other_exceptions(breaker):
+    attempts = []
+
+    def rejected(timeout):
+        attempts.append(timeout)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call_provider(rejected, 10, retries=5)
+    assert len(attempts) == 1
+
+
+def test_open_circuit_fails_fast_without_calling(breaker):
+    fail(breaker, 10)
+
+    with pytest.raises(ProviderUnavailable):
+        call_provider(lambda timeout: pytest.fail("called through an open circuit"), 10)
+
+
+def test_fake_provider_brownout_opens_the_circuit(breaker, monkeypatch):
+    # Every call to a provider that always fails is retried, then counted against the circuit
+    monkeypatch.setattr(resilience, "retry_delay", lambda attempt: 0.0)
+    provider = FakeProvider(ttft_ms=0, tokens_per_sec=0, error_rate=1.0, jitter_ms=0)
+    messages = [{"role": "user", "content": "hi"}]
+
+    def complete(timeout):
+        return provider.complete(messages, "gpt-4-turbo", timeout)
+
+    for _ in range(3):
+        with pytest.raises(ProviderError):
+            call_provider(complete, 10, retries=2)
+    assert breaker.state == "closed"  # 9 failed attempts, below the minimum
+
+    # The tenth failure opens the circuit, and the retry after it fails fast
+    with pytest.raises(ProviderUnavailable):
+        call_provider(complete, 10, retries=2)
+    assert breaker.state == "open"
@@ -0,0 +1,75 @@
+import uuid
+
+import pytest
+
+from config import RETRIEVAL_FULL_TEXT_MAX_BYTES
+from models.file import FileChunk, ProjectFile
+from services import file_store
+from services.file_store import store_file_text
+from services.providers import FakeProvider, ProviderError
+from services.retrieval import build_file_context
+
+
+def add_file(db, project, filename: str, data: bytes | None) -> ProjectFile:
+    # data=None makes a legacy file: uploaded before text was stored locally
+    f = ProjectFile(
+        project_id=project.id,
+        filename=filename,
+        file_id=f"file-{uuid.uuid4().hex}",
+        content_hash=store_file_text(db, data) if data is not None else None,
+    )
+    db.add(f)
+    db.commit()
+    return f
+
+
+@pytest.fixture
+def large_project(db, project):
+    # Over the full-text limit, so context comes from the retrieval index
+    text = " ".join(f"filler{i}" for i in range(RETRIEVAL_FULL_TEXT_MAX_BYTES // 8)) + " apple orchard"
+    add_file(db, project, "large.txt", text.encode())
+    return project
+
+
+def test_retrieves_matching_chunks(db, large_project):
+    context = build_file_context(db, large_project.id, "apple")
+
+    assert context
+    assert all(name == "large.txt" for name, _ in context)
+    assert "apple orchard" in context[0][1]
+
+
+def test_legacy_file_that_could_not_be_fetched_is_retried(db, large_project, monkeypatch):
+    legacy = add_file(db, large_project, "legacy.txt", None)
+
+    def provider_down(fn, deadline):
+        raise ProviderError("provider down")
+
+    monkeypatch.setattr(file_store, "call_provider", provider_down)
+    context = build_file_context(db, large_project.id, "zebra")
+
+    db.refresh(legacy)
+    assert legacy.chunk_count is None
+    assert db.query(FileChunk).filter(FileChunk.project_file_id == legacy.id).count() == 0
+    assert all(name != "legacy.txt" for name, _ in context)
+
+    # The provider is back: the next request fetches, stores and indexes the text
+    provider = FakeProvider(ttft_ms=0, jitter_ms=0)
+    provider.files[legacy.file_id] = b"zebra crossing notes"
+    monkeypatch.undo()
+    monkeypatch.setattr(file_store, "llm_provider", provider)
+    context = build_file_context(db, large_project.id, "zebra")
+
+    db.refresh(legacy)
+    assert legacy.content_hash is not None
+    assert legacy.chunk_count == 1
+    assert ("legacy.txt", "zebra crossing notes") in context
+
+
+def test_empty_stored_file_is_indexed_once(db, large_project):
+    empty = add_file(db, large_project, "empty.txt", b"")
+
+    build_file_context(db, large_project.id, "apple")
+
+    db.refresh(empty)
+    assert empty.chunk_count == 1
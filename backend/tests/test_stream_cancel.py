@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+import uvicorn
+
+import llm_client
+from config import LLM_MODEL
+from services import chat_stream, inflight
+from services.context import count_tokens
+from services.governor import Governor
+from services.providers import FakeProvider
+
+# The app behind a real socket, so a client can hang up mid-stream the way a closed tab does
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    governor = Governor()
+    governor.tokens.rate = 0  # every token taken or refunded shows in the level
+    monkeypatch.setattr(llm_client, "llm_governor", governor)
+    monkeypatch.setattr(chat_stream, "llm_governor", governor)
+    return governor
+
+
+@pytest.fixture
+def app_url(monkeypatch):
+    # Slow enough that a reply is still generating when its client leaves
+    monkeypatch.setattr(llm_client, "llm_provider", FakeProvider(ttft_ms=0, tokens_per_sec=20, completion_tokens=60, jitter_ms=0))
+    monkeypatch.setattr(inflight, "STREAM_CANCEL_GRACE_SECONDS", 0.2)
+    monkeypatch.setattr(inflight, "_outcomes", dict.fromkeys(inflight._outcomes, 0))
+
+    import main
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(10)
+
+
+@pytest.fixture
+def client(app_url):
+    with httpx.Client(base_url=app_url, timeout=10) as client:
+        email, password = f"{uuid.uuid4().hex}@example.com", "pw"
+        client.post("/api/users/", json={"email": email, "password": password}).raise_for_status()
+        response = client.post("/api/login/", json={"email": email, "password": password})
+        response.raise_for_status()
+        # The cookie is Secure; send it by hand over plain http
+        client.headers["Cookie"] = f"access_token={response.cookies['access_token']}"
+        yield client
+
+
+def new_project(client: httpx.Client) -> str:
+    response = client.post("/api/projects/", json={"name": f"p-{uuid.uuid4().hex}"})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def read_events(response: httpx.Response, limit: int | None = None) -> tuple[str | None, list[str], dict | None]:
+    # (last event id, deltas, end event) after `limit` deltas, or the whole stream
+    event_id, deltas, event = None, [], None
+    for line in response.iter_lines():
+        if line.startswith("id: "):
+            event_id = line[len("id: "):]
+        elif line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+            if event == "end":
+                return event_id, deltas, data
+            deltas.append(data["delta"])
+            if limit is not None and len(deltas) >= limit:
+                return event_id, deltas, None
+    return event_id, deltas, None
+
+
+def wait_for_run(client: httpx.Client, run_id: str, statuses: set[str]) -> dict:
+    deadline = time.monotonic() + 10
+    while True:
+        run = client.get(f"/api/runs/{run_id}").json()
+        if run["status"] in statuses or time.monotonic() > deadline:
+            return run
+        time.sleep(0.05)
+
+
+def test_client_disconnect_cancels_generation_and_settles_the_lease(client, governor):
+    project_id = new_project(client)
+    full = governor.tokens.level
+
+    with client.stream("GET", f"/api/projects/{project_id}/messages/stream", params={"content": "tell me a story"}) as response:
+        event_id, deltas, _ = read_events(response, limit=2)
+    run_id = event_id.split(":")[0]
+
+    run = wait_for_run(client, run_id, {"cancelled", "completed", "failed"})
+    assert run["status"] == "cancelled"
+    assert run["output_data"].startswith("".join(deltas))
+    produced = count_tokens(run["output_data"], LLM_MODEL)
+    assert produced < 60
+
+    # Billed the prompt and what was generated, not the max-output reservation
+    assert governor.tokens.level == full - run["prompt_tokens"] - produced
+
+    stats = client.get("/api/metrics").json()["inflight"]
+    assert stats["cancelled_streams"] == 1
+    assert stats["tokens_saved"] > 0  # counted even before any stream has completed
+
+
+def test_reconnect_with_last_event_id_resumes_the_same_generation(client, governor):
+    project_id = new_project(client)
+    url = f"/api/projects/{project_id}/messages/stream"
+
+    with client.stream("GET", url, params={"content": "tell me a story"}) as response:
+        event_id, first, _ = read_events(response, limit=2)
+    with client.stream("GET", url, params={"content": "tell me a story"}, headers={"Last-Event-ID": event_id}) as response:
+        _, rest, end = read_events(response)
+
+    run_id = event_id.split(":")[0]
+    assert end == {"run_id": run_id}
+    run = wait_for_run(client, run_id, {"completed"})
+    assert run["status"] == "completed"
+    assert "".join(first + rest) == run["output_data"]
+    assert governor.admitted == 1  # the reconnect made no upstream call
+
+    stats = client.get("/api/metrics").json()["inflight"]
+    assert stats["cancelled_streams"] == 0
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from config import STREAM_RESUME_GRACE_SECONDS
+from routes.prompts import sse_events
+from services.inflight import join_stream
+from services.stream_resume import RedisStreamBuffer, StreamCancelled, StreamTrimmed
+
+# Runs against a real Redis; set TEST_REDIS_URL to point it somewhere else. The database is shared
+# with nothing but these tests' own stream:<run_id> keys.
+REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
+@pytest.fixture(scope="module")
+def redis_url() -> str:
+    redis = pytest.importorskip("redis")
+    try:
+        redis.from_url(REDIS_URL).ping()
+    except redis.ConnectionError:
+        pytest.skip(f"no Redis at {REDIS_URL}")
+    return REDIS_URL
+
+
+async def pieces(*deltas: str, hang: bool = False):
+    for piece in deltas:
+        yield piece
+        await asyncio.sleep(0)
+    if hang:
+        await asyncio.Event().wait()
+
+
+async def mirrored(url: str, source) -> tuple[RedisStreamBuffer, uuid.UUID]:
+    # Runs source through a worker's buffer and waits until it is all in Redis
+    producer = RedisStreamBuffer(url)
+    run_id = uuid.uuid4()
+    fanout, _ = join_stream(None, lambda: source)
+    producer.register(run_id, fanout)
+    await asyncio.wait((fanout.task,), timeout=0.1)
+    if not fanout.done:
+        fanout.cancel()  # a source that hangs is a run the client cancelled
+    await asyncio.gather(*producer.mirrors)
+    return producer, run_id
+
+
+async def collect(deltas) -> list[str]:
+    return [piece async for piece in deltas]
+
+
+def test_another_worker_replays_a_finished_run(redis_url):
+    async def scenario():
+        producer, run_id = await mirrored(redis_url, pieces("a", "b", "c", "d"))
+        other = RedisStreamBuffer(redis_url)
+        try:
+            assert await collect(await other.replay(run_id, 0)) == ["a", "b", "c", "d"]
+            assert await collect(await other.replay(run_id, 2)) == ["c", "d"]
+            assert 0 < await other.redis.ttl(f"stream:{run_id}") <= STREAM_RESUME_GRACE_SECONDS
+        finally:
+            await other.redis.delete(f"stream:{run_id}")
+            await other.redis.aclose()
+            await producer.redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_replay_of_a_cancelled_run_ends_cancelled(redis_url):
+    async def scenario():
+        producer, run_id = await mirrored(redis_url, pieces("a", "b", hang=True))
+        other = RedisStreamBuffer(redis_url)
+        try:
+            replayed = []
+            with pytest.raises(StreamCancelled):
+                async for piece in await other.replay(run_id, 0):
+                    replayed.append(piece)
+            assert replayed == ["a", "b"]
+        finally:
+            await other.redis.delete(f"stream:{run_id}")
+            await other.redis.aclose()
+            await producer.redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_replay_past_trimmed_deltas_is_a_resync(redis_url):
+    async def scenario():
+        producer, run_id = await mirrored(redis_url, pieces("a", "b", "c", "d", "e"))
+        other = RedisStreamBuffer(redis_url)
+        key = f"stream:{run_id}"
+        try:
+            await other.redis.xtrim(key, maxlen=3, approximate=False)  # keeps d, e and the end marker
+
+            # A client that has only "a" would otherwise silently skip "b" and "c"
+            with pytest.raises(StreamTrimmed):
+                await collect(await other.replay(run_id, 1))
+            # One that already has everything the buffer dropped is unaffected
+            assert await collect(await other.replay(run_id, 3)) == ["d", "e"]
+        finally:
+            await other.redis.delete(key)
+            await other.redis.aclose()
+            await producer.redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_expired_buffer_has_nothing_to_replay(redis_url):
+    async def scenario():
+        buffer = RedisStreamBuffer(redis_url)
+        try:
+            assert await buffer.replay(uuid.uuid4(), 0) is None
+        finally:
+            await buffer.redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_trimmed_replay_tells_the_client_to_resync():
+    async def trimmed():
+        yield "d"
+        raise StreamTrimmed()
+
+    run_id = uuid.uuid4()
+    frames = asyncio.run(collect(sse_events(run_id, trimmed(), after=3)))
+
+    assert frames[-1] == f'event: end\ndata: {{"run_id": "{run_id}", "resync": true}}\n\n'.encode()
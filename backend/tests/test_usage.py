@@ -0,0 +1,37 @@
+import uuid
+
+from models.analytics import ProjectUsage, UsageBucket
+from models.prompt import Prompt, PromptRun
+from services.runs import finish_run
+
+# Set DATABASE_URL to a Postgres database to check the column types there; SQLite integers are 64-bit
+BIG_RUN_TOKENS = 2_000_000_000  # fits a run's int4 counter; two of them do not
+
+
+def finish_big_run(db, project, model: str = "m") -> PromptRun:
+    prompt = Prompt(id=uuid.uuid4(), project_id=project.id, name="p", content="c")
+    db.add(prompt)
+    db.flush()
+    run = PromptRun(id=uuid.uuid4(), prompt_id=prompt.id, project_id=project.id, user_id=project.owner_id, model=model, status="running")
+    db.add(run)
+    db.flush()
+    finish_run(db, run, "completed", output="o", tokens=BIG_RUN_TOKENS, cost=0.0)
+    db.commit()
+    return run
+
+
+def test_project_usage_counts_tokens_past_int4(db, project):
+    for model in ("m1", "m2"):  # separate usage buckets
+        finish_big_run(db, project, model)
+
+    usage = db.get(ProjectUsage, project.id)
+    db.refresh(usage)
+    assert usage.total_tokens == 2 * BIG_RUN_TOKENS
+
+
+def test_usage_bucket_counts_tokens_past_int4(db, project):
+    for _ in range(2):
+        finish_big_run(db, project)
+
+    tokens = db.query(UsageBucket.tokens).filter(UsageBucket.project_id == project.id, UsageBucket.granularity == "day").all()
+    assert sum(t for t, in tokens) == 2 * BIG_RUN_TOKENS
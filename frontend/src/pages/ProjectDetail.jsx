@@ -4,6 +4,17 @@ import { marked } from "marked";
 import DOMPurify from "dompurify";
 import api from "../api/client.js";
 
+// Delta sync sends whole runs again when they change; replace by (id, role), append the rest
+const mergeMessages = (current, changed) => {
+  const merged = [...current];
+  for (const m of changed) {
+    const i = merged.findIndex((x) => x.id === m.id && x.role === m.role);
+    if (i >= 0) merged[i] = m;
+    else merged.push(m);
+  }
+  return merged;
+};
+
 export default function ProjectDetail({ onLogout }) {
   const { projectId: paramProjectId } = useParams();
   const navigate = useNavigate();
@@ -11,6 +22,7 @@ export default function ProjectDetail({ onLogout }) {
   const [projects, setProjects] = useState([]);
   const [project, setProject] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
   const [input, setInput] = useState("");
   const [error, setError] = useState("");
   const [isTyping, setIsTyping] = useState(false);
@@ -21,6 +33,8 @@ export default function ProjectDetail({ onLogout }) {
 
   const messagesEndRef = useRef(null);
   const eventSourceRef = useRef(null);
+  const syncCursorRef = useRef(null);
+  const syncMessagesRef = useRef(null);
 
   const scrollToBottom = () =>
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -66,16 +80,59 @@ export default function ProjectDetail({ onLogout }) {
     if (!projectId) return;
     const fetchMessages = async () => {
       try {
+        // Take the sync cursor first so nothing written during the fetch is missed
+        const sync = await api.get(`/projects/${projectId}/messages/since`);
+        syncCursorRef.current = (sync.data || sync).cursor;
         const data = await api.get(`/projects/${projectId}/messages`);
         setMessages(data.data || data);
+        setOlderCursor(data.headers?.["x-next-cursor"] || null);
       } catch (err) {
         console.error(err);
         setMessages([]);
+        setOlderCursor(null);
       }
     };
     fetchMessages();
+
+    // Returning to the tab only pulls runs changed since the last sync (a 304 when nothing did)
+    const syncMessages = async () => {
+      if (document.visibilityState !== "visible" || !syncCursorRef.current) return;
+      try {
+        const res = await api.get(`/projects/${projectId}/messages/since`, {
+          params: { cursor: syncCursorRef.current },
+        });
+        const delta = res.data || res;
+        if (delta.reset) {
+          fetchMessages();
+          return;
+        }
+        syncCursorRef.current = delta.cursor;
+        if (delta.messages.length) {
+          setMessages((prev) => mergeMessages(prev, delta.messages));
+        }
+      } catch (err) {
+        console.error(err);
+      }
+    };
+    syncMessagesRef.current = syncMessages;
+    document.addEventListener("visibilitychange", syncMessages);
+    return () => document.removeEventListener("visibilitychange", syncMessages);
   }, [projectId]);
 
+  // History is paginated newest-first; older pages are prepended on demand
+  const loadOlderMessages = async () => {
+    if (!projectId || !olderCursor) return;
+    try {
+      const data = await api.get(`/projects/${projectId}/messages`, {
+        params: { before: olderCursor },
+      });
+      setMessages((prev) => [...(data.data || data), ...prev]);
+      setOlderCursor(data.headers?.["x-next-cursor"] || null);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
   const createNewProject = async () => {
     if (creating) return;
     setCreating(true);
@@ -185,21 +242,37 @@ export default function ProjectDetail({ onLogout }) {
       }
     };
 
+    // A dropped connection is retried by the browser with Last-Event-ID and the server replays
+    // what was missed; only give up once the EventSource has closed for good
     evtSource.onerror = () => {
-      try {
-        evtSource.close();
-      } catch {}
+      if (evtSource.readyState !== EventSource.CLOSED) return;
       setIsTyping(false);
       eventSourceRef.current = null;
     };
 
-    evtSource.addEventListener("end", async () => {
+    evtSource.addEventListener("end", async (e) => {
       try {
         evtSource.close();
       } catch {}
       setIsTyping(false);
       eventSourceRef.current = null;
 
+      // Re-key the turn with its run id so delta syncs replace it instead of appending a copy
+      try {
+        const { run_id: runId, resync } = JSON.parse(e.data || "{}");
+        if (runId) {
+          setMessages((prev) =>
+            prev.map((m) =>
+              m.id === userMessage.id || m.id === assistantMessageId
+                ? { ...m, id: runId }
+                : m
+            )
+          );
+        }
+        // The server no longer had the deltas to replay; pull the finished turn instead
+        if (resync) syncMessagesRef.current?.();
+      } catch {}
+
       if (isFirstMessage) {
         const assistantContent =
           messages.find((m) => m.id === assistantMessageId)?.content || "";
@@ -338,6 +411,9 @@ export default function ProjectDetail({ onLogout }) {
               marginBottom: "10px",
             }}
           >
+            {olderCursor && (
+              <button onClick={loadOlderMessages}>Load earlier messages</button>
+            )}
             {messages.length === 0 && !isTyping && (
               <p style={{ fontStyle: "italic", color: "#242424ff" }}>
                 What are you working on today?